@@ -0,0 +1,33 @@
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+
+from account.outbox import deliver_outbox
+
+
+class Command(BaseCommand):
+    help = "Delivers queued outbox emails in batches over one pooled mail connection"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--loop', action='store_true', help="keep polling the outbox instead of exiting once it's drained")
+        parser.add_argument('--interval', type=float, default=5.0, help="seconds to sleep between polls in --loop mode")
+
+    def handle(self, *args, batch_size, loop, interval, **options):
+        connection = get_connection()
+        try:
+            while True:
+                # no-op while the session from the previous batch is still open
+                connection.open()
+                sent, failed = deliver_outbox(batch_size=batch_size, connection=connection)
+                if sent or failed:
+                    self.stdout.write(f'sent {sent}, failed {failed}')
+                if sent + failed < batch_size:
+                    if not loop:
+                        break
+                    # the SMTP session is released while idle and reopened by the next batch
+                    connection.close()
+                    time.sleep(interval)
+        finally:
+            connection.close()
@@ -1,7 +1,12 @@
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
-from django.db import models
-from django.core.mail import send_mail
-    
+from django.db import models, transaction
+from django.db.models import Q
+from django.core.mail import EmailMessage, send_mail
+from django.conf import settings
+from django.utils import timezone
+
+from datetime import timedelta
+
 
 class AccountManager(BaseUserManager):
     def create_user(self, email, username, password):
@@ -19,9 +24,12 @@ class AccountManager(BaseUserManager):
 
         user.set_password(password)
         user.clean_fields()
-        user.save(using=self._db)
+        # no account without its welcome email, nor an email for an account that failed to save
+        with transaction.atomic(using=self._db):
+            user.save(using=self._db)
 
-        user.email_user(subject='Brainstorm Account', message=f'Your Brainstorm username: {username}')
+            # delivered by the `send_outbox` worker, so a slow SMTP server can't hold up the signup request
+            user.queue_email(subject='Brainstorm Account', message=f'Your Brainstorm username: {username}')
         return user
 
     def create_superuser(self, email, username, password):
@@ -61,3 +69,57 @@ class Account(AbstractBaseUser):
     def email_user(self, subject, message, from_email=None, **kwargs):
         """Send an email to this user."""
         send_mail(subject, message, from_email, [self.email], **kwargs)
+
+    def queue_email(self, subject, message, from_email=None):
+        """Queue an email to this user in the outbox."""
+        return OutboxEmail.objects.create(subject=subject, message=message, from_email=from_email or '', to=self.email)
+
+
+class OutboxEmailQuerySet(models.QuerySet):
+    def pending(self):
+        return self.filter(date_sent__isnull=True, attempts__lt=OutboxEmail.max_attempts())
+
+    def due(self, now=None):
+        return self.pending().filter(next_attempt__lte=now or timezone.now())
+
+
+class OutboxEmail(models.Model):
+    subject = models.CharField(max_length=255)
+    message = models.TextField()
+    # empty means settings.DEFAULT_FROM_EMAIL at delivery time
+    from_email = models.CharField(max_length=255, blank=True, default='')
+    to = models.EmailField(max_length=255)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_sent = models.DateTimeField(null=True, blank=True, default=None)
+
+    objects = OutboxEmailQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Outbox email"
+        verbose_name_plural = "Outbox emails"
+        indexes = [
+            models.Index(fields=['next_attempt'], condition=Q(date_sent__isnull=True), name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} -> {self.to}'
+
+    @staticmethod
+    def max_attempts():
+        return getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 8)
+
+    def to_message(self, connection=None):
+        return EmailMessage(self.subject, self.message, self.from_email or None, [self.to], connection=connection)
+
+    def mark_sent(self):
+        self.date_sent = timezone.now()
+        self.last_error = ''
+
+    def mark_failed(self, error):
+        """Schedules a retry with exponential backoff: 1, 2, 4 ... minutes, capped at 6 hours."""
+        self.attempts += 1
+        self.last_error = str(error)
+        self.next_attempt = timezone.now() + min(timedelta(minutes=2 ** (self.attempts - 1)), timedelta(hours=6))
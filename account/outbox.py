@@ -0,0 +1,65 @@
+from datetime import timedelta
+
+from django.core.mail import get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+# how long a claimed batch stays hidden from other workers; a worker that dies mid batch
+# leaves its emails to be picked up again once the claim runs out
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+def claim_batch(batch_size):
+    """
+    Claims a batch of due emails by pushing their next attempt past the claim timeout.
+    Rows are locked with SKIP LOCKED only until the claim commits, so several workers can
+    run side by side without sending the same email twice.
+    """
+    with transaction.atomic():
+        batch = list(
+            OutboxEmail.objects.due().select_for_update(skip_locked=True).order_by('next_attempt')[:batch_size]
+        )
+        if batch:
+            OutboxEmail.objects.filter(pk__in=[email.pk for email in batch]).update(
+                next_attempt=timezone.now() + CLAIM_TIMEOUT
+            )
+    return batch
+
+
+def deliver_outbox(batch_size=100, connection=None):
+    """
+    Sends one batch of due outbox emails over a single mail connection.
+    The batch is claimed and committed first, so no row locks are held during SMTP I/O;
+    the results are recorded once the batch is done. Returns (sent, failed).
+    """
+    batch = claim_batch(batch_size)
+    if not batch:
+        return 0, 0
+
+    connection = connection or get_connection()
+    # reuses the caller's open connection, otherwise keeps one open for the whole batch
+    opened = connection.open()
+    sent = failed = 0
+    try:
+        for email in batch:
+            try:
+                # no-op unless the session was dropped after a failed send
+                connection.open()
+                connection.send_messages([email.to_message(connection)])
+            except Exception as error:
+                email.mark_failed(error)
+                failed += 1
+                # the session may be broken halfway through a command: start the next send on a fresh one
+                connection.close()
+            else:
+                email.mark_sent()
+                sent += 1
+    finally:
+        if opened:
+            connection.close()
+        # recorded even if the batch was cut short: the emails not reached go back with their old next attempt
+        with transaction.atomic():
+            OutboxEmail.objects.bulk_update(batch, ['date_sent', 'attempts', 'next_attempt', 'last_error'])
+    return sent, failed
@@ -1,10 +1,17 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.db.utils import IntegrityError
 from django.core.exceptions import ValidationError
-from django.core.mail import send_mail
+from django.core.mail import send_mail, get_connection
+from django.core import mail
+from django.core.management import call_command
+from django.utils import timezone
+
+from .models import OutboxEmail
+from .outbox import deliver_outbox
 
 from datetime import datetime
+from io import StringIO
 
 
 class TestAccountModel(TestCase):
@@ -83,3 +90,116 @@ class TestEmail(TestCase):
             fail_silently=False,
         )
         self.assertEqual(flag, 1)
+
+
+class FailingEmailBackend:
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def send_messages(self, messages):
+        raise ConnectionError('smtp server unavailable')
+
+
+class UnqueueableAccount(get_user_model()):
+    class Meta:
+        proxy = True
+
+    def queue_email(self, subject, message, from_email=None):
+        raise ConnectionError('outbox unavailable')
+
+
+class FlakyEmailBackend(FailingEmailBackend):
+    """Drops the session on the first send; later sends only go through on a fresh one."""
+    def __init__(self):
+        self.opens = 0
+        self.broken = False
+        self.due_while_sending = []
+
+    def open(self):
+        if self.broken:
+            self.broken = False
+            self.opens += 1
+
+    def close(self):
+        pass
+
+    def send_messages(self, messages):
+        self.due_while_sending.append(OutboxEmail.objects.due().count())
+        if self.broken:
+            raise ConnectionError('session broken')
+        if len(self.due_while_sending) == 1:
+            self.broken = True
+            raise ConnectionError('connection reset')
+        return len(messages)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class TestOutbox(TestCase):
+    def setUp(self):
+        self.email = 'test@TeSt.com'
+        self.password = 'password123'
+        self.username = 'testname'
+        self.account = get_user_model()
+
+    def test_signup_queues_email(self):
+        self.account.objects.create_user(email=self.email, username=self.username, password=self.password)
+        self.assertEqual(len(mail.outbox), 0)
+        queued = OutboxEmail.objects.get()
+        self.assertEqual(queued.to, self.email.lower())
+        self.assertIsNone(queued.date_sent)
+
+    def test_deliver_outbox(self):
+        self.account.objects.create_user(email=self.email, username=self.username, password=self.password)
+        self.assertEqual(deliver_outbox(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.email.lower()])
+        self.assertIsNotNone(OutboxEmail.objects.get().date_sent)
+        # nothing left to send
+        self.assertEqual(deliver_outbox(), (0, 0))
+
+    def test_deliver_outbox_batches(self):
+        for i in range(5):
+            OutboxEmail.objects.create(subject='Subject', message='Message', to=f'user{i}@test.com')
+        call_command('send_outbox', batch_size=2, stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertFalse(OutboxEmail.objects.pending().exists())
+
+    def test_deliver_outbox_retry_backoff(self):
+        queued = OutboxEmail.objects.create(subject='Subject', message='Message', to='user@test.com')
+        self.assertEqual(deliver_outbox(connection=FailingEmailBackend()), (0, 1))
+
+        queued.refresh_from_db()
+        self.assertEqual(queued.attempts, 1)
+        self.assertIn('smtp server unavailable', queued.last_error)
+        self.assertGreater(queued.next_attempt, timezone.now())
+        # backing off: not due yet
+        self.assertEqual(deliver_outbox(), (0, 0))
+
+        OutboxEmail.objects.update(next_attempt=timezone.now())
+        self.assertEqual(deliver_outbox(connection=get_connection()), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+    @override_settings(OUTBOX_MAX_ATTEMPTS=1)
+    def test_deliver_outbox_gives_up(self):
+        OutboxEmail.objects.create(subject='Subject', message='Message', to='user@test.com')
+        deliver_outbox(connection=FailingEmailBackend())
+        OutboxEmail.objects.update(next_attempt=timezone.now())
+        self.assertFalse(OutboxEmail.objects.due().exists())
+
+    def test_deliver_outbox_reconnects_after_failure(self):
+        for i in range(3):
+            OutboxEmail.objects.create(subject='Subject', message='Message', to=f'user{i}@test.com')
+        connection = FlakyEmailBackend()
+        self.assertEqual(deliver_outbox(connection=connection), (2, 1))
+        self.assertEqual(connection.opens, 1)
+        # the batch was claimed before anything was sent
+        self.assertEqual(connection.due_while_sending, [0, 0, 0])
+        self.assertEqual(OutboxEmail.objects.filter(date_sent__isnull=False).count(), 2)
+
+    def test_signup_rolls_back_without_email(self):
+        with self.assertRaisesMessage(ConnectionError, 'outbox unavailable'):
+            UnqueueableAccount.objects.create_user(email=self.email, username=self.username, password=self.password)
+        self.assertFalse(self.account.objects.exists())
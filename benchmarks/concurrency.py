@@ -0,0 +1,184 @@
+"""
+Requests/second of the note endpoints under many concurrent connections, served over WSGI
+(gunicorn threads) and over ASGI (uvicorn workers running the async views), both started
+from gunicorn.conf.py with the same worker count. Some of the connections are slow clients
+trickling a large note patch, which pin a gunicorn thread each but no ASGI worker.
+
+The servers are separate processes, so this seeds a throwaway account in the configured
+database (not a test database) and deletes it afterwards. Needs gunicorn and uvicorn.
+
+Usage: DJANGO_SETTINGS_MODULE=brainstorm.settings.docker_dev python benchmarks/concurrency.py [--connections 500] [--slow-uploads 50]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.test import Client  # noqa: E402
+
+from core.models import Folder, Note  # noqa: E402
+
+ENCODED_NAME = 'YQ=='
+# a large encrypted note patch, uploaded a chunk per UPLOAD_INTERVAL by the slow clients
+UPLOAD_SIZE = 512 * 1024
+UPLOAD_CHUNK = 4 * 1024
+UPLOAD_INTERVAL = 0.1
+
+
+def seed():
+    account = get_user_model().objects.create_user(
+        email=f'bench-{uuid.uuid4().hex[:8]}@test.com', username='bench', password='password123',
+    )
+    account.is_active = True
+    account.save()
+    folder = Folder.objects.create(name=ENCODED_NAME, account=account)
+    note = Note.objects.create(name=ENCODED_NAME, content='\n'.join(['YWFh'] * 100), folder=folder)
+    client = Client()
+    client.force_login(account)
+    return account, note, f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+
+
+def start_server(interface, port, workers):
+    env = {**os.environ, 'WEB_INTERFACE': interface, 'BIND': f'127.0.0.1:{port}', 'WEB_CONCURRENCY': str(workers)}
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', str(ROOT / 'gunicorn.conf.py')],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    return server
+
+
+async def wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f'no server on port {port}')
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    length = 0
+    for line in head.split(b'\r\n'):
+        if line.lower().startswith(b'content-length:'):
+            length = int(line.split(b':', 1)[1])
+    await reader.readexactly(length)
+    return status
+
+
+async def reader_client(port, path, cookie, deadline, latencies, errors):
+    """Keep-alive GETs of the note, back to back, until the deadline."""
+    request = f'GET {path} HTTP/1.1\r\nHost: localhost\r\nCookie: {cookie}\r\n\r\n'.encode()
+    reader = writer = None
+    while time.monotonic() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            started = time.monotonic()
+            writer.write(request)
+            status = await asyncio.wait_for(read_response(reader), timeout=max(deadline - started, 0.1))
+            if status == 200:
+                latencies.append(time.monotonic() - started)
+            else:
+                errors.append(status)
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, asyncio.LimitOverrunError) as error:
+            errors.append(type(error).__name__)
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def slow_upload_client(port, path, cookie, deadline):
+    """One note patch, trickled until the deadline."""
+    body = json.dumps({'length': 1, 'blocks': {'0': 'Y' * UPLOAD_SIZE}}).encode()
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(
+            f'PATCH {path} HTTP/1.1\r\nHost: localhost\r\nCookie: {cookie}\r\n'
+            f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n'.encode()
+        )
+        for start in range(0, len(body), UPLOAD_CHUNK):
+            if time.monotonic() >= deadline:
+                break
+            writer.write(body[start:start + UPLOAD_CHUNK])
+            await writer.drain()
+            await asyncio.sleep(UPLOAD_INTERVAL)
+        writer.close()
+    except OSError:
+        pass
+
+
+async def load(port, note, cookie, connections, slow_uploads, duration):
+    deadline = time.monotonic() + duration
+    latencies, errors = [], []
+    clients = [
+        slow_upload_client(port, f'/api/notes/{note.pk}/blocks/', cookie, deadline) for _ in range(slow_uploads)
+    ] + [
+        reader_client(port, f'/api/notes/{note.pk}/', cookie, deadline, latencies, errors)
+        for _ in range(connections - slow_uploads)
+    ]
+    started = time.monotonic()
+    await asyncio.gather(*clients)
+    return latencies, errors, time.monotonic() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--connections', type=int, default=500)
+    parser.add_argument('--slow-uploads', type=int, default=50, help="connections trickling a note patch instead of reading")
+    parser.add_argument('--duration', type=float, default=20.0, help="seconds of load per server")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--port', type=int, default=8100)
+    options = parser.parse_args()
+
+    account, note, cookie = seed()
+    try:
+        print(
+            f'{options.connections} connections ({options.slow_uploads} slow uploads) for {options.duration:.0f} s, '
+            f'{options.workers} workers, GET /api/notes/<pk>/'
+        )
+        for offset, interface in enumerate(['wsgi', 'asgi']):
+            port = options.port + offset
+            server = start_server(interface, port, options.workers)
+            try:
+                asyncio.run(wait_for(port))
+                latencies, errors, elapsed = asyncio.run(
+                    load(port, note, cookie, options.connections, options.slow_uploads, options.duration)
+                )
+            finally:
+                server.terminate()
+                server.wait()
+            latencies.sort()
+            p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else float('nan')
+            print(
+                f'{interface}: {len(latencies) / elapsed:8.0f} req/s   '
+                f'median {statistics.median(latencies) * 1000 if latencies else float("nan"):7.1f} ms   '
+                f'p99 {p99:7.1f} ms   {len(errors)} errors'
+            )
+    finally:
+        account.delete()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Per-request latency of an API endpoint with a new database connection per request
+(CONN_MAX_AGE=0) and with persistent connections, in a throwaway test database.
+Requests go through the WSGI handler, so connections are opened and closed exactly
+as under gunicorn. Run it against Postgres: sqlite has no connection setup to speak of.
+
+Usage: DJANGO_SETTINGS_MODULE=brainstorm.settings.docker_dev python benchmarks/connections.py [--requests 2000] [--threads 4]
+"""
+import argparse
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.core.handlers.wsgi import WSGIHandler  # noqa: E402
+from django.db import connection, connections  # noqa: E402
+from django.db.backends.signals import connection_created  # noqa: E402
+from django.test import Client, RequestFactory  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+
+from core.models import Folder, Task, TodoList  # noqa: E402
+
+ENCODED_NAME = 'YQ=='
+PATH = '/api/focus/'
+
+
+def seed():
+    account = get_user_model().objects.create_user(email='bench@test.com', username='bench', password='password123')
+    account.is_active = True
+    account.save()
+    folder = Folder.objects.create(name=ENCODED_NAME, account=account)
+    todo_list = TodoList.objects.create(name=ENCODED_NAME, folder=folder)
+    Task.objects.bulk_create_validated([Task(name=ENCODED_NAME, todo_list=todo_list, priority=Task.HIGH) for _ in range(50)])
+    client = Client()
+    client.force_login(account)
+    return f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+
+
+def run(handler, cookie, count, latencies):
+    factory = RequestFactory()
+
+    def start_response(status, headers):
+        assert status.startswith('200'), status
+
+    for _ in range(count):
+        environ = factory.get(PATH, HTTP_COOKIE=cookie).environ
+        started = time.perf_counter()
+        response = handler(environ, start_response)
+        b''.join(response)
+        # request_finished: where CONN_MAX_AGE decides whether the connection gets closed
+        response.close()
+        latencies.append(time.perf_counter() - started)
+    # persistent connections outlive the requests, not the benchmark's threads
+    connections.close_all()
+
+
+def measure(handler, cookie, conn_max_age, requests, threads, report=True):
+    for alias in connections:
+        connections[alias].close()
+        connections.settings[alias]['CONN_MAX_AGE'] = conn_max_age
+    opened = []
+    counter = lambda sender, connection, **kwargs: opened.append(connection)  # noqa: E731
+    connection_created.connect(counter)
+
+    latencies = []
+    workers = [
+        threading.Thread(target=run, args=(handler, cookie, requests // threads, latencies))
+        for _ in range(threads)
+    ]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    connection_created.disconnect(counter)
+
+    latencies.sort()
+    if not report:
+        return
+    print(
+        f'CONN_MAX_AGE={conn_max_age:<4} {len(latencies) / elapsed:8.0f} req/s   '
+        f'mean {statistics.mean(latencies) * 1000:6.2f} ms   '
+        f'p50 {latencies[len(latencies) // 2] * 1000:6.2f} ms   '
+        f'p95 {latencies[int(len(latencies) * 0.95)] * 1000:6.2f} ms   '
+        f'{len(opened)} connections opened'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=1)
+    options = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        cookie = seed()
+        handler = WSGIHandler()
+        print(f'{options.requests} GET {PATH} over {options.threads} threads, {connection.vendor}')
+        # a warm-up round, so neither mode pays for the first imports
+        measure(handler, cookie, 0, min(options.requests, 100), options.threads, report=False)
+        for conn_max_age in [0, 600]:
+            measure(handler, cookie, conn_max_age, options.requests, options.threads)
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Spawns habit occurrences with the set-based scheduler and with one save() per habit
+(the factory the README describes), in a throwaway test database.
+
+Usage: DJANGO_SETTINGS_MODULE=brainstorm.settings.docker_dev python benchmarks/habits.py [--habits 100000]
+"""
+import argparse
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from core.models import Folder, Habit, Task, TodoList  # noqa: E402
+
+ENCODED_NAME = 'YQ=='
+LISTS = 100
+# the per-save factory is timed on a sample and extrapolated
+SAVE_SAMPLE = 1000
+
+
+def seed(habit_count, today):
+    account = get_user_model().objects.create_user(email='bench@test.com', username='bench', password='password123')
+    account.is_active = True
+    account.save()
+    folder = Folder.objects.create(name=ENCODED_NAME, account=account)
+    lists = TodoList.objects.bulk_create_validated([TodoList(name=ENCODED_NAME, folder=folder) for _ in range(LISTS)])
+    tasks = Task.objects.bulk_create_validated(
+        [Task(name=ENCODED_NAME, todo_list=lists[n % LISTS]) for n in range(habit_count)], batch_size=5000,
+    )
+    Habit.objects.bulk_create(
+        [Habit(period=Habit.DAILY, task=task, next_due=today) for task in tasks], batch_size=5000,
+    )
+
+
+def spawn_with_saves(today, limit):
+    """One full_clean() + save() per clone and per habit; returns the habits' previous tasks by habit."""
+    habits = Habit.objects.due(today).select_related('task').order_by('pk')[:limit]
+    previous = {}
+    for habit in habits:
+        previous[habit.pk] = habit.task_id
+        clone = habit.clone_task(today)
+        clone.save()
+        habit.task = clone
+        habit.next_due = today + timedelta(days=1)
+        habit.save()
+    return previous
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--habits', type=int, default=100_000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    options = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        today = timezone.localdate()
+        seed(options.habits, today)
+
+        sample = min(SAVE_SAMPLE, options.habits)
+        started = time.perf_counter()
+        previous = spawn_with_saves(today, sample)
+        per_save = (time.perf_counter() - started) / sample
+        # back to the seeded tasks before the clones go: deleting them would empty Habit.task
+        Habit.objects.bulk_update([Habit(pk=pk, task_id=task_id) for pk, task_id in previous.items()], ['task'])
+        Habit.objects.update(next_due=today)
+        Task.objects.filter(habit_period=today).delete()
+
+        started = time.perf_counter()
+        handled = 0
+        while count := Habit.objects.spawn_due(today, batch_size=options.batch_size):
+            handled += count
+        set_based = time.perf_counter() - started
+
+        print(f'{options.habits} daily habits, {connection.vendor}')
+        print(f'save() per habit: {per_save * options.habits:8.1f} s (extrapolated from {sample})')
+        print(f'set-based:        {set_based:8.1f} s ({handled} habits, batches of {options.batch_size})')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Compares the in-place base64 check used by `validate_encoded_field` with the
+previous decode-and-discard implementation.
+
+Usage: python benchmarks/validators.py
+"""
+import base64
+import os
+import sys
+import timeit
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from django.conf import settings  # noqa: E402
+
+settings.configure(ENCRYPTED_FIELD_ENVELOPE='base64')
+
+from core.validators import validate_encoded_field  # noqa: E402
+
+SIZES = [1024, 64 * 1024, 1024 ** 2, 10 * 1024 ** 2, 50 * 1024 ** 2]
+
+
+def validate_by_decoding(value):
+    base64.b64decode(value)
+
+
+def measure(validator, value):
+    repeat = max(1, 50 * 1024 ** 2 // len(value) // 10)
+    seconds = min(timeit.repeat(lambda: validator(value), number=repeat, repeat=3)) / repeat
+
+    tracemalloc.start()
+    validator(value)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def human(size):
+    for unit in ['B', 'KB', 'MB']:
+        if size < 1024:
+            return f'{size:.0f} {unit}'
+        size /= 1024
+    return f'{size:.0f} GB'
+
+
+def main():
+    print(f'{"payload":>10} | {"decode (ms)":>12} {"peak":>8} | {"in-place (ms)":>14} {"peak":>8}')
+    for size in SIZES:
+        # encrypted payload of roughly `size` encoded characters
+        value = base64.b64encode(os.urandom(size * 3 // 4)).decode()
+        old_time, old_peak = measure(validate_by_decoding, value)
+        new_time, new_peak = measure(validate_encoded_field, value)
+        print(f'{human(len(value)):>10} | {old_time * 1000:>12.3f} {human(old_peak):>8} | {new_time * 1000:>14.3f} {human(new_peak):>8}')
+
+
+if __name__ == '__main__':
+    main()
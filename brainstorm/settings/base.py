@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -76,3 +77,35 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# client-side ciphertext format: 'base64', 'base85' or 'binary' (base64 on the wire, raw bytes in the database)
+# run `manage.py convert_encrypted_storage` after switching to or from 'binary', with
+# `--from-envelope <previous>` when the switch changes the text format (base64 <-> base85)
+ENCRYPTED_FIELD_ENVELOPE = 'base64'
+
+# the workspace read cache invalidates by version tokens stored in the cache itself, so every
+# process must share one backend: locmem only suits a single process, use 'file' or 'redis'
+# (needs the `redis` package) behind several workers
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'brainstorm'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / '.cache')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://localhost:6379'),
+}
+_cache_backend, _cache_location = CACHE_BACKENDS[os.environ.get('CACHE_BACKEND', 'locmem')]
+CACHES = {
+    'default': {
+        'BACKEND': _cache_backend,
+        'LOCATION': os.environ.get('CACHE_LOCATION', _cache_location),
+    }
+}
+WORKSPACE_CACHE = 'default'
+WORKSPACE_CACHE_TIMEOUT = 24 * 60 * 60
+
+# real-time change feed: the in-process broker only reaches tabs connected to the worker that
+# served the write, plug a shared one in here behind several workers
+CHANGE_BROKER = 'core.changes.InProcessBroker'
+# seconds a subscriber waits for the rest of a burst of changes (autosaves) before pushing them
+CHANGE_FEED_COALESCE = 0.5
+# the stream is closed after this many seconds and the browser reconnects: bounds the life of
+# subscriptions whose client went away unnoticed
+CHANGE_FEED_TIMEOUT = 5 * 60
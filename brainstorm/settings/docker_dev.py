@@ -11,6 +11,8 @@ DATABASES = {
         'PASSWORD': 'postgres',
         'HOST': 'pg_db',
         'PORT': 5432,
+        # served over ASGI, where connections can't outlive their request (see prod.py)
+        'CONN_MAX_AGE': 0,
     }
 }
 
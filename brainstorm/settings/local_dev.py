@@ -14,6 +14,9 @@ DATABASES = {
         'PASSWORD': env.str('DB_PASSWORD'),
         'HOST': 'localhost',
         'PORT': 5432,
+        # reuse connections across requests (see prod.py)
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
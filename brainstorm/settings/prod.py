@@ -1,3 +1,54 @@
-from base import *
+from .base import *
+from environ import Env
+from django.core.exceptions import ImproperlyConfigured
+
+env = Env()
 
 DEBUG = False
+SECRET_KEY = env.str('SECRET_KEY')
+ALLOWED_HOSTS = env.list('ALLOWED_HOSTS')
+
+# under WSGI every web worker thread keeps its own connection open for CONN_MAX_AGE seconds
+# instead of connecting for each request, so the pool is WEB_CONCURRENCY * WEB_THREADS
+# connections wide (gunicorn.conf.py reads the same variables); DB_MAX_CONNECTIONS is what the
+# web tier may use of Postgres' max_connections, or of PgBouncer's pool when DB_HOST points at one
+WEB_INTERFACE = env.str('WEB_INTERFACE', 'wsgi')
+WEB_CONCURRENCY = env.int('WEB_CONCURRENCY', 4)
+WEB_THREADS = env.int('WEB_THREADS', 4)
+DB_MAX_CONNECTIONS = env.int('DB_MAX_CONNECTIONS', 80)
+if WEB_INTERFACE == 'wsgi' and WEB_CONCURRENCY * WEB_THREADS > DB_MAX_CONNECTIONS:
+    raise ImproperlyConfigured(
+        f'{WEB_CONCURRENCY} workers * {WEB_THREADS} threads need more than DB_MAX_CONNECTIONS={DB_MAX_CONNECTIONS} connections'
+    )
+# under ASGI the sync ORM work of each request runs in a thread of its own, a persistent
+# connection would outlive it: connect per request, through PgBouncer to keep that cheap
+DB_CONN_MAX_AGE = env.int('DB_CONN_MAX_AGE', 600 if WEB_INTERFACE == 'wsgi' else 0)
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': env.str('DB_NAME'),
+        'USER': env.str('DB_USER'),
+        'PASSWORD': env.str('DB_PASSWORD'),
+        'HOST': env.str('DB_HOST', 'localhost'),
+        'PORT': env.int('DB_PORT', 5432),
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        # a connection Postgres dropped (restart, failover, idle timeout) is replaced when the
+        # next request starts instead of failing it
+        'CONN_HEALTH_CHECKS': True,
+        # PgBouncer's transaction pooling can't keep the server-side cursors of iterator() open
+        'DISABLE_SERVER_SIDE_CURSORS': env.bool('DB_TRANSACTION_POOLING', False),
+        'OPTIONS': {
+            'connect_timeout': env.int('DB_CONNECT_TIMEOUT', 5),
+        },
+    }
+}
+
+# SMTP config
+EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+DEFAULT_FROM_EMAIL = env.str('DEFAULT_FROM_EMAIL')
+EMAIL_HOST = env.str('EMAIL_HOST')
+EMAIL_PORT = env.int('EMAIL_PORT')
+EMAIL_HOST_USER = env.str('EMAIL_HOST_USER')
+EMAIL_HOST_PASSWORD = env.str('EMAIL_HOST_PASSWORD')
+EMAIL_USE_TLS = env.bool('EMAIL_USE_TLS', True)
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from . import receivers  # noqa: F401
+        from .envelopes import get_envelope
+
+        # resolve the configured envelope once, failing fast on a misconfiguration
+        get_envelope()
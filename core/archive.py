@@ -0,0 +1,217 @@
+"""
+Account archives: an account's folders, notes, todo lists and tasks as NDJSON, one
+record per line, encrypted fields passed through as-is. A header line comes first,
+then every model in ARCHIVED order, so an importer never meets a reference to a row
+it hasn't read yet (except Task.parent_task, which it fixes up in a second pass).
+"""
+import json
+from contextlib import contextmanager
+from datetime import date
+
+from django.db import connections, transaction
+from django.db.models.functions import Length
+from django.utils import timezone
+
+from .models import Folder, MetricsDirtyDay, Note, NoteBlock, TodoList, Task
+
+FORMAT = 'brainstorm-account'
+VERSION = 1
+
+# model label, model, archived attributes (besides the primary key)
+ARCHIVED = [
+    ('folder', Folder, ['name', 'parent_id', 'date_updated']),
+    ('note', Note, ['name', 'content', 'chunked', 'pinned', 'date_created', 'date_updated', 'folder_id']),
+    ('note_block', NoteBlock, ['note_id', 'index', 'content']),
+    ('todo_list', TodoList, ['name', 'priority', 'due_date', 'date_created', 'date_updated', 'folder_id']),
+    ('task', Task, [
+        'name', 'priority', 'failed', 'date_created', 'due_date', 'date_closed', 'time_spent',
+        'parent_task_id', 'note_id', 'note_position', 'todo_list_id',
+    ]),
+]
+MODELS = {label: (model, fields) for label, model, fields in ARCHIVED}
+
+# note content runs to megabytes: its rows are fetched a few at a time whatever the chunk size
+CONTENT_CHUNK_SIZE = 20
+CONTENT_LABELS = {'note', 'note_block'}
+
+# auto_now(_add) fields: bulk_create overwrites them, the importer writes the archived values back
+DATE_FIELDS = {
+    Folder: ['date_updated'],
+    Note: ['date_created', 'date_updated'],
+    TodoList: ['date_created', 'date_updated'],
+    Task: ['date_created'],
+}
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def archived_rows(account):
+    folders = Folder.objects.filter(account=account)
+    notes = Note.objects.filter(folder__account=account)
+    # a parent's path is a prefix of its children's: shorter paths first means parents first,
+    # and keeps the importer's batches whole level by level
+    yield 'folder', folders.order_by(Length('path'), 'path')
+    yield 'note', notes.order_by('pk')
+    # the content of chunked notes lives in their blocks
+    yield 'note_block', NoteBlock.objects.filter(note__in=notes).order_by('pk')
+    yield 'todo_list', TodoList.objects.for_account(account).order_by('pk')
+    yield 'task', Task.objects.for_account(account).order_by('pk')
+
+
+def encode(value):
+    return value.isoformat() if isinstance(value, date) else str(value)
+
+
+def export_account(account, stream, chunk_size=2000):
+    """
+    Writes the archive of `account` to the text `stream`. Rows are read through
+    server-side cursors, `chunk_size` at a time (notes and their blocks at most
+    CONTENT_CHUNK_SIZE at a time), so memory use doesn't grow with the account.
+    Every model is read from the same snapshot: a task can't refer to a note written after
+    the notes were read. Returns the number of records written per model label.
+    """
+    stream.write(json.dumps({'format': FORMAT, 'version': VERSION}) + '\n')
+    counts = {}
+    with snapshot():
+        for label, queryset in archived_rows(account):
+            fields = MODELS[label][1]
+            counts[label] = 0
+            size = min(chunk_size, CONTENT_CHUNK_SIZE) if label in CONTENT_LABELS else chunk_size
+            for obj in queryset.iterator(chunk_size=size):
+                record = {'model': label, 'pk': obj.pk, 'fields': {name: getattr(obj, name) for name in fields}}
+                stream.write(json.dumps(record, default=encode) + '\n')
+                counts[label] += 1
+    return counts
+
+
+@contextmanager
+def snapshot(using='default'):
+    """
+    A transaction whose reads all see the database as of its first one. Postgres only gives
+    that at REPEATABLE READ, which has to be set before the transaction's first query, so an
+    export run inside a transaction someone else started reads at that transaction's level.
+    """
+    connection = connections[using]
+    outermost = not connection.in_atomic_block
+    with transaction.atomic(using=using):
+        if outermost and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        yield
+
+
+class Importer:
+    """
+    Recreates archived rows for another account, `batch_size` rows per bulk insert.
+    Only the old -> new primary key maps (and the task parents) are kept in memory.
+    """
+
+    def __init__(self, account, batch_size=1000):
+        self.account = account
+        self.batch_size = batch_size
+        self.pks = {model: {} for _, model, _ in ARCHIVED}
+        self.pending = []
+        self.pending_pks = set()
+        self.pending_model = None
+        self.task_parents = []
+        self.counts = {label: 0 for label, _, _ in ARCHIVED}
+
+    def run(self, lines):
+        lines = iter(lines)
+        try:
+            header = json.loads(next(lines))
+        except (StopIteration, ValueError):
+            raise ArchiveError('not an account archive')
+        if not isinstance(header, dict) or header.get('format') != FORMAT:
+            raise ArchiveError('not an account archive')
+        if header.get('version') != VERSION:
+            raise ArchiveError(f"unsupported archive version {header.get('version')}")
+
+        with transaction.atomic():
+            for number, line in enumerate(lines, start=2):
+                if line.strip():
+                    self.add(number, line)
+            self.flush()
+            self.link_task_parents()
+        return self.counts
+
+    def add(self, number, line):
+        try:
+            record = json.loads(line)
+            model, fields = MODELS[record['model']]
+            values = record['fields']
+            obj = model(**{name: self.value(model, name, values.get(name)) for name in fields})
+            old_pk = record['pk']
+        except (ValueError, KeyError, TypeError) as e:
+            raise ArchiveError(f'line {number}: {e!r}')
+
+        if model is not self.pending_model or len(self.pending) >= self.batch_size:
+            self.flush()
+        if model is Folder:
+            obj.account = self.account
+            # archived before its children, but possibly still waiting in the batch
+            if obj.parent_id in self.pending_pks:
+                self.flush()
+        self.remap(obj, old_pk)
+        self.pending_model = model
+        self.pending.append((obj, old_pk, {name: values.get(name) for name in DATE_FIELDS.get(model, [])}))
+        self.pending_pks.add(old_pk)
+        self.counts[record['model']] += 1
+
+    @staticmethod
+    def value(model, name, value):
+        field = model._meta.get_field(name[:-len('_id')] if name.endswith('_id') else name)
+        return None if value is None else field.to_python(value)
+
+    def remap(self, obj, old_pk):
+        for field in obj._meta.concrete_fields:
+            if not field.many_to_one or field.remote_field.model not in self.pks:
+                continue
+            old = getattr(obj, field.attname)
+            if old is None:
+                continue
+            if field.name == 'parent_task':
+                # tasks aren't archived parents first: linked once they all exist
+                self.task_parents.append((old_pk, old))
+                setattr(obj, field.attname, None)
+            elif old not in self.pks[field.remote_field.model]:
+                raise ArchiveError(f'{obj._meta.model_name} {old_pk}: {field.name} {old} is not in the archive')
+            else:
+                setattr(obj, field.attname, self.pks[field.remote_field.model][old])
+
+    def flush(self):
+        if not self.pending:
+            return
+        model, pending = self.pending_model, self.pending
+        self.pending, self.pending_pks = [], set()
+        objs = model.objects.bulk_create_validated([obj for obj, _, _ in pending], batch_size=self.batch_size)
+        for obj, old_pk, _ in pending:
+            self.pks[model][old_pk] = obj.pk
+
+        date_fields = DATE_FIELDS.get(model)
+        if date_fields:
+            for obj, _, dates in pending:
+                for name, value in dates.items():
+                    setattr(obj, name, self.value(model, name, value))
+            # bulk_update doesn't touch auto_now fields
+            model.objects.bulk_update(objs, date_fields, batch_size=self.batch_size)
+            if model is Task:
+                # the metrics of the days the tasks were created on, rather than today's
+                MetricsDirtyDay.objects.mark({timezone.localdate(obj.date_created) for obj in objs})
+
+    def link_task_parents(self):
+        task_pks = self.pks[Task]
+        for start in range(0, len(self.task_parents), self.batch_size):
+            batch = self.task_parents[start:start + self.batch_size]
+            for old_pk, old_parent in batch:
+                if old_parent not in task_pks:
+                    raise ArchiveError(f'task {old_pk}: parent_task {old_parent} is not in the archive')
+            tasks = [Task(pk=task_pks[old_pk], parent_task_id=task_pks[old_parent]) for old_pk, old_parent in batch]
+            Task.objects.bulk_update(tasks, ['parent_task'])
+
+
+def import_account(account, lines, batch_size=1000):
+    """Imports the archive read from `lines` into `account`; returns the records imported per model label."""
+    return Importer(account, batch_size).run(lines)
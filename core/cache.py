@@ -0,0 +1,99 @@
+"""
+Versioned read cache for the workspace sections of an account. Each section has a
+version token stored next to the cached values, and values are keyed by it:
+a write replaces the token, so invalidation is exact instead of TTL based.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+SECTIONS = ['folders', 'notes', 'todo_lists']
+STAT_OUTCOMES = ['hits', 'misses']
+
+
+def get_cache():
+    return caches[getattr(settings, 'WORKSPACE_CACHE', 'default')]
+
+
+def version_key(account_id, section):
+    return f'workspace:{account_id}:{section}:version'
+
+
+def stat_key(section, outcome):
+    return f'workspace:stats:{section}:{outcome}'
+
+
+def section_versions(account_id, sections):
+    cache = get_cache()
+    keys = {section: version_key(account_id, section) for section in sections}
+    stored = cache.get_many(keys.values())
+
+    versions = {}
+    for section, key in keys.items():
+        version = stored.get(key)
+        if version is None:
+            version = uuid.uuid4().hex
+            # add() so that concurrent readers settle on a single token
+            if not cache.add(key, version, timeout=None):
+                version = cache.get(key, version)
+        versions[section] = version
+    return versions
+
+
+def get_sections(account_id, computes):
+    """
+    `computes` maps section names to callables producing their value on a miss.
+    Two cache round trips when everything hits: versions, then values.
+    """
+    cache = get_cache()
+    versions = section_versions(account_id, computes)
+    keys = {section: f'workspace:{account_id}:{section}:{version}' for section, version in versions.items()}
+    cached = cache.get_many(keys.values())
+
+    values, missed = {}, {}
+    for section, compute in computes.items():
+        if keys[section] in cached:
+            values[section] = cached[keys[section]]
+            record(section, 'hits')
+        else:
+            values[section] = missed[keys[section]] = compute()
+            record(section, 'misses')
+    if missed:
+        # superseded versions are never read again, the timeout only reclaims their memory
+        cache.set_many(missed, timeout=getattr(settings, 'WORKSPACE_CACHE_TIMEOUT', 24 * 60 * 60))
+    return values
+
+
+def invalidate(account_id, sections=SECTIONS):
+    def bump():
+        get_cache().set_many({version_key(account_id, section): uuid.uuid4().hex for section in sections}, timeout=None)
+
+    bump()
+    # and again once committed: a read racing the write may have cached pre-commit rows under the new token
+    transaction.on_commit(bump)
+
+
+def record(section, outcome):
+    cache = get_cache()
+    key = stat_key(section, outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def stats():
+    cache = get_cache()
+    keys = {(section, outcome): stat_key(section, outcome) for section in SECTIONS for outcome in STAT_OUTCOMES}
+    stored = cache.get_many(keys.values())
+    return {
+        section: {outcome: stored.get(keys[section, outcome], 0) for outcome in STAT_OUTCOMES}
+        for section in SECTIONS
+    }
+
+
+def reset_stats():
+    get_cache().delete_many([stat_key(section, outcome) for section in SECTIONS for outcome in STAT_OUTCOMES])
@@ -0,0 +1,145 @@
+"""
+Real-time change feed: every committed write to a folder, note, todo list or task is
+published to its account as a small change (model, id, date_updated, deleted), and open
+tabs subscribed to the account refetch only what changed instead of polling.
+
+Subscribers coalesce: changes to the same entity that arrive before a subscriber gets to
+them collapse into the latest one, so a burst of autosaves is pushed once. Tasks have no
+date_updated of their own; a task change also means its todo list's date_updated moved.
+
+The broker is configurable with CHANGE_BROKER. The default InProcessBroker only reaches
+subscribers in the process the write happened in: enough for a single ASGI worker, while
+several workers (or writes made by the background commands) need a broker shared between
+processes behind the same interface.
+"""
+import asyncio
+import json
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import SyncRecord
+
+LABELS = SyncRecord.LABELS
+# seconds between keep-alive comments, under the idle timeouts of proxies
+KEEP_ALIVE = 15
+# milliseconds the browser waits before reconnecting a closed stream
+RETRY = 1000
+
+
+def change(obj, deleted=False):
+    return {
+        'model': LABELS[type(obj)],
+        'id': obj.pk,
+        # read from the instance as loaded: a deferred date_updated would cost a query per row
+        'date_updated': None if deleted else obj.__dict__.get('date_updated'),
+        'deleted': deleted,
+    }
+
+
+class Subscription:
+    """The pending changes of one subscriber, keyed by entity: later changes replace earlier ones."""
+
+    def __init__(self, broker, account_id):
+        self.broker = broker
+        self.account_id = account_id
+        self.loop = asyncio.get_running_loop()
+        self.ready = asyncio.Event()
+        self.lock = threading.Lock()
+        self.pending = {}
+
+    def push(self, changes):
+        """Called from whichever thread committed the write."""
+        with self.lock:
+            for item in changes:
+                self.pending[item['model'], item['id']] = item
+        self.loop.call_soon_threadsafe(self.ready.set)
+
+    async def get(self, coalesce=0.0):
+        """
+        Waits for changes, then `coalesce` seconds more for the rest of their burst;
+        returns them in the order their entities first changed.
+        """
+        await self.ready.wait()
+        if coalesce:
+            await asyncio.sleep(coalesce)
+        with self.lock:
+            self.ready.clear()
+            changes, self.pending = list(self.pending.values()), {}
+        return changes
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = {}
+
+    def subscribe(self, account_id):
+        """From the event loop serving the subscriber."""
+        subscription = Subscription(self, account_id)
+        with self.lock:
+            self.subscriptions.setdefault(account_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.account_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self.subscriptions.pop(subscription.account_id, None)
+
+    def publish(self, account_id, changes):
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(account_id, ()))
+        for subscription in subscriptions:
+            subscription.push(changes)
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(getattr(settings, 'CHANGE_BROKER', 'core.changes.InProcessBroker'))()
+
+
+@receiver(setting_changed)
+def reset_broker(setting, **kwargs):
+    if setting == 'CHANGE_BROKER':
+        get_broker.cache_clear()
+
+
+def publish(account_id, changes, using='default'):
+    """Publishes `changes` to the account's subscribers once the current transaction commits."""
+    if changes:
+        transaction.on_commit(lambda: get_broker().publish(account_id, changes), using=using)
+
+
+async def events(account_id, coalesce=None, timeout=None):
+    """
+    Server-sent events of the changes published to `account_id` for `timeout` seconds:
+    an event named `changes` per coalesced burst, its data the list of changes.
+    """
+    coalesce = getattr(settings, 'CHANGE_FEED_COALESCE', 0.5) if coalesce is None else coalesce
+    timeout = getattr(settings, 'CHANGE_FEED_TIMEOUT', 5 * 60) if timeout is None else timeout
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    subscription = get_broker().subscribe(account_id)
+    try:
+        yield f'retry: {RETRY}\n\n'
+        while (remaining := deadline - loop.time()) > 0:
+            try:
+                # a burst cut short by the timeout stays pending for the next round
+                changes = await asyncio.wait_for(subscription.get(coalesce), timeout=min(KEEP_ALIVE, remaining))
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            yield f'event: changes\ndata: {json.dumps(changes, cls=DjangoJSONEncoder)}\n\n'
+    finally:
+        subscription.close()
@@ -0,0 +1,136 @@
+"""
+Set-based deletion of large folder subtrees.
+
+Django's collector loads every cascaded row (and sends signals for each) before deleting
+anything, which doesn't scale to a project with tens of thousands of tasks. SubtreeDeleter
+walks the same relations (on_delete included) but deletes `batch_size` primary keys at a time
+with plain DELETE statements, children before their parents, each batch in its own short
+transaction: memory stays bounded, and an interrupted deletion leaves consistent rows behind
+and can simply be run again.
+
+Raw deletes skip the post_delete receivers, so their bookkeeping is redone here. Todo list
+task counters and metrics days move with every batch of tasks. The workspace cache is
+invalidated once the run ends, whether it finished or not, since clients must not be served
+rows a failed run already removed. The folder's sync record and change feed entry wait for
+the whole subtree to be gone: a run that failed part way makes them when it's run again.
+"""
+from django.db import models, transaction
+from django.db.models import Count, Q
+from django.db.models.deletion import get_candidate_relations_to_delete
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import cache, changes
+from .models import Folder, FolderDeletion, MetricsDirtyDay, SyncRecord, TodoList, Task
+
+
+def relations(model):
+    """Reverse one-to-one and many-to-one relations to `model`, hidden ones included."""
+    return list(get_candidate_relations_to_delete(model._meta))
+
+
+class SubtreeDeleter:
+    def __init__(self, batch_size=1000, progress=None, using='default'):
+        self.batch_size = batch_size
+        # called with (model, number of rows) after every batch
+        self.progress = progress
+        self.using = using
+        self.deleted = {}
+
+    def delete_folder(self, folder):
+        """Deletes `folder` and everything under it; returns the rows deleted per model label."""
+        subtree = Folder.objects.using(self.using).filter(path__startswith=folder.path)
+        try:
+            self.delete(subtree)
+        finally:
+            cache.invalidate(folder.account_id)
+        # the records of the rows deleted with it are reported deleted once their rows are gone
+        SyncRecord.objects.using(self.using).record(folder.account_id, [(SyncRecord.LABELS[Folder], folder.pk, True)])
+        changes.publish(folder.account_id, [changes.change(folder, deleted=True)], using=self.using)
+        return self.deleted
+
+    def delete(self, queryset, via=None):
+        """Deletes the rows of `queryset`, reached through the foreign key `via` (None at the top)."""
+        model = queryset.model
+        if not relations(model) and model is not Task:
+            # nothing refers to these rows: a single statement, bounded by the batch that led here
+            self.raw_delete(model, queryset)
+            return
+
+        while True:
+            ids = list(queryset.order_by().values_list('pk', flat=True)[:self.batch_size])
+            if not ids:
+                return
+            for relation in relations(model):
+                self.delete_related(relation, ids)
+            with transaction.atomic(using=self.using):
+                if model is Task:
+                    self.forget_tasks(ids, via)
+                self.raw_delete(model, model._base_manager.using(self.using).filter(pk__in=ids))
+
+    def delete_related(self, relation, ids):
+        field = relation.field
+        related = relation.related_model._base_manager.using(self.using).filter(**{f'{field.name}__in': ids})
+        if relation.on_delete is models.CASCADE:
+            self.delete(related, via=field)
+        elif relation.on_delete is models.SET_NULL:
+            related.update(**{field.name: None})
+        elif relation.on_delete is not models.DO_NOTHING:
+            raise NotImplementedError(f'{relation.on_delete.__name__} of {field} is not supported by set-based deletes')
+
+    def raw_delete(self, model, queryset):
+        count = queryset._raw_delete(self.using)
+        if count:
+            label = model._meta.label
+            self.deleted[label] = self.deleted.get(label, 0) + count
+            if self.progress:
+                self.progress(model, count)
+
+    def forget_tasks(self, ids, via):
+        """What the Task post_delete receivers would have done for the tasks in `ids`."""
+        tasks = Task.objects.using(self.using).filter(pk__in=ids).order_by()
+
+        created = tasks.annotate(day=TruncDate('date_created')).values_list('day', flat=True).distinct()
+        closed = tasks.filter(date_closed__isnull=False).values_list('date_closed', flat=True).distinct()
+        MetricsDirtyDay.objects.using(self.using).mark(set(created) | set(closed))
+
+        # tasks deleted along with their list have no counters left to update
+        if via is not Task._meta.get_field('todo_list'):
+            counts = tasks.values('todo_list').annotate(
+                tasks_total=Count('pk'),
+                tasks_open=Count('pk', filter=Q(date_closed__isnull=True)),
+                tasks_closed=Count('pk', filter=Q(date_closed__isnull=False)),
+                tasks_failed=Count('pk', filter=Q(failed=True)),
+            )
+            deltas = {
+                row.pop('todo_list'): {counter: -count for counter, count in row.items()}
+                for row in counts
+            }
+            TodoList.objects.using(self.using).apply_task_deltas(deltas)
+
+
+def run_pending_deletion(batch_size=1000):
+    """
+    Claims one pending FolderDeletion and runs it to the end, recording progress after every
+    batch. Returns the deletion, or None when there was nothing to claim.
+    """
+    for deletion in FolderDeletion.objects.claimable().order_by('date_created')[:5]:
+        # the claim is a conditional UPDATE: of two workers eyeing the same deletion only one gets it
+        now = timezone.now()
+        if FolderDeletion.objects.claimable(now).filter(pk=deletion.pk).update(date_claimed=now):
+            break
+    else:
+        return None
+
+    def progress(model, count):
+        FolderDeletion.objects.filter(pk=deletion.pk).update(deleted=deleter.deleted, date_claimed=timezone.now())
+
+    deleter = SubtreeDeleter(batch_size, progress)
+    # resumed deletions carry on counting
+    deleter.deleted = dict(deletion.deleted)
+    folder = Folder.objects.filter(pk=deletion.folder_id).only('path', 'account_id').first()
+    if folder is not None:
+        deleter.delete_folder(folder)
+    deletion.deleted, deletion.date_finished = deleter.deleted, timezone.now()
+    FolderDeletion.objects.filter(pk=deletion.pk).update(deleted=deletion.deleted, date_finished=deletion.date_finished)
+    return deletion
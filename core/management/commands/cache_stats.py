@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from core import cache
+
+
+class Command(BaseCommand):
+    help = "Reports workspace cache hits and misses per section"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help="zero the counters after reporting them")
+
+    def handle(self, *args, reset, **options):
+        for section, counts in cache.stats().items():
+            lookups = counts['hits'] + counts['misses']
+            ratio = f'{counts["hits"] / lookups:.1%}' if lookups else '-'
+            self.stdout.write(f'{section}: {counts["hits"]} hits, {counts["misses"]} misses, hit ratio {ratio}')
+        if reset:
+            cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('counters reset'))
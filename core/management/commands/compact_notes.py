@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import Note
+
+
+class Command(BaseCommand):
+    help = "Folds the blocks of chunked notes that haven't been edited for a while back into a single record"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--idle-minutes', type=int, default=30, help="skip notes edited more recently than this")
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, idle_minutes, batch_size, **options):
+        idle_since = timezone.now() - timedelta(minutes=idle_minutes)
+        pending = Note.objects.filter(chunked=True, date_updated__lt=idle_since).order_by('pk')
+
+        compacted, last_pk = 0, 0
+        while True:
+            batch = list(pending.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            for note in batch:
+                note.compact()
+            compacted += len(batch)
+            last_pk = batch[-1].pk
+
+        self.stdout.write(self.style.SUCCESS(f'{compacted} notes compacted'))
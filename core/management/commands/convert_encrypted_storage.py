@@ -0,0 +1,130 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from core.envelopes import ENVELOPES, get_envelope
+from core.models import Folder, Note, NoteBlock, TodoList, Task
+from core.validators import BLOCK_SEPARATOR
+
+# wrapped ciphertext stored as text whatever the envelope, with the foreign key to its owner;
+# note content is handled on its own
+WRAPPED_FIELDS = [
+    (Folder, 'name', 'account'), (Note, 'name', 'folder'), (TodoList, 'name', 'folder'), (Task, 'name', 'todo_list'),
+    (NoteBlock, 'content', 'note'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves stored note content into the column used by the configured ENCRYPTED_FIELD_ENVELOPE, in batches. "
+        "A switch between text formats (base64 and base85) also needs every stored value rewrapped: "
+        "pass the envelope the data was stored with as --from-envelope."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--from-envelope', choices=sorted(ENVELOPES), default=None,
+            help="envelope the stored names and text content were wrapped with, when it isn't the configured one",
+        )
+
+    def handle(self, *args, batch_size, from_envelope, **options):
+        envelope = get_envelope()
+        source = ENVELOPES[from_envelope] if from_envelope and from_envelope != envelope.name else None
+        if source is None:
+            converted = self.move_content(envelope, batch_size)
+        else:
+            # a half rewrapped column can't be told from a finished one, so it's all or nothing.
+            # Clients see the rewrapped rows as changed: validated bulk writes with date_updated
+            # bumped, so ETags move and the receivers record and publish the changes.
+            now = timezone.now()
+            with transaction.atomic():
+                for model, field, owner in WRAPPED_FIELDS:
+                    self.rewrap_field(model, field, owner, source, envelope, batch_size, now)
+                converted = self.rewrap_content(source, envelope, batch_size, now)
+
+        self.stdout.write(self.style.SUCCESS(f"done: {converted} notes stored for the '{envelope.name}' envelope"))
+
+    def rewrap(self, value, source, envelope):
+        if not source.validate(value):
+            raise CommandError(f"a stored value isn't wrapped with the '{source.name}' envelope")
+        return envelope.encode(source.decode(value))
+
+    def write_validated(self, model, batch, fields):
+        """Validates the whole batch (the lengths of rewrapped values included) before writing any of it."""
+        try:
+            model.objects.bulk_update_validated(batch, fields)
+        except ValidationError as e:
+            raise CommandError(f'{model._meta.verbose_name} rows can\'t be rewrapped: {e.message_dict}')
+
+    def rewrap_field(self, model, field, owner, source, envelope, batch_size, now):
+        dated = any(model_field.name == 'date_updated' for model_field in model._meta.concrete_fields)
+        loaded = ['pk', field, owner, *(['date_updated'] if dated else [])]
+        rewrapped, last_pk = 0, 0
+        while True:
+            batch = list(model.objects.filter(pk__gt=last_pk).order_by('pk').only(*loaded)[:batch_size])
+            if not batch:
+                break
+            for obj in batch:
+                setattr(obj, field, self.rewrap(getattr(obj, field), source, envelope))
+                if dated:
+                    obj.date_updated = now
+            self.write_validated(model, batch, [field, *(['date_updated'] if dated else [])])
+            if model is NoteBlock:
+                self.touch_notes({block.note_id for block in batch}, now)
+            rewrapped += len(batch)
+            last_pk = batch[-1].pk
+        self.stdout.write(f'rewrapped {rewrapped} {model._meta.verbose_name} {field}s')
+
+    def touch_notes(self, note_ids, now):
+        notes = list(Note.objects.filter(pk__in=note_ids).only('pk', 'folder', 'date_updated'))
+        for note in notes:
+            note.date_updated = now
+        self.write_validated(Note, notes, ['date_updated'])
+
+    def rewrap_content(self, source, envelope, batch_size, now):
+        converted, last_pk = 0, 0
+        while True:
+            batch = list(Note.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', 'content', 'content_binary', 'folder')[:batch_size])
+            if not batch:
+                break
+            for note in batch:
+                # `from_db` already rewrapped binary content with the configured envelope
+                if note.content_binary is None and note.content:
+                    note.content = BLOCK_SEPARATOR.join(
+                        self.rewrap(block, source, envelope) for block in note.content.split(BLOCK_SEPARATOR)
+                    )
+                note.date_updated = now
+            # the validated write packs `content` into the configured storage column
+            self.write_validated(Note, batch, ['content', 'date_updated'])
+            converted += len(batch)
+            last_pk = batch[-1].pk
+            self.stdout.write(f'converted {converted} notes')
+        return converted
+
+    def move_content(self, envelope, batch_size):
+        if envelope.binary_storage:
+            # rows still holding wrapped text
+            pending = Note.objects.filter(content_binary__isnull=True).exclude(content='')
+        else:
+            pending = Note.objects.filter(content_binary__isnull=False)
+
+        converted, last_pk = 0, 0
+        while True:
+            # keyset batches: converted rows drop out of `pending`, so offsets would skip rows
+            batch = list(pending.filter(pk__gt=last_pk).order_by('pk').only('pk', 'content', 'content_binary')[:batch_size])
+            if not batch:
+                break
+
+            for note in batch:
+                # `from_db` already rewrapped binary content with the configured envelope
+                note.pack_content()
+            with transaction.atomic():
+                # bulk_update leaves date_updated alone: only the storage column changed, not what clients get
+                Note.objects.bulk_update(batch, ['content', 'content_binary'])
+
+            converted += len(batch)
+            last_pk = batch[-1].pk
+            self.stdout.write(f'converted {converted} notes')
+        return converted
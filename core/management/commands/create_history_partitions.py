@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from core.models import TaskHistory, TodoListHistory
+from core.partitions import create_monthly_partitions
+
+
+class Command(BaseCommand):
+    help = "Creates the upcoming monthly partitions of the history tables (Postgres only), safe to run daily"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3)
+
+    def handle(self, *args, months_ahead, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(f'history tables are only partitioned on Postgres, nothing to do on {connection.vendor}')
+            return
+
+        for model in [TaskHistory, TodoListHistory]:
+            created = create_monthly_partitions(connection, model._meta.db_table, months_ahead, timezone.localdate())
+            for name in created:
+                self.stdout.write(f'created partition {name}')
+        self.stdout.write(self.style.SUCCESS(f'history partitions ready through {months_ahead} months ahead'))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.deletion import run_pending_deletion
+
+
+class Command(BaseCommand):
+    help = "Carries out scheduled folder deletions, a batch of rows at a time"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="rows deleted per statement")
+        parser.add_argument('--loop', action='store_true', help="keep polling for deletions instead of exiting once none are left")
+        parser.add_argument('--interval', type=float, default=5.0, help="seconds to sleep between polls in --loop mode")
+
+    def handle(self, *args, batch_size, loop, interval, **options):
+        while True:
+            deletion = run_pending_deletion(batch_size=batch_size)
+            if deletion is not None:
+                deleted = ', '.join(f'{count} {label}' for label, count in sorted(deletion.deleted.items()))
+                self.stdout.write(f'deletion {deletion.pk} done: {deleted or "nothing left"}')
+                continue
+            if not loop:
+                break
+            time.sleep(interval)
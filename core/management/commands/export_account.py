@@ -0,0 +1,32 @@
+import gzip
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.archive import export_account
+
+
+class Command(BaseCommand):
+    help = "Streams an account's folders, notes, todo lists and tasks (still encrypted) as an NDJSON archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument('email')
+        parser.add_argument('--output', default='-', help="archive path, gzipped if it ends with .gz; '-' for stdout")
+        parser.add_argument('--chunk-size', type=int, default=2000, help="rows fetched per round trip of the server-side cursors (notes: a few at most)")
+
+    def handle(self, *args, email, output, chunk_size, **options):
+        try:
+            account = get_user_model().objects.get(email=email)
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'no account with the email {email}')
+
+        if output == '-':
+            counts = export_account(account, self.stdout, chunk_size=chunk_size)
+            # stdout carries the archive
+            report = self.stderr
+        else:
+            opener = gzip.open if output.endswith('.gz') else open
+            with opener(output, 'wt', encoding='utf-8') as stream:
+                counts = export_account(account, stream, chunk_size=chunk_size)
+            report = self.stdout
+        report.write(self.style.SUCCESS('exported ' + ', '.join(f'{count} {label}s' for label, count in counts.items())))
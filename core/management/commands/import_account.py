@@ -0,0 +1,30 @@
+import gzip
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from core.archive import ArchiveError, import_account
+
+
+class Command(BaseCommand):
+    help = "Imports an archive written by export_account into an existing account, in bulk batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help="account the archived rows are added to")
+        parser.add_argument('archive', help="archive path, gzipped if it ends with .gz")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, email, archive, batch_size, **options):
+        try:
+            account = get_user_model().objects.get(email=email)
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'no account with the email {email}')
+
+        opener = gzip.open if archive.endswith('.gz') else open
+        try:
+            with opener(archive, 'rt', encoding='utf-8') as lines:
+                counts = import_account(account, lines, batch_size=batch_size)
+        except (ArchiveError, ValidationError) as e:
+            raise CommandError(f'nothing imported: {e}')
+        self.stdout.write(self.style.SUCCESS('imported ' + ', '.join(f'{count} {label}s' for label, count in counts.items())))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import cache
+from core.models import Folder, TodoList
+
+
+class Command(BaseCommand):
+    help = "Verifies the denormalized TodoList task counters and recounts the lists that drifted"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--verify', action='store_true', help="only report stale lists, don't fix them")
+        parser.add_argument('--all', action='store_true', dest='rebuild_all', help="recount every list instead of only the stale ones")
+
+    def handle(self, *args, batch_size, verify, rebuild_all, **options):
+        stale, last_pk = 0, 0
+        while True:
+            # keyset batches keep every UPDATE (and the locks it takes) small
+            ids = list(TodoList.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            last_pk = ids[-1]
+
+            batch = TodoList.objects.filter(pk__in=ids)
+            if not rebuild_all:
+                batch = TodoList.objects.filter(pk__in=batch.with_stale_task_counters().values('pk'))
+                stale_ids = list(batch.values_list('pk', flat=True))
+                stale += len(stale_ids)
+                if verify:
+                    for pk in stale_ids:
+                        self.stdout.write(self.style.WARNING(f'todo list {pk} has stale task counters'))
+                    continue
+            with transaction.atomic():
+                batch.rebuild_task_counters()
+                # plain UPDATEs send no signals, drop the cached summaries of the recounted lists here
+                for account_id in Folder.objects.filter(todolist__in=batch).values_list('account_id', flat=True).distinct():
+                    cache.invalidate(account_id, ['todo_lists'])
+
+        if verify:
+            self.stdout.write(f'{stale} todo lists with stale task counters')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'task counters rebuilt ({"all lists" if rebuild_all else f"{stale} stale lists"})'))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.models import DailyMetrics
+
+
+class Command(BaseCommand):
+    help = "Recomputes the Performance tab's daily metrics rollups for the days tasks were written to"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help="days recomputed per transaction")
+        parser.add_argument('--loop', action='store_true', help="keep polling for flagged days instead of exiting once none are left")
+        parser.add_argument('--interval', type=float, default=30.0, help="seconds to sleep between polls in --loop mode")
+
+    def handle(self, *args, batch_size, loop, interval, **options):
+        while True:
+            refreshed = DailyMetrics.objects.refresh_dirty(batch_size=batch_size)
+            if refreshed:
+                self.stdout.write(f'refreshed {refreshed} days')
+            if refreshed < batch_size:
+                if not loop:
+                    break
+                time.sleep(interval)
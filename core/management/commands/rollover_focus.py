@@ -0,0 +1,36 @@
+import time
+from datetime import datetime, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import FocusEntry
+
+
+class Command(BaseCommand):
+    help = "Recomputes every account's Focus ranking for today, meant to run right after midnight"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="accounts recomputed per transaction")
+        parser.add_argument('--loop', action='store_true', help="stay running and roll over again at every midnight")
+
+    def handle(self, *args, batch_size, loop, **options):
+        while True:
+            self.roll_over(batch_size)
+            if not loop:
+                break
+            midnight = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), datetime.min.time()))
+            time.sleep(max((midnight - timezone.now()).total_seconds(), 0))
+
+    def roll_over(self, batch_size):
+        today = timezone.localdate()
+        accounts, entries, last_pk = 0, 0, 0
+        while True:
+            ids = list(get_user_model().objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            last_pk = ids[-1]
+            entries += FocusEntry.objects.roll_over(ids, today)
+            accounts += len(ids)
+        self.stdout.write(self.style.SUCCESS(f'focus rolled over to {today}: {entries} tasks ranked across {accounts} accounts'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import Habit
+
+
+class Command(BaseCommand):
+    help = "Spawns the current occurrence of every due habit, safe to rerun: run it from cron at least daily"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, batch_size, **options):
+        today = timezone.localdate()
+        handled = 0
+        while True:
+            # every handled habit moves its next_due past today, so batches never repeat
+            count = Habit.objects.spawn_due(today, batch_size=batch_size)
+            handled += count
+            if count < batch_size:
+                break
+        self.stdout.write(self.style.SUCCESS(f'{handled} due habits handled'))
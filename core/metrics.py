@@ -0,0 +1,49 @@
+"""
+Performance tab metrics, aggregated per day, week or month from the DailyMetrics rollups.
+
+Rates are None for buckets without anything to divide by.
+"""
+from django.db.models import Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+
+from .models import DailyMetrics
+
+BUCKETS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+COUNTS = ['created', 'closed', 'failed', 'closed_with_due_date', 'closed_on_time', 'lead_time_days']
+
+
+def ratio(numerator, denominator):
+    return round(numerator / denominator, 4) if denominator else None
+
+
+def performance(account, bucket='day', since=None, until=None):
+    """One row per `bucket` with activity between `since` and `until` (exclusive), oldest first."""
+    rollups = DailyMetrics.objects.filter(account=account)
+    if since is not None:
+        rollups = rollups.filter(day__gte=since)
+    if until is not None:
+        rollups = rollups.filter(day__lt=until)
+    rows = (
+        rollups.order_by()
+        .values(start=BUCKETS[bucket]('day'))
+        .annotate(**{name: Sum(name) for name in COUNTS})
+        .order_by('start')
+    )
+    return [
+        {
+            'start': row['start'],
+            'created': row['created'],
+            'closed': row['closed'],
+            'failed': row['failed'],
+            'completion_rate': ratio(row['closed'] - row['failed'], row['created']),
+            'failure_rate': ratio(row['failed'], row['closed']),
+            'on_time_ratio': ratio(row['closed_on_time'], row['closed_with_due_date']),
+            'lead_time_days': ratio(row['lead_time_days'], row['closed']),
+        }
+        for row in rows
+    ]
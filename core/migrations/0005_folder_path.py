@@ -0,0 +1,31 @@
+# Generated by Django 4.2.2 on 2026-10-18 17:38
+
+from django.db import migrations, models
+
+
+def populate_folder_paths(apps, schema_editor):
+    Folder = apps.get_model('core', 'Folder')
+    level = list(Folder.objects.filter(parent=None))
+    parent_paths = {}
+    while level:
+        for folder in level:
+            folder.path = f'{parent_paths.get(folder.parent_id, "/")}{folder.pk}/'
+            parent_paths[folder.pk] = folder.path
+        Folder.objects.bulk_update(level, ['path'], batch_size=1000)
+        level = list(Folder.objects.filter(parent_id__in=[folder.pk for folder in level]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_task'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='folder',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=1024),
+        ),
+        migrations.RunPython(populate_folder_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.2 on 2026-10-18 17:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_folder_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='content_binary',
+            field=models.BinaryField(blank=True, default=None, null=True),
+        ),
+    ]
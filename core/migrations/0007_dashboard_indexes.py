@@ -0,0 +1,37 @@
+# Generated by Django 4.2.2 on 2026-10-18 17:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_note_content_binary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(condition=models.Q(('pinned', True)), fields=['folder', '-date_updated'], name='note_pinned_by_folder_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('date_closed__isnull', True)), fields=['todo_list', 'due_date'], name='task_open_by_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('date_closed__isnull', True)), fields=['todo_list', 'priority'], name='task_open_by_priority_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('date_closed__isnull', True)), fields=['due_date'], name='task_open_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='todolist',
+            index=models.Index(fields=['folder', 'priority', 'due_date'], name='todolist_folder_priority_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='todolist',
+            index=models.Index(fields=['folder', 'due_date'], name='todolist_folder_due_idx'),
+        ),
+    ]
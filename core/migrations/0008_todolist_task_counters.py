@@ -0,0 +1,52 @@
+# Generated by Django 4.2.2 on 2026-10-18 17:45
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_tasks(apps, schema_editor):
+    TodoList = apps.get_model('core', 'TodoList')
+    Task = apps.get_model('core', 'Task')
+    tasks = Task.objects.filter(todo_list=OuterRef('pk')).order_by().values('todo_list')
+
+    def count(**filters):
+        return Coalesce(Subquery(tasks.filter(**filters).annotate(count=Count('pk')).values('count')), 0)
+
+    TodoList.objects.update(
+        tasks_total=count(),
+        tasks_open=count(date_closed__isnull=True),
+        tasks_closed=count(date_closed__isnull=False),
+        tasks_failed=count(failed=True),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_dashboard_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='todolist',
+            name='tasks_closed',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='todolist',
+            name='tasks_failed',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='todolist',
+            name='tasks_open',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='todolist',
+            name='tasks_total',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_tasks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.2 on 2026-10-18 17:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_todolist_task_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='folder',
+            name='date_updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
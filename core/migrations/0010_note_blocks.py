@@ -0,0 +1,38 @@
+# Generated by Django 4.2.2 on 2026-10-18 17:50
+
+import core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_folder_date_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='chunked',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='note',
+            name='content',
+            field=models.TextField(blank=True, validators=[core.validators.validate_encoded_blocks]),
+        ),
+        migrations.CreateModel(
+            name='NoteBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('content', models.TextField(validators=[core.validators.validate_encoded_field])),
+                ('note', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='blocks', to='core.note')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='noteblock',
+            constraint=models.UniqueConstraint(fields=('note', 'index'), name='noteblock_unique_index'),
+        ),
+    ]
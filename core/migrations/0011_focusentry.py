@@ -0,0 +1,62 @@
+# Generated by Django 4.2.2 on 2026-10-18 17:58
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Q
+from django.utils import timezone
+import django.db.models.deletion
+import datetime
+
+
+def score_for(priority, due_date, today):
+    # FocusEntry.score_for as of this migration
+    days_left = None if due_date is None else (due_date - today).days
+    if days_left is None or days_left > 7:
+        due_weight = 0
+    elif days_left < 0:
+        due_weight = 4
+    else:
+        due_weight = {0: 3, 1: 2}.get(days_left, 1)
+    return due_weight * 10 + {'h': 3, 'm': 2, 'l': 1, 'n': 0}[priority]
+
+
+def rank_open_tasks(apps, schema_editor):
+    Task = apps.get_model('core', 'Task')
+    FocusEntry = apps.get_model('core', 'FocusEntry')
+    today = timezone.localdate()
+    tasks = (
+        Task.objects.filter(date_closed__isnull=True)
+        .filter(Q(due_date__lte=today + datetime.timedelta(days=7)) | Q(priority='h'))
+        .values_list('pk', 'priority', 'due_date', 'todo_list__folder__account_id')
+    )
+    FocusEntry.objects.bulk_create(
+        (
+            FocusEntry(task_id=pk, account_id=account_id, score=score_for(priority, due_date, today), due_date=due_date)
+            for pk, priority, due_date, account_id in tasks.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0010_note_blocks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FocusEntry',
+            fields=[
+                ('task', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='focus_entry', serialize=False, to='core.task')),
+                ('score', models.PositiveSmallIntegerField()),
+                ('due_date', models.DateField(blank=True, default=None, null=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['account', '-score', 'due_date', 'task'], name='focus_rank_idx')],
+            },
+        ),
+        migrations.RunPython(rank_open_tasks, migrations.RunPython.noop),
+    ]
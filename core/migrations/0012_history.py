@@ -0,0 +1,85 @@
+# Generated by Django 4.2.2 on 2026-10-18 18:01
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+import django.utils.timezone
+
+from core.partitions import create_monthly_partitions, create_partitioned_table
+
+
+HISTORY_MODELS = ['TodoListHistory', 'TaskHistory']
+
+
+def create_tables(apps, schema_editor):
+    for model_name in HISTORY_MODELS:
+        model = apps.get_model('core', model_name)
+        if schema_editor.connection.vendor != 'postgresql':
+            schema_editor.create_model(model)
+            continue
+        create_partitioned_table(schema_editor, model)
+        create_monthly_partitions(schema_editor.connection, model._meta.db_table, 3, timezone.localdate())
+
+
+def drop_tables(apps, schema_editor):
+    for model_name in HISTORY_MODELS:
+        # partitions go with their table
+        schema_editor.delete_model(apps.get_model('core', model_name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0011_focusentry'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='TodoListHistory',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('kind', models.PositiveSmallIntegerField(choices=[(1, 'Priority'), (2, 'Due date')])),
+                        ('priority', models.CharField(blank=True, default=None, max_length=1, null=True)),
+                        ('due_date', models.DateField(blank=True, default=None, null=True)),
+                        ('date_changed', models.DateTimeField(default=django.utils.timezone.now)),
+                        ('account', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                        ('todo_list', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='history', to='core.todolist')),
+                    ],
+                ),
+                migrations.CreateModel(
+                    name='TaskHistory',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('kind', models.PositiveSmallIntegerField(choices=[(1, 'Priority'), (2, 'Due date')])),
+                        ('priority', models.CharField(blank=True, default=None, max_length=1, null=True)),
+                        ('due_date', models.DateField(blank=True, default=None, null=True)),
+                        ('date_changed', models.DateTimeField(default=django.utils.timezone.now)),
+                        ('account', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                        ('task', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='history', to='core.task')),
+                    ],
+                ),
+            ],
+        ),
+        # partitioned on Postgres, which CreateModel can't express
+        migrations.RunPython(create_tables, drop_tables),
+        migrations.AddIndex(
+            model_name='todolisthistory',
+            index=models.Index(fields=['todo_list', 'date_changed'], name='todolisthistory_list_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='todolisthistory',
+            index=models.Index(fields=['account', 'date_changed'], name='todolisthistory_account_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskhistory',
+            index=models.Index(fields=['task', 'date_changed'], name='taskhistory_task_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskhistory',
+            index=models.Index(fields=['account', 'date_changed'], name='taskhistory_account_idx'),
+        ),
+    ]
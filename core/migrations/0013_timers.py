@@ -0,0 +1,57 @@
+# Generated by Django 4.2.2 on 2026-10-18 18:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0012_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='time_spent',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='Timer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_started', models.DateTimeField(default=django.utils.timezone.now)),
+                ('date_stopped', models.DateTimeField(blank=True, default=None, null=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timers', to='core.task')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TimeRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('seconds', models.PositiveIntegerField(default=0)),
+                ('account', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('todo_list', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='time_rollups', to='core.todolist')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['account', 'day'], name='timerollup_account_day_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='timerollup',
+            constraint=models.UniqueConstraint(fields=('todo_list', 'day'), name='timerollup_unique_list_day'),
+        ),
+        migrations.AddIndex(
+            model_name='timer',
+            index=models.Index(condition=models.Q(('date_stopped__isnull', True)), fields=['account'], name='timer_running_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timer',
+            constraint=models.UniqueConstraint(condition=models.Q(('date_stopped__isnull', True)), fields=('task',), name='timer_one_running_per_task'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.2 on 2026-10-18 18:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_timers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Habit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('d', 'Daily'), ('w', 'Weekly'), ('m', 'Monthly')], max_length=1)),
+                ('next_due', models.DateField()),
+                ('active', models.BooleanField(default=True)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='habit_period',
+            field=models.DateField(blank=True, default=None, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='habit',
+            name='task',
+            field=models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.task'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='habit',
+            field=models.ForeignKey(blank=True, db_index=False, default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='occurrences', to='core.habit'),
+        ),
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(condition=models.Q(('active', True)), fields=['next_due'], name='habit_due_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='task',
+            constraint=models.UniqueConstraint(fields=('habit', 'habit_period'), name='task_unique_habit_period'),
+        ),
+    ]
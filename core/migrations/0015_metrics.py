@@ -0,0 +1,64 @@
+# Generated by Django 4.2.2 on 2026-10-18 18:14
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+
+def mark_task_days(apps, schema_editor):
+    # the rollups are built by the next refresh_metrics run
+    Task = apps.get_model('core', 'Task')
+    MetricsDirtyDay = apps.get_model('core', 'MetricsDirtyDay')
+    created = Task.objects.annotate(day=TruncDate('date_created')).values_list('day', flat=True)
+    closed = Task.objects.filter(date_closed__isnull=False).values_list('date_closed', flat=True)
+    days = set(created.order_by().distinct()) | set(closed.order_by().distinct())
+    MetricsDirtyDay.objects.bulk_create([MetricsDirtyDay(day=day) for day in days], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0014_habits'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyMetrics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('created', models.PositiveIntegerField(default=0)),
+                ('closed', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('closed_with_due_date', models.PositiveIntegerField(default=0)),
+                ('closed_on_time', models.PositiveIntegerField(default=0)),
+                ('lead_time_days', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MetricsDirtyDay',
+            fields=[
+                ('day', models.DateField(primary_key=True, serialize=False)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['date_created'], name='task_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('date_closed__isnull', False)), fields=['date_closed'], name='task_closed_idx'),
+        ),
+        migrations.AddField(
+            model_name='dailymetrics',
+            name='account',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='dailymetrics',
+            constraint=models.UniqueConstraint(fields=('account', 'day'), name='dailymetrics_unique_account_day'),
+        ),
+        migrations.RunPython(mark_task_days, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.2 on 2026-10-18 18:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_metrics'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['folder', '-pinned', '-date_updated', '-id'], name='note_listing_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(models.F('todo_list'), models.Case(models.When(priority='h', then=models.Value(0)), models.When(priority='m', then=models.Value(1)), models.When(priority='l', then=models.Value(2)), default=models.Value(3), output_field=models.IntegerField()), models.F('due_date'), models.F('id'), name='task_listing_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.2 on 2026-10-18 18:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0016_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FolderDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deleted', models.JSONField(default=dict)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_claimed', models.DateTimeField(default=None, null=True)),
+                ('date_finished', models.DateTimeField(default=None, null=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('folder', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.folder')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('date_finished__isnull', True)), fields=['date_created'], name='folderdeletion_pending_idx')],
+            },
+        ),
+    ]
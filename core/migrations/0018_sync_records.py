@@ -0,0 +1,67 @@
+# Generated by Django 4.2.2 on 2026-10-18 18:37
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def record_existing(apps, schema_editor):
+    # numbered from 1 per account: syncing from token 0 returns the whole workspace
+    SyncRecord = apps.get_model('core', 'SyncRecord')
+    SyncCounter = apps.get_model('core', 'SyncCounter')
+    owned = [
+        ('folder', apps.get_model('core', 'Folder').objects.values_list('account_id', 'pk')),
+        ('note', apps.get_model('core', 'Note').objects.values_list('folder__account_id', 'pk')),
+        ('todo_list', apps.get_model('core', 'TodoList').objects.values_list('folder__account_id', 'pk')),
+        ('task', apps.get_model('core', 'Task').objects.values_list('todo_list__folder__account_id', 'pk')),
+    ]
+    sequences, batch = {}, []
+    for label, rows in owned:
+        for account_id, pk in rows.order_by('pk').iterator(chunk_size=1000):
+            sequences[account_id] = sequences.get(account_id, 0) + 1
+            batch.append(SyncRecord(account_id=account_id, model=label, object_id=pk, sequence=sequences[account_id]))
+            if len(batch) >= 1000:
+                SyncRecord.objects.bulk_create(batch)
+                batch = []
+    SyncRecord.objects.bulk_create(batch)
+    SyncCounter.objects.bulk_create(
+        [SyncCounter(account_id=account_id, sequence=sequence) for account_id, sequence in sequences.items()], batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0002_outboxemail'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0017_folder_deletions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncCounter',
+            fields=[
+                ('account', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('sequence', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SyncRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('folder', 'folder'), ('note', 'note'), ('todo_list', 'todo_list'), ('task', 'task')], max_length=16)),
+                ('object_id', models.BigIntegerField()),
+                ('sequence', models.BigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['account', 'sequence'], name='syncrecord_sequence_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='syncrecord',
+            constraint=models.UniqueConstraint(fields=('account', 'model', 'object_id'), name='syncrecord_object_unique'),
+        ),
+        migrations.RunPython(record_existing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.2 on 2026-10-18 18:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_sync_records'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='note_position',
+            field=models.PositiveIntegerField(blank=True, default=None, editable=False, null=True),
+        ),
+        # before the note_id index goes: cascades from notes always have one to use
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['note', 'note_position'], name='task_note_position_idx'),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='note',
+            field=models.ForeignKey(blank=True, db_index=False, default=None, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.note'),
+        ),
+    ]
@@ -1,33 +1,558 @@
-from django.db import models
+import threading
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models import Count, DurationField, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Concat, Greatest, Substr, TruncDate
 from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from .envelopes import get_envelope
+from .partitions import month_start
+from .signals import bulk_saved
+from .validators import (
+    BLOCK_SEPARATOR, validate_encoded_blocks, validate_encoded_field, validate_non_empty, validate_date_past_or_present,
+)
+
+
+@contextmanager
+def _deleting(using):
+    """
+    Wraps a delete: the post_delete receivers of the rows it cascades to add up their todo list
+    counter changes and hold back their sync records, both made once the collector is done.
+    """
+    with transaction.atomic(using=using), SyncRecord.objects.using(using).deferred(), \
+            TodoList.objects.using(using).deferred():
+        yield
+
+
+class DeferredDeleteMixin:
+    """Deletes rows, and whatever their delete cascades to, inside `_deleting()`."""
+    def delete(self, using=None, keep_parents=False):
+        using = using or router.db_for_write(self.__class__, instance=self)
+        with _deleting(using):
+            return super().delete(using=using, keep_parents=keep_parents)
+
+
+class ValidatedQuerySet(models.QuerySet):
+    """
+    Bulk counterpart of the `full_clean()` + `save()` every model here does:
+    fields are validated in memory and foreign keys (including `limit_choices_to`)
+    are checked with one query per relation instead of one query per row.
+    """
+    BULK_BATCH_SIZE = 1000
+
+    def delete(self):
+        with _deleting(self.db):
+            return super().delete()
+
+    def bulk_create_validated(self, objs, batch_size=BULK_BATCH_SIZE):
+        objs = list(objs)
+        self.validate_batch(objs)
+        with transaction.atomic(using=self.db):
+            objs = self.write_created(objs, batch_size)
+            # bulk writes skip post_save, receivers that care listen to this instead
+            bulk_saved.send(sender=self.model, objs=objs, fields=None, using=self.db)
+        return objs
+
+    def bulk_update_validated(self, objs, fields, batch_size=BULK_BATCH_SIZE):
+        objs = list(objs)
+        self.validate_batch(objs, fields=fields)
+        with transaction.atomic(using=self.db):
+            updated = self.write_updated(objs, fields, batch_size)
+            bulk_saved.send(sender=self.model, objs=objs, fields=fields, using=self.db)
+        return updated
+
+    def write_created(self, objs, batch_size):
+        return self.bulk_create(objs, batch_size=batch_size)
+
+    def write_updated(self, objs, fields, batch_size):
+        return self.bulk_update(objs, fields, batch_size=batch_size)
+
+    def validate_batch(self, objs, fields=None):
+        concrete_fields = self.model._meta.concrete_fields
+        if fields is not None:
+            fields = {self.model._meta.get_field(name).name for name in fields}
+            concrete_fields = [field for field in concrete_fields if field.name in fields]
+        foreign_keys = [field for field in concrete_fields if field.many_to_one]
+        exclude = {field.name for field in self.model._meta.concrete_fields if field not in concrete_fields}
+
+        errors = {}
+        for index, obj in enumerate(objs):
+            obj_errors = {}
+            try:
+                obj.clean_fields(exclude=exclude | {field.name for field in foreign_keys})
+            except ValidationError as e:
+                obj_errors = e.update_error_dict(obj_errors)
+            try:
+                obj.clean()
+            except ValidationError as e:
+                obj_errors = e.update_error_dict(obj_errors)
+            for field in foreign_keys:
+                if getattr(obj, field.attname) is None and not field.null:
+                    obj_errors.setdefault(field.name, []).append(
+                        ValidationError(field.error_messages['null'], code='null')
+                    )
+            if obj_errors:
+                errors[index] = obj_errors
 
-from .validators import validate_encoded_field, validate_non_empty, validate_date_past_or_present
+        for field in foreign_keys:
+            self._validate_foreign_key(field, objs, errors)
 
+        if errors:
+            raise ValidationError({
+                index: [f'{field}: {message}' for field, messages in ValidationError(obj_errors).message_dict.items() for message in messages]
+                for index, obj_errors in sorted(errors.items())
+            })
+
+    def _validate_foreign_key(self, field, objs, errors):
+        values = {getattr(obj, field.attname) for obj in objs} - {None}
+        if not values:
+            return
+
+        target = field.target_field.attname
+        existing = set(
+            field.remote_field.model._base_manager.using(self.db)
+            .filter(**{f'{target}__in': values})
+            .complex_filter(field.get_limit_choices_to())
+            .values_list(target, flat=True)
+        )
+        for index, obj in enumerate(objs):
+            value = getattr(obj, field.attname)
+            if value is not None and value not in existing:
+                errors.setdefault(index, {}).setdefault(field.name, []).append(ValidationError(
+                    field.error_messages['invalid'],
+                    code='invalid',
+                    params={
+                        'model': field.remote_field.model._meta.verbose_name,
+                        'pk': value,
+                        'field': field.remote_field.field_name,
+                        'value': value,
+                    },
+                ))
+
+
+class FolderQuerySet(ValidatedQuerySet):
+    def descendants_of(self, folder, include_self=False):
+        queryset = self.filter(path__startswith=folder.path)
+        if not include_self:
+            queryset = queryset.exclude(pk=folder.pk)
+        return queryset
+
+    def ancestors_of(self, folder, include_self=False):
+        ids = folder.ancestor_ids()
+        if include_self:
+            ids.append(folder.pk)
+        return self.filter(pk__in=ids)
+
+    def bulk_create_validated(self, objs, batch_size=ValidatedQuerySet.BULK_BATCH_SIZE):
+        """
+        Folders whose parent is created in the same batch go in a level of the tree at a time:
+        a child can only refer to its parent once the parent has a primary key.
+        """
+        objs = list(objs)
+        batch = {id(obj) for obj in objs}
+        parent_field = self.model._meta.get_field('parent')
+        parents = {}
+        for obj in objs:
+            parent = parent_field.get_cached_value(obj, None)
+            if parent is not None and parent.pk is not None and obj.parent_id is None:
+                # assigned before the parent was saved
+                obj.parent = parent
+            parents[id(obj)] = parent if parent is not None and parent.pk is None and id(parent) in batch else None
+
+        levels = {}
+        for obj in objs:
+            depth, parent = 0, parents[id(obj)]
+            while parent is not None:
+                depth, parent = depth + 1, parents[id(parent)]
+                if depth > len(objs):
+                    raise ValueError("folders in the batch are each other's parents")
+            levels.setdefault(depth, []).append(obj)
+
+        with transaction.atomic(using=self.db):
+            parent_ids = {obj.parent_id for obj in objs if obj.parent_id}
+            paths = dict(self.model._base_manager.using(self.db).filter(pk__in=parent_ids).values_list('pk', 'path'))
+            for depth in sorted(levels):
+                level = levels[depth]
+                for obj in level:
+                    if parents[id(obj)] is not None:
+                        # refreshes parent_id now that the parent has been inserted
+                        obj.parent = parents[id(obj)]
+                super().bulk_create_validated(level, batch_size=batch_size)
+                for obj in level:
+                    parent_path = parents[id(obj)].path if parents[id(obj)] is not None else paths.get(obj.parent_id)
+                    obj.path = f'{parent_path or Folder.PATH_SEPARATOR}{obj.pk}{Folder.PATH_SEPARATOR}'
+                self.bulk_update(level, ['path'], batch_size=batch_size)
+        return objs
+
+    def bulk_update_validated(self, objs, fields, batch_size=ValidatedQuerySet.BULK_BATCH_SIZE):
+        if 'parent' in fields or 'parent_id' in fields:
+            raise ValueError("folders can only be moved one at a time through save()")
+        return super().bulk_update_validated(objs, fields, batch_size=batch_size)
+
+
+class Folder(DeferredDeleteMixin, models.Model):
+    PATH_SEPARATOR = '/'
 
-class Folder(models.Model):
     name = models.CharField(max_length=256, blank=False, validators=[validate_encoded_field, validate_non_empty])
     account = models.ForeignKey('account.Account', on_delete=models.CASCADE, limit_choices_to={"is_active": True})
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, default=None)
+    # materialized path of primary keys from the root down to this folder, e.g. "/1/5/9/"
+    path = models.CharField(max_length=1024, blank=True, editable=False, db_index=True)
+    date_updated = models.DateTimeField(auto_now=True)
+
+    objects = FolderQuerySet.as_manager()
+
+    def ancestor_ids(self):
+        return [int(pk) for pk in self.path.strip(self.PATH_SEPARATOR).split(self.PATH_SEPARATOR)[:-1] if pk]
+
+    def build_path(self):
+        parent_path = self.parent.path if self.parent_id else self.PATH_SEPARATOR
+        return f'{parent_path}{self.pk}{self.PATH_SEPARATOR}'
+
+    def clean(self):
+        # the path already ends with "/<parent>/<self>/" unless the folder is being moved
+        unchanged = self.path.endswith(f'{self.PATH_SEPARATOR}{self.parent_id}{self.PATH_SEPARATOR}{self.pk}{self.PATH_SEPARATOR}')
+        if self.pk and self.parent_id and not unchanged:
+            if self.parent_id == self.pk or self.parent.path.startswith(self.path):
+                raise ValidationError("a folder can't be moved inside itself")
+
+        super().clean()
 
     def save(self, *args, **kwargs):
         self.full_clean()
-        super().save(*args, **kwargs)
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            self._sync_path()
+
+    def _sync_path(self):
+        old_path, new_path = self.path, self.build_path()
+        if old_path == new_path:
+            return
+
+        if old_path:
+            # moved: rewrite the prefix of the whole subtree (including self) in one statement
+            Folder.objects.filter(path__startswith=old_path).update(
+                path=Concat(Value(new_path), Substr('path', len(old_path) + 1), output_field=models.CharField())
+            )
+        else:
+            Folder.objects.filter(pk=self.pk).update(path=new_path)
+        self.path = new_path
+
 
+class NoteQuerySet(ValidatedQuerySet):
+    def write_created(self, objs, batch_size):
+        with self._packed(objs):
+            return super().write_created(objs, batch_size)
 
-class Note(models.Model):
+    def write_updated(self, objs, fields, batch_size):
+        if 'content' in fields:
+            fields = [*fields, 'content_binary']
+        with self._packed(objs):
+            return super().write_updated(objs, fields, batch_size)
+
+    def pinned(self, folder):
+        return self.filter(folder=folder, pinned=True).order_by('-date_updated')
+
+    @contextmanager
+    def _packed(self, objs):
+        contents = [obj.content for obj in objs]
+        for obj in objs:
+            obj.pack_content()
+        try:
+            yield
+        finally:
+            for obj, content in zip(objs, contents):
+                obj.content = content
+
+
+class Note(DeferredDeleteMixin, models.Model):
     name = models.CharField(max_length=256, blank=False, validators=[validate_encoded_field, validate_non_empty])
-    content = models.TextField(blank=True, validators=[validate_encoded_field])
+    # one or more independently encrypted blocks joined by BLOCK_SEPARATOR
+    content = models.TextField(blank=True, validators=[validate_encoded_blocks])
+    # the blocks live in NoteBlock rows and `content` is empty until the note gets compacted
+    chunked = models.BooleanField(default=False, editable=False)
+    # unwrapped ciphertext, used instead of `content` when the configured envelope stores raw bytes
+    content_binary = models.BinaryField(null=True, blank=True, default=None, editable=False)
     pinned = models.BooleanField(default=False)
     date_created = models.DateTimeField(auto_now_add=True)
     date_updated = models.DateTimeField(auto_now=True)
     folder = models.ForeignKey('Folder', on_delete=models.CASCADE)
 
+    objects = NoteQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Activities tab: pinned notes of a folder, most recently edited first
+            models.Index(fields=['folder', '-date_updated'], condition=Q(pinned=True), name='note_pinned_by_folder_idx'),
+            # cursor pagination of a folder's notes, see LISTING_ORDERING
+            models.Index(fields=['folder', '-pinned', '-date_updated', '-id'], name='note_listing_idx'),
+        ]
+
+    LISTING_ORDERING = ['-pinned', '-date_updated', '-id']
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        content_binary = instance.__dict__.get('content_binary')
+        if content_binary is not None:
+            instance.content = get_envelope().encode(bytes(content_binary))
+        return instance
+
+    def pack_content(self):
+        """Moves `content` into the storage column picked by the configured envelope."""
+        envelope = get_envelope()
+        # block boundaries don't survive unwrapping, so chunked content stays text
+        if envelope.binary_storage and BLOCK_SEPARATOR not in self.content:
+            self.content_binary, self.content = envelope.decode(self.content), ''
+        else:
+            self.content_binary = None
+
+    def save(self, *args, **kwargs):
+        self.full_clean()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'content' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'content_binary'}
+
+        content = self.content
+        self.pack_content()
+        try:
+            super().save(*args, **kwargs)
+        finally:
+            self.content = content
+
+    def load_content(self):
+        """Reassembles the content of a chunked note from its blocks."""
+        if self.chunked:
+            self.content = BLOCK_SEPARATOR.join(self.blocks.order_by('index').values_list('content', flat=True))
+        return self.content
+
+    async def aload_content(self):
+        """load_content() for async views."""
+        if self.chunked:
+            blocks = self.blocks.order_by('index').values_list('content', flat=True)
+            self.content = BLOCK_SEPARATOR.join([content async for content in blocks])
+        return self.content
+
+    def block_count(self):
+        if self.chunked:
+            return self.blocks.count()
+        return self.content.count(BLOCK_SEPARATOR) + 1 if self.content else 0
+
+    def apply_block_patch(self, length, blocks):
+        """
+        Resizes the note to `length` blocks and replaces the ones in `blocks`
+        (block index -> ciphertext). Only the changed rows get written; the first
+        patch after a compaction splits `content` into NoteBlock rows.
+        """
+        current_length = self.block_count()
+        errors = {}
+        for index in range(current_length, length):
+            if index not in blocks:
+                errors[index] = ['block is missing']
+        for index, content in blocks.items():
+            if not 0 <= index < length:
+                errors[index] = ['block index is out of range']
+                continue
+            try:
+                validate_encoded_field(content)
+            except ValidationError as e:
+                errors[index] = e.messages
+        if errors:
+            raise ValidationError(errors)
+
+        with transaction.atomic():
+            if not self.chunked:
+                NoteBlock.objects.bulk_create([
+                    NoteBlock(note=self, index=index, content=content)
+                    for index, content in enumerate(self.content.split(BLOCK_SEPARATOR) if self.content else [])
+                    if index < length and index not in blocks
+                ])
+                self.content, self.chunked = '', True
+
+            stored = {block.index: block for block in self.blocks.filter(index__in=list(blocks)).only('pk', 'index')}
+            for index, block in stored.items():
+                block.content = blocks[index]
+            NoteBlock.objects.bulk_update(stored.values(), ['content'])
+            NoteBlock.objects.bulk_create([
+                NoteBlock(note=self, index=index, content=content)
+                for index, content in blocks.items() if index not in stored
+            ])
+            self.blocks.filter(index__gte=length).delete()
+            self.save(update_fields=['content', 'chunked', 'date_updated'])
+
+    def compact(self):
+        """Folds the blocks of a chunked note back into `content`."""
+        with transaction.atomic():
+            # a concurrent block patch holds the same lock
+            if not Note.objects.select_for_update().filter(pk=self.pk, chunked=True).exists():
+                return
+            self.chunked = True
+            self.load_content()
+            self.chunked = False
+            # same ciphertext, so date_updated (and with it the note's ETag) stays as it is
+            self.save(update_fields=['content', 'chunked'])
+            self.blocks.all().delete()
+
+
+class NoteBlock(models.Model):
+    """One independently encrypted block of a chunked note, see `Note.apply_block_patch()`."""
+    note = models.ForeignKey('Note', on_delete=models.CASCADE, related_name='blocks')
+    index = models.PositiveIntegerField()
+    content = models.TextField(validators=[validate_encoded_field])
+
+    objects = ValidatedQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['note', 'index'], name='noteblock_unique_index'),
+        ]
+
     def save(self, *args, **kwargs):
         self.full_clean()
         super().save(*args, **kwargs)
 
 
-class TodoList(models.Model):
+class TrackedFieldsMixin:
+    """Remembers the `TRACKED_FIELDS` values last read from or written to the database."""
+    TRACKED_FIELDS = []
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_state()
+        return instance
+
+    @property
+    def loaded_values(self):
+        """Tracked field values as last read from or written to the database."""
+        return getattr(self, '_loaded_values', {})
+
+    def remember_state(self, fields=None):
+        """After a write of only `fields`, the other fields keep the values remembered before."""
+        names = self.TRACKED_FIELDS
+        loaded = {}
+        if fields is not None:
+            written = {self._meta.get_field(name).attname for name in fields}
+            names = [name for name in names if name in written]
+            loaded = {name: value for name, value in self.loaded_values.items() if name not in written}
+        self._loaded_values = {**loaded, **{name: self.__dict__[name] for name in names if name in self.__dict__}}
+
+
+def _skip_maintained_fields(instance, save_kwargs):
+    """
+    Full saves of existing rows leave out the `MAINTAINED_FIELDS`: those only move
+    through F() updates, so the copy in memory may be stale.
+    """
+    if not instance._state.adding and save_kwargs.get('update_fields') is None:
+        save_kwargs['update_fields'] = [
+            field.name for field in instance._meta.concrete_fields
+            if not field.primary_key and field.name not in instance.MAINTAINED_FIELDS
+        ]
+
+
+# per thread and database alias: the counter changes held back by TodoListQuerySet.deferred()
+_deferred_deltas = threading.local()
+
+
+class TodoListQuerySet(ValidatedQuerySet):
+    TASK_COUNTERS = ['tasks_total', 'tasks_open', 'tasks_closed', 'tasks_failed']
+
+    def for_account(self, account):
+        return self.filter(folder__account=account)
+
+    def bulk_create_validated(self, objs, batch_size=ValidatedQuerySet.BULK_BATCH_SIZE):
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            changes = TodoListHistory.objects.changes(objs)
+            objs = super().bulk_create_validated(objs, batch_size=batch_size)
+            TodoListHistory.objects.using(self.db).record(changes)
+        for obj in objs:
+            obj.remember_state()
+        return objs
+
+    def bulk_update_validated(self, objs, fields, batch_size=ValidatedQuerySet.BULK_BATCH_SIZE):
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            changes = TodoListHistory.objects.changes(objs, fields)
+            updated = super().bulk_update_validated(objs, fields, batch_size=batch_size)
+            TodoListHistory.objects.using(self.db).record(changes)
+        for obj in objs:
+            obj.remember_state(fields)
+        return updated
+
+    def apply_task_deltas(self, deltas):
+        """
+        `deltas` maps todo list ids to counter changes, see `TaskQuerySet.task_counter_deltas()`.
+        Every list touched by a task write also gets its date_updated bumped, which keeps
+        conditional GETs of a list and its tasks honest.
+        """
+        pending = getattr(_deferred_deltas, self.db, None)
+        if pending is not None:
+            for todo_list_id, changes in deltas.items():
+                merged = pending.setdefault(todo_list_id, {})
+                for counter, change in changes.items():
+                    merged[counter] = merged.get(counter, 0) + change
+            return
+        now = timezone.now()
+        for todo_list_id, changes in deltas.items():
+            # clamped: a counter that drifted below the actual count mustn't fail the write, the
+            # `rebuild_task_counters` command puts it right
+            changes = {counter: Greatest(F(counter) + change, 0) for counter, change in changes.items() if change}
+            self.filter(pk=todo_list_id).update(date_updated=now, **changes)
+
+    @contextmanager
+    def deferred(self):
+        """
+        Adds up the counter changes made in the block and applies them when it ends, one UPDATE
+        per list: a delete cascading to many tasks would otherwise update their lists once per task.
+        Nested blocks leave the updates to the outermost one; use inside the transaction.
+        """
+        if getattr(_deferred_deltas, self.db, None) is not None:
+            yield
+            return
+        pending = {}
+        setattr(_deferred_deltas, self.db, pending)
+        try:
+            yield
+        finally:
+            delattr(_deferred_deltas, self.db)
+        self.apply_task_deltas(pending)
+
+    def with_actual_task_counts(self):
+        return self.annotate(
+            actual_total=Count('task'),
+            actual_open=Count('task', filter=Q(task__date_closed__isnull=True)),
+            actual_closed=Count('task', filter=Q(task__date_closed__isnull=False)),
+            actual_failed=Count('task', filter=Q(task__failed=True)),
+        )
+
+    def with_stale_task_counters(self):
+        return self.with_actual_task_counts().exclude(
+            tasks_total=F('actual_total'),
+            tasks_open=F('actual_open'),
+            tasks_closed=F('actual_closed'),
+            tasks_failed=F('actual_failed'),
+        )
+
+    def rebuild_task_counters(self):
+        """Recounts the tasks of every list in the queryset with a single UPDATE."""
+        tasks = Task.objects.filter(todo_list=OuterRef('pk')).order_by().values('todo_list')
+
+        def count(**filters):
+            return Coalesce(Subquery(tasks.filter(**filters).annotate(count=Count('pk')).values('count')), 0)
+
+        return self.update(
+            tasks_total=count(),
+            tasks_open=count(date_closed__isnull=True),
+            tasks_closed=count(date_closed__isnull=False),
+            tasks_failed=count(failed=True),
+        )
+
+
+class TodoList(DeferredDeleteMixin, TrackedFieldsMixin, models.Model):
     HIGH = 'h'
     MEDIUM = 'm'
     LOW = 'l'
@@ -46,12 +571,207 @@ class TodoList(models.Model):
     date_updated = models.DateTimeField(auto_now=True)
     folder = models.ForeignKey('Folder', on_delete=models.CASCADE)
 
+    # denormalized task counts, kept up to date by Task.save() and task deletions
+    tasks_total = models.PositiveIntegerField(default=0, editable=False)
+    tasks_open = models.PositiveIntegerField(default=0, editable=False)
+    tasks_closed = models.PositiveIntegerField(default=0, editable=False)
+    tasks_failed = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = TodoListQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Activities tab: lists of a folder filtered by priority, sorted by due date
+            models.Index(fields=['folder', 'priority', 'due_date'], name='todolist_folder_priority_idx'),
+            models.Index(fields=['folder', 'due_date'], name='todolist_folder_due_idx'),
+        ]
+
+    TRACKED_FIELDS = ['priority', 'due_date']
+    MAINTAINED_FIELDS = TodoListQuerySet.TASK_COUNTERS
+
     def save(self, *args, **kwargs):
         self.full_clean()
-        super().save(*args, **kwargs)
+        _skip_maintained_fields(self, kwargs)
+        using = kwargs.get('using')
+        with transaction.atomic(using=using):
+            changes = TodoListHistory.objects.changes([self], kwargs.get('update_fields'))
+            super().save(*args, **kwargs)
+            TodoListHistory.objects.using(using).record(changes)
+        self.remember_state(kwargs.get('update_fields'))
+
 
+# task listings sort priorities by urgency rather than by the alphabetical order of their codes
+PRIORITY_RANK = models.Case(
+    models.When(priority='h', then=Value(0)),
+    models.When(priority='m', then=Value(1)),
+    models.When(priority='l', then=Value(2)),
+    default=Value(3),
+    output_field=models.IntegerField(),
+)
 
-class Task(models.Model):
+
+def _count_task(deltas, todo_list_id, date_closed, failed, sign=1, **kwargs):
+    counters = deltas.setdefault(todo_list_id, dict.fromkeys(TodoListQuerySet.TASK_COUNTERS, 0))
+    counters['tasks_total'] += sign
+    counters['tasks_open' if date_closed is None else 'tasks_closed'] += sign
+    if failed:
+        counters['tasks_failed'] += sign
+
+
+class TaskQuerySet(ValidatedQuerySet):
+    TREE_SQL = """
+        WITH RECURSIVE tree AS (
+            SELECT task.*, 0 AS depth, '/' || CAST(task.id AS TEXT) || '/' AS path
+            FROM {table} task
+            WHERE task.todo_list_id = %s AND task.parent_task_id IS NULL
+            UNION ALL
+            SELECT task.*, tree.depth + 1, tree.path || CAST(task.id AS TEXT) || '/'
+            FROM {table} task
+            JOIN tree ON task.parent_task_id = tree.id
+        )
+        SELECT * FROM tree ORDER BY depth, id
+    """
+
+    COUNTED_FIELDS = ['todo_list_id', 'date_closed', 'failed']
+
+    def open(self):
+        return self.filter(date_closed__isnull=True)
+
+    def bulk_create_validated(self, objs, batch_size=ValidatedQuerySet.BULK_BATCH_SIZE):
+        objs = list(objs)
+        today = timezone.localdate()
+        with transaction.atomic(using=self.db), SyncRecord.objects.using(self.db).deferred():
+            deltas = self.task_counter_deltas(objs)
+            ranked = [obj for obj in objs if obj.focus_stale(today)]
+            changes = TaskHistory.objects.changes(objs)
+            metric_days = set().union(*(obj.metric_days(today) for obj in objs))
+            objs = super().bulk_create_validated(objs, batch_size=batch_size)
+            TodoList.objects.using(self.db).apply_task_deltas(deltas)
+            FocusEntry.objects.using(self.db).refresh(ranked, today)
+            TaskHistory.objects.using(self.db).record(changes)
+            MetricsDirtyDay.objects.using(self.db).mark(metric_days)
+        for obj in objs:
+            obj.remember_state()
+        return objs
+
+    def bulk_update_validated(self, objs, fields, batch_size=ValidatedQuerySet.BULK_BATCH_SIZE):
+        objs = list(objs)
+        counted = {self.model._meta.get_field(name).attname for name in fields} & set(self.COUNTED_FIELDS)
+        today = timezone.localdate()
+        with transaction.atomic(using=self.db), SyncRecord.objects.using(self.db).deferred():
+            # lists of tasks written without their counted fields still get date_updated bumped
+            deltas = self.task_counter_deltas(objs, fields=fields) if counted else {obj.todo_list_id: {} for obj in objs}
+            ranked = {self.model._meta.get_field(name).attname for name in fields} & set(Task.FOCUS_FIELDS)
+            stale = [obj for obj in objs if obj.focus_stale(today, fields)] if ranked else []
+            changes = TaskHistory.objects.changes(objs, fields)
+            measured = {self.model._meta.get_field(name).attname for name in fields} & set(Task.METRIC_FIELDS)
+            metric_days = set().union(*(obj.metric_days(today, fields=fields) for obj in objs)) if measured else set()
+            updated = super().bulk_update_validated(objs, fields, batch_size=batch_size)
+            TodoList.objects.using(self.db).apply_task_deltas(deltas)
+            if stale and ranked != set(Task.FOCUS_FIELDS):
+                # the entries follow the rows as written, not the unsaved values in memory
+                stale = list(self.filter(pk__in=[obj.pk for obj in stale]))
+            FocusEntry.objects.using(self.db).refresh(stale, today)
+            TaskHistory.objects.using(self.db).record(changes)
+            MetricsDirtyDay.objects.using(self.db).mark(metric_days)
+        for obj in objs:
+            obj.remember_state(fields)
+        return updated
+
+    def task_counter_deltas(self, objs, deleted=False, fields=None):
+        """
+        Changes to the todo list task counters caused by saving (or having deleted) `objs`.
+        A save of only `fields` leaves the other counted fields at their stored values.
+        """
+        counted = set(self.COUNTED_FIELDS)
+        if fields is not None:
+            counted &= {self.model._meta.get_field(name).attname for name in fields}
+        missing = [
+            obj.pk for obj in objs
+            if not obj._state.adding and not deleted and not set(self.COUNTED_FIELDS) <= obj.loaded_values.keys()
+        ]
+        stored = {}
+        if missing:
+            for values in self.model._base_manager.using(self.db).filter(pk__in=missing).values('pk', *self.COUNTED_FIELDS):
+                stored[values.pop('pk')] = values
+
+        deltas = {}
+        for obj in objs:
+            if deleted:
+                previous = {name: getattr(obj, name) for name in self.COUNTED_FIELDS}
+                _count_task(deltas, **{**previous, **obj.loaded_values}, sign=-1)
+                continue
+            if obj._state.adding:
+                _count_task(deltas, obj.todo_list_id, obj.date_closed, obj.failed)
+                continue
+            previous = stored.get(obj.pk, obj.loaded_values)
+            _count_task(deltas, **previous, sign=-1)
+            _count_task(deltas, **{name: getattr(obj, name) if name in counted else previous[name] for name in self.COUNTED_FIELDS})
+        return deltas
+
+    def for_account(self, account):
+        return self.filter(todo_list__folder__account=account)
+
+    def linked_to(self, note):
+        """The tasks of `note` in the order of their markers, tasks linked without a position last."""
+        return self.filter(note=note).order_by(F('note_position').asc(nulls_last=True), 'id')
+
+    def link_note(self, note, task_ids):
+        """
+        Makes the tasks of `task_ids` the ones linked to `note`, positioned in that order, from
+        the client's manifest of the ==task_id== markers in the (encrypted) content. Tasks no
+        longer listed are detached. Set-based: one query reads the current links, one bulk
+        update writes the tasks whose link or position changed, which are returned.
+        """
+        positions = {}
+        for pk in task_ids:
+            positions.setdefault(pk, len(positions))
+        account = Folder.objects.using(self.db).filter(pk=note.folder_id).values('account')[:1]
+        tasks = list(
+            self.filter(Q(note=note) | Q(pk__in=positions), todo_list__folder__account=account)
+            .only('todo_list_id', 'note_id', 'note_position', 'failed', 'date_closed')
+        )
+        missing = positions.keys() - {task.pk for task in tasks}
+        if missing:
+            raise ValidationError({'tasks': [f"task {pk} doesn't exist" for pk in sorted(missing)]})
+
+        changed = []
+        for task in tasks:
+            note_id, position = (note.pk, positions[task.pk]) if task.pk in positions else (None, None)
+            if (task.note_id, task.note_position) != (note_id, position):
+                task.note_id, task.note_position = note_id, position
+                changed.append(task)
+        if changed:
+            self.bulk_update_validated(changed, ['note', 'note_position'])
+        return changed
+
+    def listing(self, todo_list):
+        """A todo list's tasks, to be paginated in Task.LISTING_ORDERING."""
+        return self.filter(todo_list=todo_list).annotate(priority_rank=PRIORITY_RANK)
+
+    def tree_for(self, todo_list):
+        """
+        Loads the whole task forest of a todo list in a single recursive query.
+        Returns the root tasks; every task gets `depth`, `path` and `children` attributes.
+        """
+        todo_list_id = getattr(todo_list, 'pk', todo_list)
+        sql = self.TREE_SQL.format(table=connections[self.db].ops.quote_name(self.model._meta.db_table))
+
+        roots, tasks = [], {}
+        for task in self.model.objects.db_manager(self.db).raw(sql, [todo_list_id]):
+            task.children = []
+            tasks[task.pk] = task
+            if task.parent_task_id is None:
+                roots.append(task)
+            else:
+                parent = tasks[task.parent_task_id]
+                parent.children.append(task)
+                # spares a query per task when walking the tree upwards
+                task._state.fields_cache['parent_task'] = parent
+        return roots
+
+
+class Task(DeferredDeleteMixin, TrackedFieldsMixin, models.Model):
     HIGH = 'h'
     MEDIUM = 'm'
     LOW = 'l'
@@ -69,11 +789,86 @@ class Task(models.Model):
     date_created = models.DateTimeField(auto_now_add=True)
     due_date = models.DateField(null=True, blank=True, default=None)
     date_closed = models.DateField(null=True, blank=True, default=None, validators=[validate_date_past_or_present])
+    # total seconds of the task's stopped timers, kept up to date by TimerQuerySet.stop()
+    time_spent = models.PositiveIntegerField(default=0, editable=False)
 
     parent_task = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, default=None)
-    note = models.ForeignKey('Note', on_delete=models.CASCADE, null=True, blank=True, default=None)
+    # indexed by task_note_position_idx
+    note = models.ForeignKey('Note', on_delete=models.CASCADE, null=True, blank=True, default=None, db_index=False)
+    # where the note's ==task_id== marker is among its markers, maintained by TaskQuerySet.link_note()
+    note_position = models.PositiveIntegerField(null=True, blank=True, default=None, editable=False)
     # allows for checkboxes in notes to lose their attached tasks, if original todo_list is deleted
     todo_list = models.ForeignKey('TodoList', on_delete=models.CASCADE)
+    # occurrences spawned by a habit, one per period (the unique constraint indexes the habit)
+    habit = models.ForeignKey('Habit', on_delete=models.SET_NULL, null=True, blank=True, default=None, related_name='occurrences', db_index=False)
+    habit_period = models.DateField(null=True, blank=True, default=None, editable=False)
+
+    objects = TaskQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Activities/Focus tabs only ever sort open tasks, so closed ones are kept out of these indexes
+            models.Index(fields=['todo_list', 'due_date'], condition=Q(date_closed__isnull=True), name='task_open_by_due_idx'),
+            models.Index(fields=['todo_list', 'priority'], condition=Q(date_closed__isnull=True), name='task_open_by_priority_idx'),
+            models.Index(fields=['due_date'], condition=Q(date_closed__isnull=True), name='task_open_due_idx'),
+            # metrics rollups are recomputed a day at a time
+            models.Index(fields=['date_created'], name='task_created_idx'),
+            models.Index(fields=['date_closed'], condition=Q(date_closed__isnull=False), name='task_closed_idx'),
+            # cursor pagination of a todo list's tasks, see LISTING_ORDERING
+            models.Index(F('todo_list'), PRIORITY_RANK, F('due_date'), F('id'), name='task_listing_idx'),
+            # a note's tasks in the order of their markers, see TaskQuerySet.linked_to()
+            models.Index(fields=['note', 'note_position'], name='task_note_position_idx'),
+        ]
+        constraints = [
+            # reruns of the habit scheduler can't spawn a period twice
+            models.UniqueConstraint(fields=['habit', 'habit_period'], name='task_unique_habit_period'),
+        ]
+
+    TRACKED_FIELDS = ['todo_list_id', 'date_closed', 'failed', 'priority', 'due_date']
+    FOCUS_FIELDS = ['todo_list_id', 'date_closed', 'priority', 'due_date']
+    MAINTAINED_FIELDS = ['time_spent']
+    METRIC_FIELDS = ['todo_list_id', 'date_closed', 'failed', 'due_date']
+    LISTING_ORDERING = ['priority_rank', 'due_date', 'id']
+
+    def saved_values(self, names, fields=None):
+        """
+        Values of the fields `names` as a save of only `fields` leaves them in the row:
+        the fields left out keep their loaded values, when those are known.
+        """
+        written = None if fields is None else {self._meta.get_field(name).attname for name in fields}
+        loaded = self.loaded_values
+        return {
+            name: loaded[name] if written is not None and name not in written and name in loaded else getattr(self, name)
+            for name in names
+        }
+
+    def metric_days(self, today, deleted=False, fields=None):
+        """Days whose metrics rollups saving (or having deleted) this task changes."""
+        if self._state.adding:
+            return {today} | ({self.date_closed} - {None})
+        loaded = self.loaded_values
+        saved = self.saved_values(self.METRIC_FIELDS, fields)
+        complete = set(self.METRIC_FIELDS) <= loaded.keys()
+        if not deleted and complete and all(loaded[name] == saved[name] for name in self.METRIC_FIELDS):
+            return set()
+        days = {loaded.get('date_closed'), saved['date_closed']} - {None}
+        # a task moving to another list may be moving to another account
+        if deleted or not complete or loaded['todo_list_id'] != saved['todo_list_id']:
+            days.add(timezone.localdate(self.date_created))
+        return days
+
+    def focus_stale(self, today, fields=None):
+        """Whether saving this task may change its focus entry: the focus ranking is only touched when it can be."""
+        saved = self.saved_values(self.FOCUS_FIELDS, fields)
+        in_focus = FocusEntry.score_for(saved['priority'], saved['due_date'], saved['date_closed'], today) is not None
+        if self._state.adding:
+            return in_focus
+        loaded = self.loaded_values
+        if not set(self.FOCUS_FIELDS) <= loaded.keys():
+            return True
+        if all(loaded[name] == saved[name] for name in self.FOCUS_FIELDS):
+            return False
+        return in_focus or FocusEntry.score_for(loaded['priority'], loaded['due_date'], loaded['date_closed'], today) is not None
 
     def clean(self):
         if self.failed and self.date_closed == None:
@@ -81,6 +876,714 @@ class Task(models.Model):
         
         super().clean()
 
+    def save(self, *args, **kwargs):
+        self.full_clean()
+        # the fields the caller saves; the maintained ones left out of full saves aren't tracked
+        fields = kwargs.get('update_fields')
+        _skip_maintained_fields(self, kwargs)
+        using = kwargs.get('using')
+        today = timezone.localdate()
+        with transaction.atomic(using=using), SyncRecord.objects.using(using).deferred():
+            deltas = Task.objects.using(using).task_counter_deltas([self], fields=fields)
+            focus_stale = self.focus_stale(today, fields)
+            changes = TaskHistory.objects.changes([self], fields)
+            metric_days = self.metric_days(today, fields=fields)
+            super().save(*args, **kwargs)
+            TodoList.objects.using(using).apply_task_deltas(deltas)
+            if focus_stale:
+                # the entry follows the row as written, not the unsaved values in memory
+                task = self if fields is None else Task.objects.using(using).get(pk=self.pk)
+                FocusEntry.objects.using(using).refresh([task], today)
+            TaskHistory.objects.using(using).record(changes)
+            MetricsDirtyDay.objects.using(using).mark(metric_days)
+        self.remember_state(fields)
+
+
+class FocusEntryQuerySet(models.QuerySet):
+    def for_account(self, account):
+        return self.filter(account=account).order_by('-score', 'due_date', 'task_id')
+
+    def refresh(self, tasks, today=None):
+        """Brings the entries of `tasks` in line with their current state, in at most three queries."""
+        if not tasks:
+            return
+        today = today or timezone.localdate()
+        scores = {task.pk: FocusEntry.score_for(task.priority, task.due_date, task.date_closed, today) for task in tasks}
+
+        dropped = [pk for pk, score in scores.items() if score is None]
+        if dropped:
+            self.filter(task_id__in=dropped).delete()
+
+        ranked = [task for task in tasks if scores[task.pk] is not None]
+        if not ranked:
+            return
+        accounts = dict(
+            TodoList.objects.using(self.db)
+            .filter(pk__in={task.todo_list_id for task in ranked})
+            .values_list('pk', 'folder__account_id')
+        )
+        self.bulk_create(
+            [
+                FocusEntry(task_id=task.pk, account_id=accounts[task.todo_list_id], score=scores[task.pk], due_date=task.due_date)
+                for task in ranked
+            ],
+            update_conflicts=True, unique_fields=['task'], update_fields=['account', 'score', 'due_date'],
+        )
+
+    def roll_over(self, account_ids, today=None, batch_size=ValidatedQuerySet.BULK_BATCH_SIZE):
+        """
+        Recomputes the rankings of `account_ids` for `today`: urgency grows as due dates
+        come closer, and tasks entering the horizon join the ranking.
+        """
+        today = today or timezone.localdate()
+        horizon = today + timedelta(days=FocusEntry.HORIZON_DAYS)
+        tasks = (
+            Task.objects.using(self.db).open()
+            .filter(todo_list__folder__account__in=account_ids)
+            .filter(Q(due_date__lte=horizon) | Q(priority=Task.HIGH))
+            .values_list('pk', 'priority', 'due_date', 'todo_list__folder__account_id')
+        )
+        entries = [
+            FocusEntry(task_id=pk, account_id=account_id, score=FocusEntry.score_for(priority, due_date, None, today), due_date=due_date)
+            for pk, priority, due_date, account_id in tasks
+        ]
+        with transaction.atomic(using=self.db):
+            self.filter(account__in=account_ids).delete()
+            self.bulk_create(entries, batch_size=batch_size)
+        return len(entries)
+
+
+class FocusEntry(models.Model):
+    """
+    Materialized Focus ranking: one row per open task that is due within the horizon
+    (overdue included) or of high priority. Kept current by every task write and
+    recomputed daily by `manage.py rollover_focus`, since urgency depends on the date.
+    """
+    HORIZON_DAYS = 7
+    PRIORITY_WEIGHTS = {Task.HIGH: 3, Task.MEDIUM: 2, Task.LOW: 1, Task.NONE: 0}
+    # overdue, due today, due tomorrow, due within the horizon
+    OVERDUE_WEIGHT, TODAY_WEIGHT, TOMORROW_WEIGHT, HORIZON_WEIGHT = 4, 3, 2, 1
+
+    task = models.OneToOneField('Task', on_delete=models.CASCADE, primary_key=True, related_name='focus_entry')
+    # denormalized from task -> todo list -> folder, so that the ranking is read from this table alone
+    account = models.ForeignKey('account.Account', on_delete=models.CASCADE)
+    score = models.PositiveSmallIntegerField()
+    due_date = models.DateField(null=True, blank=True, default=None)
+
+    objects = FocusEntryQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', '-score', 'due_date', 'task'], name='focus_rank_idx'),
+        ]
+
+    @classmethod
+    def score_for(cls, priority, due_date, date_closed, today):
+        """Urgency of a task on `today`, None when the task doesn't belong in focus."""
+        if date_closed is not None:
+            return None
+        days_left = None if due_date is None else (due_date - today).days
+        if days_left is None or days_left > cls.HORIZON_DAYS:
+            if priority != Task.HIGH:
+                return None
+            due_weight = 0
+        elif days_left < 0:
+            due_weight = cls.OVERDUE_WEIGHT
+        elif days_left == 0:
+            due_weight = cls.TODAY_WEIGHT
+        elif days_left == 1:
+            due_weight = cls.TOMORROW_WEIGHT
+        else:
+            due_weight = cls.HORIZON_WEIGHT
+        return due_weight * 10 + cls.PRIORITY_WEIGHTS[priority]
+
+
+class HistoryQuerySet(models.QuerySet):
+    def changes(self, objs, fields=None):
+        """
+        (obj, kind, value) for every history value that saving `objs` writes: values that differ
+        from the loaded ones, or from the field default on creation. Call it before saving.
+        """
+        attnames = None if fields is None else {obj_field.attname for obj_field in (
+            self.model.subject_model()._meta.get_field(name) for name in fields
+        )}
+        changes = []
+        for obj in objs:
+            loaded = obj.loaded_values
+            for kind, name in self.model.KIND_FIELDS.items():
+                if attnames is not None and name not in attnames:
+                    continue
+                value = getattr(obj, name)
+                if obj._state.adding:
+                    changed = value != obj._meta.get_field(name).get_default()
+                else:
+                    # values that weren't loaded can't be compared, they are recorded
+                    changed = name not in loaded or loaded[name] != value
+                if changed:
+                    changes.append((obj, kind, value))
+        return changes
+
+    def record(self, changes, date_changed=None):
+        """Appends `changes` (see `changes()`) once saved, in two queries whatever their number."""
+        if not changes:
+            return []
+        date_changed = date_changed or timezone.now()
+        accounts = dict(
+            self.model.subject_model()._base_manager.using(self.db)
+            .filter(pk__in={obj.pk for obj, kind, value in changes})
+            .values_list('pk', self.model.ACCOUNT_LOOKUP)
+        )
+        return self.bulk_create([
+            self.model(**{
+                f'{self.model.SUBJECT_FIELD}_id': obj.pk,
+                'account_id': accounts[obj.pk],
+                'kind': kind,
+                self.model.KIND_FIELDS[kind]: value,
+                'date_changed': date_changed,
+            })
+            for obj, kind, value in changes
+        ], batch_size=ValidatedQuerySet.BULK_BATCH_SIZE)
+
+    def for_account(self, account, since=None, until=None):
+        """Date bounds let Postgres skip the partitions outside of them."""
+        queryset = self.filter(account=account)
+        if since is not None:
+            queryset = queryset.filter(date_changed__gte=since)
+        if until is not None:
+            queryset = queryset.filter(date_changed__lt=until)
+        return queryset.order_by('date_changed', 'pk')
+
+
+class History(models.Model):
+    """
+    Append-only log of priority and due date changes, one narrow row per changed value,
+    written in the transaction of the change. On Postgres the tables are range partitioned
+    by month on date_changed (see `manage.py create_history_partitions`), which is also why
+    the foreign keys have no database constraint: they are enforced by the ORM only.
+    """
+    PRIORITY = 1
+    DUE_DATE = 2
+    KIND_CHOICES = [
+        (PRIORITY, "Priority"),
+        (DUE_DATE, "Due date"),
+    ]
+    KIND_FIELDS = {PRIORITY: 'priority', DUE_DATE: 'due_date'}
+
+    kind = models.PositiveSmallIntegerField(choices=KIND_CHOICES)
+    # the new value, in the column of its kind
+    priority = models.CharField(max_length=1, null=True, blank=True, default=None)
+    due_date = models.DateField(null=True, blank=True, default=None)
+    date_changed = models.DateTimeField(default=timezone.now)
+    # db_index=False: the composite indexes of the concrete tables lead with the foreign keys
+    account = models.ForeignKey('account.Account', on_delete=models.CASCADE, db_constraint=False, db_index=False, related_name='+')
+
+    objects = HistoryQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def subject_model(cls):
+        return cls._meta.get_field(cls.SUBJECT_FIELD).related_model
+
+
+class TaskHistory(History):
+    SUBJECT_FIELD = 'task'
+    ACCOUNT_LOOKUP = 'todo_list__folder__account_id'
+
+    task = models.ForeignKey('Task', on_delete=models.CASCADE, db_constraint=False, db_index=False, related_name='history')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['task', 'date_changed'], name='taskhistory_task_idx'),
+            models.Index(fields=['account', 'date_changed'], name='taskhistory_account_idx'),
+        ]
+
+
+class TodoListHistory(History):
+    SUBJECT_FIELD = 'todo_list'
+    ACCOUNT_LOOKUP = 'folder__account_id'
+
+    todo_list = models.ForeignKey('TodoList', on_delete=models.CASCADE, db_constraint=False, db_index=False, related_name='history')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['todo_list', 'date_changed'], name='todolisthistory_list_idx'),
+            models.Index(fields=['account', 'date_changed'], name='todolisthistory_account_idx'),
+        ]
+
+
+class TimerQuerySet(models.QuerySet):
+    def running(self):
+        return self.filter(date_stopped__isnull=True)
+
+    def start(self, task, account, now=None):
+        """
+        Starts a timer on `task`, owned by `account`: a single INSERT. The caller has
+        just loaded the task for the account, so the relations aren't looked up again.
+        """
+        timer = Timer(task_id=task.pk, account_id=getattr(account, 'pk', account), date_started=now or timezone.now())
+        timer.clean_fields(exclude=['task', 'account'])
+        try:
+            with transaction.atomic(using=self.db):
+                self.bulk_create([timer])
+        except IntegrityError:
+            raise ValidationError("the task already has a running timer")
+        return timer
+
+    def stop(self, task, now=None):
+        """
+        Stops the running timer of `task` and adds its duration to the task's `time_spent`
+        and to the list's daily rollups. Returns the timer, or None if none was running.
+        """
+        now = now or timezone.now()
+        with transaction.atomic(using=self.db):
+            timer = (
+                self.select_for_update(of=('self',)).filter(task=task).running()
+                .annotate(todo_list_id=F('task__todo_list_id')).first()
+            )
+            if timer is None:
+                return None
+            timer.date_stopped = max(now, timer.date_started)
+            self.filter(pk=timer.pk).update(date_stopped=timer.date_stopped)
+
+            Task.objects.using(self.db).filter(pk=timer.task_id).update(time_spent=F('time_spent') + timer.duration())
+            # a raw update, which the receivers don't see: the list's date_updated (its ETag)
+            # and the sync records are moved here, the counter locked last
+            TodoList.objects.using(self.db).apply_task_deltas({timer.todo_list_id: {}})
+            SyncRecord.objects.using(self.db).record(timer.account_id, [
+                (SyncRecord.LABELS[Task], timer.task_id, False), (SyncRecord.LABELS[TodoList], timer.todo_list_id, False),
+            ])
+            for day, seconds in timer.seconds_per_day().items():
+                TimeRollup.objects.using(self.db).add(timer.account_id, timer.todo_list_id, day, seconds)
+        return timer
+
+
+class Timer(models.Model):
+    """A stretch of time spent on a task, running while date_stopped is empty."""
+    task = models.ForeignKey('Task', on_delete=models.CASCADE, related_name='timers')
+    # denormalized from task -> todo list -> folder, so that running timers are found by account
+    account = models.ForeignKey('account.Account', on_delete=models.CASCADE)
+    date_started = models.DateTimeField(default=timezone.now)
+    date_stopped = models.DateTimeField(null=True, blank=True, default=None)
+
+    objects = TimerQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account'], condition=Q(date_stopped__isnull=True), name='timer_running_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['task'], condition=Q(date_stopped__isnull=True), name='timer_one_running_per_task'),
+        ]
+
+    def clean(self):
+        if self.date_stopped is not None and self.date_stopped < self.date_started:
+            raise ValidationError("a timer can't stop before it started")
+
+    def save(self, *args, **kwargs):
+        self.full_clean()
+        super().save(*args, **kwargs)
+
+    def duration(self, now=None):
+        """Seconds elapsed, up to `now` while the timer is running."""
+        return int(((self.date_stopped or now or timezone.now()) - self.date_started).total_seconds())
+
+    def seconds_per_day(self):
+        """The duration split at local midnights: {date: seconds}."""
+        start, end = timezone.localtime(self.date_started), timezone.localtime(self.date_stopped)
+        days = {}
+        while start < end:
+            midnight = timezone.make_aware(datetime.combine(start.date() + timedelta(days=1), time.min))
+            until = min(midnight, end)
+            days[start.date()] = days.get(start.date(), 0) + int((until - start).total_seconds())
+            start = until
+        return days
+
+
+class TimeRollupQuerySet(models.QuerySet):
+    def add(self, account_id, todo_list_id, day, seconds):
+        """Adds `seconds` to a rollup row, creating it the first time."""
+        rollup = self.filter(todo_list_id=todo_list_id, day=day)
+        if rollup.update(seconds=F('seconds') + seconds):
+            return
+        try:
+            with transaction.atomic(using=self.db):
+                self.bulk_create([TimeRollup(account_id=account_id, todo_list_id=todo_list_id, day=day, seconds=seconds)])
+        except IntegrityError:
+            # created concurrently in the meantime
+            rollup.update(seconds=F('seconds') + seconds)
+
+    def for_account(self, account, since=None, until=None):
+        queryset = self.filter(account=account)
+        if since is not None:
+            queryset = queryset.filter(day__gte=since)
+        if until is not None:
+            queryset = queryset.filter(day__lt=until)
+        return queryset
+
+    def per_day(self):
+        return self.order_by('day').values('day').annotate(seconds=Sum('seconds'))
+
+    def per_todo_list(self):
+        return self.order_by('todo_list').values('todo_list').annotate(seconds=Sum('seconds'))
+
+
+class TimeRollup(models.Model):
+    """
+    Seconds of stopped timers per todo list and local day, added by TimerQuerySet.stop():
+    the Performance tab sums these few rows instead of every timer. Time stays with the
+    list the task belonged to when the timer ran.
+    """
+    # both covered by the indexes below
+    account = models.ForeignKey('account.Account', on_delete=models.CASCADE, db_index=False)
+    todo_list = models.ForeignKey('TodoList', on_delete=models.CASCADE, related_name='time_rollups', db_index=False)
+    day = models.DateField()
+    seconds = models.PositiveIntegerField(default=0)
+
+    objects = TimeRollupQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', 'day'], name='timerollup_account_day_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['todo_list', 'day'], name='timerollup_unique_list_day'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.full_clean()
+        super().save(*args, **kwargs)
+
+
+class HabitQuerySet(ValidatedQuerySet):
+    def due(self, today):
+        return self.filter(active=True, next_due__lte=today)
+
+    def spawn_due(self, today=None, batch_size=ValidatedQuerySet.BULK_BATCH_SIZE):
+        """
+        Spawns the current occurrence of up to `batch_size` due habits: one query finds them
+        (with their previous task), one skips periods already spawned and the clones go
+        through `bulk_create_validated()`. Missed periods aren't caught up on. Returns the
+        number of habits handled, call it until that's lower than `batch_size`.
+        """
+        today = today or timezone.localdate()
+        with transaction.atomic(using=self.db):
+            # concurrent schedulers skip each other's habits instead of waiting for them
+            habits = list(
+                self.select_for_update(skip_locked=True, of=('self',)).due(today)
+                .select_related('task').order_by('next_due', 'pk')[:batch_size]
+            )
+            if not habits:
+                return 0
+
+            periods = {habit.pk: Habit.period_start(habit.period, today) for habit in habits}
+            spawned = set(
+                Task.objects.using(self.db)
+                .filter(habit__in=habits, habit_period__in=set(periods.values()))
+                .values_list('habit_id', 'habit_period')
+            )
+            clones = [
+                habit.clone_task(periods[habit.pk]) for habit in habits
+                if habit.task is not None and (habit.pk, periods[habit.pk]) not in spawned
+            ]
+            Task.objects.using(self.db).bulk_create_validated(clones)
+
+            # one UPDATE per period kind rather than bulk_update()'s CASE per row: habits of a
+            # kind share their period, and their occurrence of it is found by the unique index
+            for period, start in {habit.period: periods[habit.pk] for habit in habits}.items():
+                occurrence = Task.objects.filter(habit=OuterRef('pk'), habit_period=start).values('pk')[:1]
+                self.filter(pk__in=[habit.pk for habit in habits if habit.period == period]).update(
+                    task=Coalesce(Subquery(occurrence), F('task')),
+                    next_due=Habit.next_period_start(period, start),
+                )
+            # nothing left to clone
+            self.filter(pk__in=[habit.pk for habit in habits if habit.task is None]).update(active=False)
+        return len(habits)
+
+
+class Habit(models.Model):
+    """
+    A task repeated every period: each occurrence is a clone of the previous one,
+    spawned by `manage.py spawn_habits` once `next_due` is reached.
+    """
+    DAILY = 'd'
+    WEEKLY = 'w'
+    MONTHLY = 'm'
+    PERIOD_CHOICES = [
+        (DAILY, "Daily"),
+        (WEEKLY, "Weekly"),
+        (MONTHLY, "Monthly"),
+    ]
+
+    period = models.CharField(max_length=1, choices=PERIOD_CHOICES)
+    # the latest occurrence, cloned into the next one
+    task = models.ForeignKey('Task', on_delete=models.SET_NULL, null=True, blank=True, default=None, related_name='+')
+    next_due = models.DateField()
+    active = models.BooleanField(default=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    objects = HabitQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_due'], condition=Q(active=True), name='habit_due_idx'),
+        ]
+
+    CLONED_FIELDS = ['name', 'priority', 'todo_list_id', 'note_id', 'parent_task_id']
+
+    @classmethod
+    def period_start(cls, period, day):
+        if period == cls.WEEKLY:
+            return day - timedelta(days=day.weekday())
+        if period == cls.MONTHLY:
+            return month_start(day)
+        return day
+
+    @classmethod
+    def next_period_start(cls, period, start):
+        if period == cls.WEEKLY:
+            return start + timedelta(days=7)
+        if period == cls.MONTHLY:
+            return month_start(start, 1)
+        return start + timedelta(days=1)
+
+    @classmethod
+    def start_from(cls, task, period, today=None):
+        """Turns `task` into the current occurrence of a new habit."""
+        today = today or timezone.localdate()
+        start = cls.period_start(period, today)
+        with transaction.atomic():
+            habit = cls.objects.create(task=task, period=period, next_due=cls.next_period_start(period, start))
+            task.habit, task.habit_period = habit, start
+            task.save(update_fields=['habit', 'habit_period'])
+        return habit
+
+    def clone_task(self, period_start):
+        """The occurrence of the period starting on `period_start`, due on the period's last day."""
+        return Task(
+            **{name: getattr(self.task, name) for name in self.CLONED_FIELDS},
+            due_date=self.next_period_start(self.period, period_start) - timedelta(days=1),
+            habit_id=self.pk,
+            habit_period=period_start,
+        )
+
     def save(self, *args, **kwargs):
         self.full_clean()
         super().save(*args, **kwargs)
+
+
+class MetricsDirtyDayQuerySet(models.QuerySet):
+    def mark(self, days):
+        """Flags `days` for `DailyMetrics.objects.refresh()`, a single INSERT whatever their number."""
+        if days:
+            self.bulk_create([MetricsDirtyDay(day=day) for day in days], ignore_conflicts=True)
+
+
+class MetricsDirtyDay(models.Model):
+    """A day whose DailyMetrics rows are out of date, for every account: task writes only flag it."""
+    day = models.DateField(primary_key=True)
+
+    objects = MetricsDirtyDayQuerySet.as_manager()
+
+
+class DailyMetricsQuerySet(models.QuerySet):
+    def refresh(self, days):
+        """Recomputes the rows of `days` from the tasks, with two grouped queries per day."""
+        for day in days:
+            start = timezone.make_aware(datetime.combine(day, time.min))
+            end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+            tasks = Task.objects.using(self.db).order_by().values(account_id=F('todo_list__folder__account'))
+            rows = {}
+
+            created = tasks.filter(date_created__gte=start, date_created__lt=end).annotate(count=Count('pk'))
+            for row in created:
+                rows[row['account_id']] = DailyMetrics(account_id=row['account_id'], day=day, created=row['count'])
+
+            closed = tasks.filter(date_closed=day).annotate(
+                closed=Count('pk'),
+                failed=Count('pk', filter=Q(failed=True)),
+                closed_with_due_date=Count('pk', filter=Q(due_date__isnull=False)),
+                closed_on_time=Count('pk', filter=Q(due_date__gte=F('date_closed'))),
+                # a task may be closed before the day it was created: it counts as no lead time
+                lead_time=Sum(Greatest(
+                    F('date_closed') - TruncDate('date_created'), Value(timedelta(0), output_field=DurationField()),
+                )),
+            )
+            for row in closed:
+                metrics = rows.setdefault(row['account_id'], DailyMetrics(account_id=row['account_id'], day=day))
+                for name in ['closed', 'failed', 'closed_with_due_date', 'closed_on_time']:
+                    setattr(metrics, name, row[name])
+                metrics.lead_time_days = row['lead_time'].days
+
+            with transaction.atomic(using=self.db):
+                self.filter(day=day).delete()
+                self.bulk_create(rows.values(), batch_size=ValidatedQuerySet.BULK_BATCH_SIZE)
+
+    def refresh_dirty(self, batch_size=100):
+        """Refreshes up to `batch_size` flagged days, returns how many."""
+        with transaction.atomic(using=self.db):
+            # a day flagged again while it's being refreshed stays flagged: the flag is only
+            # removed under the lock taken here, before the tasks are read
+            dirty = MetricsDirtyDay.objects.using(self.db).select_for_update(skip_locked=True).order_by('day')
+            days = list(dirty.values_list('day', flat=True)[:batch_size])
+            MetricsDirtyDay.objects.using(self.db).filter(day__in=days).delete()
+            self.refresh(days)
+        return len(days)
+
+
+class DailyMetrics(models.Model):
+    """
+    Per account and day: tasks created, and tasks closed with their outcome. The Performance
+    tab aggregates these rows (see core.metrics) instead of the tasks themselves; they are
+    recomputed from the tasks for every day flagged in MetricsDirtyDay.
+    """
+    account = models.ForeignKey('account.Account', on_delete=models.CASCADE, db_index=False)
+    day = models.DateField()
+    created = models.PositiveIntegerField(default=0)
+    closed = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    closed_with_due_date = models.PositiveIntegerField(default=0)
+    closed_on_time = models.PositiveIntegerField(default=0)
+    # sum over the closed tasks of the days between creation and closing
+    lead_time_days = models.PositiveIntegerField(default=0)
+
+    objects = DailyMetricsQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'day'], name='dailymetrics_unique_account_day'),
+        ]
+
+
+class FolderDeletionQuerySet(models.QuerySet):
+    def pending(self):
+        return self.filter(date_finished__isnull=True)
+
+    def claimable(self, now=None):
+        """Pending deletions no worker is on: never claimed, or not heard of for CLAIM_TIMEOUT."""
+        stale = (now or timezone.now()) - FolderDeletion.CLAIM_TIMEOUT
+        return self.pending().filter(Q(date_claimed__isnull=True) | Q(date_claimed__lt=stale))
+
+
+class FolderDeletion(models.Model):
+    """
+    A folder subtree being deleted in the background by core.deletion, batch by batch.
+    `deleted` counts the rows removed so far per model label; `folder` turns NULL once
+    the folder itself is gone.
+    """
+    CLAIM_TIMEOUT = timedelta(minutes=5)
+
+    account = models.ForeignKey('account.Account', on_delete=models.CASCADE)
+    folder = models.ForeignKey('Folder', on_delete=models.SET_NULL, null=True, related_name='+')
+    deleted = models.JSONField(default=dict)
+    date_created = models.DateTimeField(auto_now_add=True)
+    # refreshed after every batch, so a crashed worker's deletion gets picked up again
+    date_claimed = models.DateTimeField(null=True, default=None)
+    date_finished = models.DateTimeField(null=True, default=None)
+
+    objects = FolderDeletionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_created'], condition=Q(date_finished__isnull=True), name='folderdeletion_pending_idx'),
+        ]
+
+
+class SyncCounterQuerySet(models.QuerySet):
+    def advance(self, account_id, count):
+        """
+        Hands out the account's next `count` sequence numbers and returns the last one. The
+        counter row stays locked until the transaction commits, so numbers commit in order.
+        """
+        if not self.filter(account_id=account_id).update(sequence=F('sequence') + count):
+            # the account's first change; a concurrent first change conflicts on the primary key
+            self.bulk_create([SyncCounter(account_id=account_id)], ignore_conflicts=True)
+            self.filter(account_id=account_id).update(sequence=F('sequence') + count)
+        return self.filter(account_id=account_id).values_list('sequence', flat=True).get()
+
+
+class SyncCounter(models.Model):
+    """The last change sequence number handed out to an account."""
+    account = models.OneToOneField('account.Account', on_delete=models.CASCADE, primary_key=True, related_name='+')
+    sequence = models.BigIntegerField(default=0)
+
+    objects = SyncCounterQuerySet.as_manager()
+
+
+# per thread and database alias: the records held back by SyncRecordQuerySet.deferred()
+_deferred_records = threading.local()
+
+
+class SyncRecordQuerySet(models.QuerySet):
+    def record(self, account_id, entries):
+        """
+        Numbers the changes in `entries`, (model label, pk, deleted) triples, with the account's
+        next sequence numbers. Each object keeps a single record, of its latest change.
+        """
+        pending = getattr(_deferred_records, self.db, None)
+        if pending is not None:
+            pending.setdefault(account_id, []).extend(entries)
+            return
+        latest = {(label, pk): deleted for label, pk, deleted in entries}
+        if not latest:
+            return
+        with transaction.atomic(using=self.db, savepoint=False):
+            first = SyncCounter.objects.using(self.db).advance(account_id, len(latest)) - len(latest) + 1
+            records = [
+                SyncRecord(account_id=account_id, model=label, object_id=pk, deleted=deleted, sequence=first + n)
+                for n, ((label, pk), deleted) in enumerate(latest.items())
+            ]
+            self.bulk_create(
+                records, update_conflicts=True, unique_fields=['account', 'model', 'object_id'],
+                update_fields=['sequence', 'deleted'],
+            )
+
+    @contextmanager
+    def deferred(self):
+        """
+        Holds back the records made in the block and makes them when it ends, so the account's
+        counter row is locked after every other row the block writes. Writes that lock their
+        rows in different orders would otherwise deadlock on it: a task save locks the task,
+        then its todo list, while a todo list save locks the list, then the counter.
+        Nested blocks leave the recording to the outermost one; use inside the transaction.
+        """
+        if getattr(_deferred_records, self.db, None) is not None:
+            yield
+            return
+        pending = {}
+        setattr(_deferred_records, self.db, pending)
+        try:
+            yield
+        finally:
+            delattr(_deferred_records, self.db)
+        for account_id, entries in pending.items():
+            self.record(account_id, entries)
+
+    def since(self, account, sequence):
+        return self.filter(account=account, sequence__gt=sequence).order_by('sequence')
+
+
+class SyncRecord(models.Model):
+    """
+    The latest change to a folder, note, todo list or task, numbered by its account's change
+    sequence: the changes since a sync token are one range scan of syncrecord_sequence_idx.
+    Deleted objects keep their record as a tombstone.
+    """
+    LABELS = {Folder: 'folder', Note: 'note', TodoList: 'todo_list', Task: 'task'}
+
+    account = models.ForeignKey('account.Account', on_delete=models.CASCADE, related_name='+')
+    model = models.CharField(max_length=16, choices=[(label, label) for label in LABELS.values()])
+    object_id = models.BigIntegerField()
+    sequence = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+
+    objects = SyncRecordQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'model', 'object_id'], name='syncrecord_object_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['account', 'sequence'], name='syncrecord_sequence_idx'),
+        ]
@@ -0,0 +1,108 @@
+"""
+Keyset (cursor) pagination: a page starts right after the last row of the previous one,
+so every page is one range scan of the listing's index, however deep it is.
+
+An ordering is a list of field (or annotation) names, `-` for descending, ending with
+the primary key so that it's total. NULLs sort last ascending and first descending,
+Postgres' defaults, which the listing indexes are built with.
+"""
+import base64
+import binascii
+import json
+from datetime import date
+
+from django.db.models import F, Q
+
+PAGE_LIMIT = 50
+PAGE_MAX_LIMIT = 200
+
+
+def encode_cursor(values):
+    """Opaque cursor from the ordering values of a page's last row."""
+    raw = json.dumps(values, default=lambda value: value.isoformat() if isinstance(value, date) else str(value))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise ValueError('malformed cursor')
+    if not isinstance(values, list):
+        raise ValueError('malformed cursor')
+    return values
+
+
+def order_by(ordering):
+    return [
+        F(name[1:]).desc(nulls_first=True) if name.startswith('-') else F(name).asc(nulls_last=True)
+        for name in ordering
+    ]
+
+
+def output_field(queryset, name):
+    if name in queryset.query.annotations:
+        return queryset.query.annotations[name].output_field
+    return queryset.model._meta.get_field(name)
+
+
+def after(queryset, ordering, values):
+    """Rows of `queryset` that come after `values` in `ordering`; ValueError if they don't match it."""
+    if len(values) != len(ordering):
+        raise ValueError('malformed cursor')
+
+    condition, equal, bound = Q(pk__in=[]), Q(), Q()
+    for position, (name, value) in enumerate(zip(ordering, values)):
+        descending, name = name.startswith('-'), name.lstrip('-')
+        field = output_field(queryset, name)
+        try:
+            value = None if value is None else field.to_python(value)
+        except Exception:
+            raise ValueError('malformed cursor')
+        if value is None and not field.null:
+            raise ValueError('malformed cursor')
+
+        if value is None:
+            # nulls are last ascending (nothing comes after them) and first descending
+            further = Q(**{f'{name}__isnull': False}) if descending else Q(pk__in=[])
+            same = Q(**{f'{name}__isnull': True})
+        else:
+            further = Q(**{f'{name}__{"lt" if descending else "gt"}': value})
+            if field.null and not descending:
+                further |= Q(**{f'{name}__isnull': True})
+            same = Q(**{name: value})
+        if position == 0 and value is not None:
+            # bounds the index range scan on the leading key, which the OR below hides from some planners
+            bound = Q(**{f'{name}__{"lte" if descending else "gte"}': value})
+            if field.null and not descending:
+                bound |= Q(**{f'{name}__isnull': True})
+        condition |= equal & further
+        equal &= same
+    return queryset.filter(bound, condition)
+
+
+def paginate(queryset, ordering, cursor=None, limit=PAGE_LIMIT):
+    """
+    (rows, next cursor) of the page after `cursor`, in a single query; the next cursor is
+    None on the last page. ValueError for a cursor that wasn't issued for `ordering`.
+    """
+    return page(list(page_rows(queryset, ordering, cursor, limit)), ordering, limit)
+
+
+async def apaginate(queryset, ordering, cursor=None, limit=PAGE_LIMIT):
+    """paginate() for async views."""
+    return page([row async for row in page_rows(queryset, ordering, cursor, limit)], ordering, limit)
+
+
+def page_rows(queryset, ordering, cursor, limit):
+    if cursor:
+        queryset = after(queryset, ordering, decode_cursor(cursor))
+    # one extra row tells whether there's a next page
+    return queryset.order_by(*order_by(ordering))[:limit + 1]
+
+
+def page(rows, ordering, limit):
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor([getattr(rows[-1], name.lstrip('-')) for name in ordering])
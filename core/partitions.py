@@ -0,0 +1,74 @@
+"""
+Monthly range partitions of the Postgres history tables. Every partitioned table has a
+DEFAULT partition catching rows no monthly partition covers yet: creating a month moves
+its rows out of it, so running `create_history_partitions` late loses nothing.
+"""
+from datetime import date
+
+from django.db import transaction
+
+PARTITION_KEY = 'date_changed'
+
+
+def month_start(day, offset=0):
+    month = day.month - 1 + offset
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(table, start):
+    return f'{table}_y{start.year}m{start.month:02d}'
+
+
+def default_partition_name(table):
+    return f'{table}_default'
+
+
+def create_partitioned_table(schema_editor, model):
+    """
+    CREATE TABLE for `model` partitioned by month. The primary key of a partitioned
+    table has to include the partition key, so it becomes (id, date_changed).
+    """
+    quote_name = schema_editor.quote_name
+    columns, params = [f'{quote_name(model._meta.pk.column)} bigserial NOT NULL'], []
+    for field in model._meta.local_fields:
+        if field.primary_key:
+            continue
+        definition, field_params = schema_editor.column_sql(model, field)
+        columns.append(f'{quote_name(field.column)} {definition}')
+        params.extend(field_params or [])
+
+    table = model._meta.db_table
+    schema_editor.execute(
+        f'CREATE TABLE {quote_name(table)} ({", ".join(columns)}, '
+        f'PRIMARY KEY ({quote_name(model._meta.pk.column)}, {quote_name(PARTITION_KEY)})) '
+        f'PARTITION BY RANGE ({quote_name(PARTITION_KEY)})',
+        params or None,
+    )
+    schema_editor.execute(f'CREATE TABLE {quote_name(default_partition_name(table))} PARTITION OF {quote_name(table)} DEFAULT')
+
+
+def create_monthly_partitions(connection, table, months_ahead, today):
+    """Creates the missing partitions of `table` from `today`'s month through `months_ahead` months later."""
+    quote_name = connection.ops.quote_name
+    existing = set(connection.introspection.table_names())
+    created = []
+    for offset in range(months_ahead + 1):
+        start, end = month_start(today, offset), month_start(today, offset + 1)
+        name = partition_name(table, start)
+        if name in existing:
+            continue
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(f'CREATE TABLE {quote_name(name)} (LIKE {quote_name(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+            cursor.execute(
+                f'WITH moved AS (DELETE FROM {quote_name(default_partition_name(table))} '
+                f'WHERE {quote_name(PARTITION_KEY)} >= %s AND {quote_name(PARTITION_KEY)} < %s RETURNING *) '
+                f'INSERT INTO {quote_name(name)} SELECT * FROM moved',
+                [start, end],
+            )
+            # partition bounds can't be query parameters, the dates are formatted by us
+            cursor.execute(
+                f"ALTER TABLE {quote_name(table)} ATTACH PARTITION {quote_name(name)} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            )
+        created.append(name)
+    return created
@@ -0,0 +1,121 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import cache, changes
+from .models import Folder, MetricsDirtyDay, Note, SyncRecord, TodoList, Task
+from .signals import bulk_saved
+
+
+@receiver(post_delete, sender=Task)
+def update_task_counters_on_delete(sender, instance, using, origin=None, **kwargs):
+    # the list itself is being deleted, there's nothing left to count
+    if isinstance(origin, TodoList) and origin.pk == instance.todo_list_id:
+        return
+
+    deltas = Task.objects.using(using).task_counter_deltas([instance], deleted=True)
+    TodoList.objects.using(using).apply_task_deltas(deltas)
+
+
+@receiver(post_delete, sender=Task)
+def mark_metrics_dirty_on_delete(sender, instance, using, **kwargs):
+    today = timezone.localdate()
+    MetricsDirtyDay.objects.using(using).mark(instance.metric_days(today, deleted=True))
+
+
+# workspace cache invalidation: which cached sections a write to each model affects
+CACHED_SECTIONS = {
+    Folder: ['folders'],
+    Note: ['notes'],
+    TodoList: ['todo_lists'],
+    # task writes move the counters shown in the todo list summaries
+    Task: ['todo_lists'],
+}
+
+# deletes cascade: these cover everything their cascade can remove
+DELETED_SECTIONS = {
+    Folder: cache.SECTIONS,
+    Note: ['notes', 'todo_lists'],
+    TodoList: ['todo_lists'],
+    Task: ['todo_lists'],
+}
+
+
+def owners(model, objs):
+    """(obj, id of the account owning it) pairs, with at most one query."""
+    if model is Folder:
+        return [(obj, obj.account_id) for obj in objs]
+    if model in (Note, TodoList):
+        accounts = Folder.objects.filter(pk__in={obj.folder_id for obj in objs}).values_list('pk', 'account_id')
+        key = 'folder_id'
+    else:
+        accounts = TodoList.objects.filter(pk__in={obj.todo_list_id for obj in objs}).values_list('pk', 'folder__account_id')
+        key = 'todo_list_id'
+    accounts = dict(accounts)
+    return [(obj, accounts.get(getattr(obj, key))) for obj in objs]
+
+
+def sync_entries(model, objs, deleted):
+    label = SyncRecord.LABELS[model]
+    entries = [(label, obj.pk, deleted) for obj in objs]
+    if model is Task:
+        # task writes move their list's counters and date_updated
+        entries += [(SyncRecord.LABELS[TodoList], obj.todo_list_id, False) for obj in objs]
+    return entries
+
+
+def origin_account(origin):
+    """The account owning the object a delete started from, looked up once per delete."""
+    if '_origin_account_id' not in origin.__dict__:
+        [(_, origin.__dict__['_origin_account_id'])] = owners(type(origin), [origin])
+    return origin.__dict__['_origin_account_id']
+
+
+def workspace_changed(model, objs, sections, deleted=False, using='default', account_id=None):
+    """
+    Invalidates the cached `sections` of the accounts owning `objs` (all owned by `account_id`
+    when given), numbers the changes for incremental sync and publishes them to the change feed.
+    """
+    by_account = {}
+    for obj, owner_id in owners(model, objs) if account_id is None else [(obj, account_id) for obj in objs]:
+        if owner_id is not None:
+            by_account.setdefault(owner_id, []).append(obj)
+    for account_id, account_objs in by_account.items():
+        if sections:
+            cache.invalidate(account_id, sections)
+        SyncRecord.objects.using(using).record(account_id, sync_entries(model, account_objs, deleted))
+        changes.publish(account_id, [changes.change(obj, deleted) for obj in account_objs], using=using)
+
+
+# connected per model: a post_delete receiver for every sender would disable fast deletes everywhere
+@receiver(post_save, sender=Folder)
+@receiver(post_save, sender=Note)
+@receiver(post_save, sender=TodoList)
+@receiver(post_save, sender=Task)
+def workspace_changed_on_save(sender, instance, using, **kwargs):
+    workspace_changed(sender, [instance], CACHED_SECTIONS[sender], using=using)
+
+
+@receiver(post_delete, sender=Folder)
+@receiver(post_delete, sender=Note)
+@receiver(post_delete, sender=TodoList)
+@receiver(post_delete, sender=Task)
+def workspace_changed_on_delete(sender, instance, using, origin=None, **kwargs):
+    if origin is not instance and isinstance(origin, (*DELETED_SECTIONS, get_user_model())):
+        # tasks deleted with a note or their parent task can sit in any list, which clients
+        # can't tell: they get tombstones, and their lists records for the counters that moved.
+        # The origin's own receiver invalidates the cache for them.
+        if sender is Task and isinstance(origin, (Note, Task)):
+            workspace_changed(Task, [instance], [], deleted=True, using=using, account_id=origin_account(origin))
+        # otherwise the cascade is covered by the origin's receiver, and clients drop
+        # a deleted folder or list along with its contents
+        return
+
+    workspace_changed(sender, [instance], DELETED_SECTIONS[sender], deleted=True, using=using)
+
+
+@receiver(bulk_saved)
+def workspace_changed_in_bulk(sender, objs, using, **kwargs):
+    if sender in CACHED_SECTIONS and objs:
+        workspace_changed(sender, objs, CACHED_SECTIONS[sender], using=using)
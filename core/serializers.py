@@ -0,0 +1,52 @@
+"""
+Plain dict serializers for the JSON API. Encrypted fields are passed through as-is:
+the server never sees plaintext.
+"""
+FOLDER_FIELDS = ['id', 'name', 'parent_id', 'path']
+NOTE_HEADER_FIELDS = ['id', 'name', 'pinned', 'date_created', 'date_updated', 'folder_id']
+TODO_LIST_FIELDS = [
+    'id', 'name', 'priority', 'due_date', 'date_created', 'date_updated', 'folder_id',
+    'tasks_total', 'tasks_open', 'tasks_closed', 'tasks_failed',
+]
+TASK_FIELDS = [
+    'id', 'name', 'priority', 'failed', 'date_created', 'due_date', 'date_closed',
+    'parent_task_id', 'note_id', 'note_position', 'todo_list_id', 'time_spent',
+]
+TIMER_FIELDS = ['id', 'task_id', 'date_started', 'date_stopped']
+FOLDER_DELETION_FIELDS = ['id', 'folder_id', 'deleted', 'date_created', 'date_finished']
+
+
+def serialize(obj, fields):
+    return {field: getattr(obj, field) for field in fields}
+
+
+def serialize_folder(folder):
+    return serialize(folder, FOLDER_FIELDS)
+
+
+def serialize_note_header(note):
+    return serialize(note, NOTE_HEADER_FIELDS)
+
+
+def serialize_note(note):
+    return {**serialize_note_header(note), 'content': note.content}
+
+
+def serialize_todo_list(todo_list):
+    return serialize(todo_list, TODO_LIST_FIELDS)
+
+
+def serialize_task(task):
+    return serialize(task, TASK_FIELDS)
+
+
+def serialize_task_tree(task):
+    return {**serialize_task(task), 'depth': task.depth, 'children': [serialize_task_tree(child) for child in task.children]}
+
+
+def serialize_timer(timer):
+    return serialize(timer, TIMER_FIELDS)
+
+
+def serialize_folder_deletion(deletion):
+    return serialize(deletion, FOLDER_DELETION_FIELDS)
@@ -0,0 +1,4 @@
+from django.dispatch import Signal
+
+# sent by the validated bulk writes, which skip post_save; `fields` is None for inserts
+bulk_saved = Signal()
@@ -0,0 +1,736 @@
+from asgiref.sync import sync_to_async
+from django.test import AsyncClient, TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import changes
+from ..models import FocusEntry, Folder, Note, NoteBlock, SyncCounter, TodoList, Task, Timer
+from .long_test_strings import note_content, encrypted_name
+
+from datetime import timedelta
+from io import StringIO
+import json
+
+
+class TestWorkspaceApi(TestCase):
+    def setUp(self):
+        cache.clear()
+
+        # account setup
+        email = 'test@TeSt.com'
+        password = 'password123'
+        username = 'testname'
+        self.account = get_user_model().objects.create_user(email=email, username=username, password=password)
+        self.account.is_active = True
+        self.account.save()
+        self.client.force_login(self.account)
+
+        # other account's data must never leak
+        other = get_user_model().objects.create_user(email='other@test.com', username=username, password=password)
+        other.is_active = True
+        other.save()
+        self.other_folder = Folder.objects.create(name=encrypted_name, account=other)
+
+        self.name = encrypted_name
+        self.folder = Folder.objects.create(name=self.name, account=self.account)
+        self.subfolder = Folder.objects.create(name=self.name, account=self.account, parent=self.folder)
+        self.note = Note.objects.create(name=self.name, content=note_content, folder=self.subfolder)
+        self.todo_list = TodoList.objects.create(name=self.name, folder=self.folder)
+        self.task = Task.objects.create(name=self.name, todo_list=self.todo_list)
+
+    def populate(self, count):
+        for _ in range(count):
+            folder = Folder.objects.create(name=self.name, account=self.account, parent=self.folder)
+            Note.objects.create(name=self.name, content=note_content, folder=folder)
+            todo_list = TodoList.objects.create(name=self.name, folder=folder)
+            Task.objects.create(name=self.name, todo_list=todo_list)
+
+    def test_workspace(self):
+        response = self.client.get(reverse('core:workspace'))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([folder['id'] for folder in data['folders']], [self.folder.pk, self.subfolder.pk])
+        self.assertEqual(data['folders'][1]['parent_id'], self.folder.pk)
+        self.assertEqual([note['id'] for note in data['notes']], [self.note.pk])
+        self.assertNotIn('content', data['notes'][0])
+        self.assertEqual(data['todo_lists'][0]['tasks_total'], 1)
+
+    def test_workspace_constant_queries(self):
+        # session, account, three ETag aggregates, folders, notes, todo lists
+        with self.assertNumQueries(8):
+            self.client.get(reverse('core:workspace'))
+        self.populate(10)
+        with self.assertNumQueries(8):
+            response = self.client.get(reverse('core:workspace'))
+        self.assertEqual(len(response.json()['notes']), 11)
+
+    def test_workspace_requires_login(self):
+        self.client.logout()
+        response = self.client.get(reverse('core:workspace'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_note_detail(self):
+        response = self.client.get(reverse('core:note-detail', args=[self.note.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['content'], note_content)
+
+    def test_note_detail_other_account(self):
+        note = Note.objects.create(name=self.name, content=note_content, folder=self.other_folder)
+        response = self.client.get(reverse('core:note-detail', args=[note.pk]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_todo_list_detail(self):
+        subtask = Task.objects.create(name=self.name, todo_list=self.todo_list, parent_task=self.task)
+        # session, account, ETag, todo list, task tree
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('core:todo-list-detail', args=[self.todo_list.pk]))
+        tasks = response.json()['tasks']
+        self.assertEqual([task['id'] for task in tasks], [self.task.pk])
+        self.assertEqual([task['id'] for task in tasks[0]['children']], [subtask.pk])
+
+
+class TestConditionalApi(TestCase):
+    def setUp(self):
+        cache.clear()
+
+        # account setup
+        email = 'test@TeSt.com'
+        password = 'password123'
+        username = 'testname'
+        self.account = get_user_model().objects.create_user(email=email, username=username, password=password)
+        self.account.is_active = True
+        self.account.save()
+        self.client.force_login(self.account)
+
+        self.name = encrypted_name
+        self.folder = Folder.objects.create(name=self.name, account=self.account)
+        self.note = Note.objects.create(name=self.name, content=note_content, folder=self.folder)
+        self.todo_list = TodoList.objects.create(name=self.name, folder=self.folder)
+
+    def assertNotModified(self, url, **headers):
+        response = self.client.get(url, headers=headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_note_etag(self):
+        url = reverse('core:note-detail', args=[self.note.pk])
+        response = self.client.get(url)
+        etag = response.headers['ETag']
+        # session, account, date_updated; the content column is never read
+        with self.assertNumQueries(3):
+            self.assertNotModified(url, if_none_match=etag)
+        self.assertNotModified(url, if_modified_since=response.headers['Last-Modified'])
+
+        self.note.pinned = True
+        self.note.save()
+        self.assertEqual(self.client.get(url, headers={'if_none_match': etag}).status_code, 200)
+
+    def test_todo_list_etag_follows_tasks(self):
+        url = reverse('core:todo-list-detail', args=[self.todo_list.pk])
+        etag = self.client.get(url).headers['ETag']
+        self.assertNotModified(url, if_none_match=etag)
+
+        Task.objects.create(name=self.name, todo_list=self.todo_list)
+        self.assertEqual(self.client.get(url, headers={'if_none_match': etag}).status_code, 200)
+
+    def test_workspace_etag(self):
+        url = reverse('core:workspace')
+        etag = self.client.get(url).headers['ETag']
+        self.assertNotModified(url, if_none_match=etag)
+
+        Note.objects.create(name=self.name, content='', folder=self.folder).delete()
+        self.assertNotModified(url, if_none_match=etag)
+        self.note.delete()
+        self.assertEqual(self.client.get(url, headers={'if_none_match': etag}).status_code, 200)
+
+    def test_folder_etag(self):
+        subfolder = Folder.objects.create(name=self.name, account=self.account, parent=self.folder)
+        sibling = Folder.objects.create(name=self.name, account=self.account)
+        url = reverse('core:folder-detail', args=[self.folder.pk])
+        response = self.client.get(url)
+        self.assertEqual([folder['id'] for folder in response.json()['folders']], [self.folder.pk, subfolder.pk])
+        etag = response.headers['ETag']
+
+        Note.objects.create(name=self.name, content='', folder=sibling)
+        self.assertNotModified(url, if_none_match=etag)
+        Note.objects.create(name=self.name, content='', folder=subfolder)
+        self.assertEqual(self.client.get(url, headers={'if_none_match': etag}).status_code, 200)
+
+
+class TestNoteBlocksApi(TestCase):
+    def setUp(self):
+        # account setup
+        email = 'test@TeSt.com'
+        password = 'password123'
+        username = 'testname'
+        self.account = get_user_model().objects.create_user(email=email, username=username, password=password)
+        self.account.is_active = True
+        self.account.save()
+        self.client.force_login(self.account)
+
+        self.name = encrypted_name
+        self.folder = Folder.objects.create(name=self.name, account=self.account)
+        self.blocks = ['YWFh', 'YmJi', 'Y2Nj']
+        self.note = Note.objects.create(name=self.name, content='\n'.join(self.blocks), folder=self.folder)
+        self.url = reverse('core:note-blocks', args=[self.note.pk])
+
+    def patch(self, data, **headers):
+        return self.client.patch(self.url, json.dumps(data), content_type='application/json', headers=headers)
+
+    def content(self):
+        return self.client.get(reverse('core:note-detail', args=[self.note.pk])).json()['content']
+
+    def test_patch_blocks(self):
+        response = self.patch({'length': 4, 'blocks': {'1': 'ZGRk', '3': 'ZWVl'}})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.content(), 'YWFh\nZGRk\nY2Nj\nZWVl')
+        self.assertEqual(NoteBlock.objects.filter(note=self.note).count(), 4)
+
+        # only the changed block is written
+        block = NoteBlock.objects.get(note=self.note, index=0)
+        self.patch({'length': 2, 'blocks': {'1': 'ZmZm'}})
+        self.assertEqual(self.content(), 'YWFh\nZmZm')
+        self.assertEqual(NoteBlock.objects.get(note=self.note, index=0).pk, block.pk)
+
+    def test_patch_blocks_invalid(self):
+        response = self.patch({'length': 3, 'blocks': {'1': 'Y[Jj'}})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('1', response.json()['blocks'])
+        response = self.patch({'length': 5, 'blocks': {'3': 'ZWVl', '5': 'ZmZm'}})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['blocks']), {'4', '5'})
+        self.assertEqual(self.patch({'blocks': {}}).status_code, 400)
+        self.assertEqual(self.content(), '\n'.join(self.blocks))
+
+    def test_patch_blocks_malformed(self):
+        for blocks in [{'0': 5}, {'0': None}, {'0': ['YWFh']}]:
+            self.assertEqual(self.patch({'length': 3, 'blocks': blocks}).status_code, 400)
+        self.assertEqual(self.patch({'length': -3}).status_code, 400)
+        # more blocks than the note has plus the ones sent
+        response = self.patch({'length': 10 ** 9, 'blocks': {'3': 'ZWVl'}})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('length', response.json())
+        self.assertEqual(self.content(), '\n'.join(self.blocks))
+
+    def test_patch_blocks_if_match(self):
+        etag = self.client.get(reverse('core:note-detail', args=[self.note.pk])).headers['ETag']
+        response = self.patch({'length': 3, 'blocks': {'0': 'ZGRk'}}, if_match=etag)
+        self.assertEqual(response.status_code, 200)
+        response = self.patch({'length': 3, 'blocks': {'0': 'ZWVl'}}, if_match=etag)
+        self.assertEqual(response.status_code, 412)
+
+    def test_patch_task_links(self):
+        todo_list = TodoList.objects.create(name=self.name, folder=self.folder)
+        first, second = (Task.objects.create(name=self.name, todo_list=todo_list) for _ in range(2))
+        response = self.patch({'length': 3, 'blocks': {'0': 'ZGRk'}, 'tasks': [second.pk, first.pk]})
+        self.assertEqual(response.status_code, 200)
+        tasks = self.client.get(reverse('core:note-tasks', args=[self.note.pk])).json()['tasks']
+        self.assertEqual([(task['id'], task['note_position']) for task in tasks], [(second.pk, 0), (first.pk, 1)])
+
+        # the blocks aren't saved when the links can't be
+        response = self.patch({'length': 3, 'blocks': {'0': 'ZWVl'}, 'tasks': [first.pk, first.pk + 100]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'tasks': [f"task {first.pk + 100} doesn't exist"]})
+        self.assertEqual(self.content(), 'ZGRk\nYmJi\nY2Nj')
+        self.assertEqual(self.patch({'length': 3, 'tasks': 'abc'}).status_code, 400)
+
+        # no manifest leaves the links alone, an empty one detaches them all
+        self.patch({'length': 3})
+        self.assertEqual(Task.objects.filter(note=self.note).count(), 2)
+        self.patch({'length': 3, 'tasks': []})
+        self.assertFalse(Task.objects.filter(note=self.note).exists())
+
+    def put(self, data, **headers):
+        url = reverse('core:note-detail', args=[self.note.pk])
+        return self.client.put(url, json.dumps(data), content_type='application/json', headers=headers)
+
+    def test_put_note(self):
+        etag = self.client.get(reverse('core:note-detail', args=[self.note.pk])).headers['ETag']
+        response = self.put({'name': self.name, 'content': 'ZGRk\nZWVl', 'pinned': True}, if_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['pinned'])
+        self.assertEqual(self.content(), 'ZGRk\nZWVl')
+        # the upload moved the ETag
+        self.assertEqual(self.put({'name': self.name, 'content': 'YWFh'}, if_match=etag).status_code, 412)
+        self.assertEqual(self.put({'name': self.name, 'content': 'YWFh'}, if_match=response.headers['ETag']).status_code, 200)
+
+    def test_put_note_replaces_blocks(self):
+        self.patch({'length': 4, 'blocks': {'3': 'ZGRk'}})
+        todo_list = TodoList.objects.create(name=self.name, folder=self.folder)
+        task = Task.objects.create(name=self.name, todo_list=todo_list)
+        response = self.put({'name': self.name, 'content': 'ZWVl', 'tasks': [task.pk]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.content(), 'ZWVl')
+        self.assertFalse(NoteBlock.objects.filter(note=self.note).exists())
+        self.assertEqual(Task.objects.get(pk=task.pk).note_id, self.note.pk)
+
+    def test_put_note_invalid(self):
+        for data in [{'content': 'YWFh'}, {'name': self.name, 'content': 5}, {'name': self.name, 'content': 'YWFh', 'pinned': 'yes'}]:
+            self.assertEqual(self.put(data).status_code, 400)
+        response = self.put({'name': self.name, 'content': 'Y[Jj'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('content', response.json())
+        self.assertEqual(self.content(), '\n'.join(self.blocks))
+
+    def test_create_note(self):
+        url = reverse('core:folder-notes', args=[self.folder.pk])
+        response = self.client.post(url, json.dumps({'name': self.name, 'content': 'YWFh'}), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        note = Note.objects.get(pk=response.json()['id'])
+        self.assertEqual((note.folder_id, note.content), (self.folder.pk, 'YWFh'))
+        self.assertEqual(self.client.get(reverse('core:note-detail', args=[note.pk])).headers['ETag'], response.headers['ETag'])
+
+        response = self.client.post(url, json.dumps({'name': '', 'content': 'YWFh'}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('name', response.json())
+
+    def test_compact_notes(self):
+        self.patch({'length': 3, 'blocks': {'2': 'ZGRk'}})
+        call_command('compact_notes', idle_minutes=0, stdout=StringIO())
+        self.note.refresh_from_db()
+        self.assertFalse(self.note.chunked)
+        self.assertEqual(self.note.content, 'YWFh\nYmJi\nZGRk')
+        self.assertFalse(NoteBlock.objects.filter(note=self.note).exists())
+
+        self.patch({'length': 3, 'blocks': {'0': 'ZWVl'}})
+        self.assertEqual(self.content(), 'ZWVl\nYmJi\nZGRk')
+
+    async def test_async_client(self):
+        # served the way the ASGI handler serves them, without a thread per request
+        client = AsyncClient()
+        await sync_to_async(client.force_login)(self.account)
+        url = reverse('core:note-detail', args=[self.note.pk])
+
+        response = await client.patch(self.url, json.dumps({'length': 2, 'blocks': {'1': 'ZGRk'}}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        response = await client.get(url)
+        self.assertEqual(response.json()['content'], 'YWFh\nZGRk')
+        self.assertEqual((await client.get(url, headers={'if_none_match': response.headers['ETag']})).status_code, 304)
+        self.assertEqual((await client.post(url)).status_code, 405)
+        response = await client.put(url, json.dumps({'name': self.name, 'content': 'ZWVl'}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((await client.get(url)).json()['content'], 'ZWVl')
+
+        await sync_to_async(client.logout)()
+        self.assertEqual((await client.get(url)).status_code, 401)
+
+
+class TestWorkspaceCache(TestCase):
+    def setUp(self):
+        cache.clear()
+
+        email = 'test@TeSt.com'
+        password = 'password123'
+        username = 'testname'
+        self.account = get_user_model().objects.create_user(email=email, username=username, password=password)
+        self.account.is_active = True
+        self.account.save()
+        self.client.force_login(self.account)
+
+        self.name = encrypted_name
+        self.folder = Folder.objects.create(name=self.name, account=self.account)
+        self.note = Note.objects.create(name=self.name, content=note_content, folder=self.folder)
+        self.todo_list = TodoList.objects.create(name=self.name, folder=self.folder)
+        self.task = Task.objects.create(name=self.name, todo_list=self.todo_list)
+
+    def get_workspace(self):
+        return self.client.get(reverse('core:workspace')).json()
+
+    def test_cached_read(self):
+        self.get_workspace()
+        # session, account, three ETag aggregates; the sections come from the cache
+        with self.assertNumQueries(5):
+            data = self.get_workspace()
+        self.assertEqual([note['id'] for note in data['notes']], [self.note.pk])
+
+    def test_save_invalidates_its_section(self):
+        self.get_workspace()
+        self.note.pinned = True
+        self.note.save()
+        # session, account, three ETag aggregates, notes
+        with self.assertNumQueries(6):
+            data = self.get_workspace()
+        self.assertTrue(data['notes'][0]['pinned'])
+
+    def test_task_write_invalidates_todo_lists(self):
+        self.get_workspace()
+        Task.objects.create(name=self.name, todo_list=self.todo_list)
+        self.assertEqual(self.get_workspace()['todo_lists'][0]['tasks_total'], 2)
+        self.task.delete()
+        self.assertEqual(self.get_workspace()['todo_lists'][0]['tasks_total'], 1)
+
+    def test_folder_delete_invalidates_everything(self):
+        self.get_workspace()
+        self.folder.delete()
+        self.assertEqual(self.get_workspace(), {'folders': [], 'notes': [], 'todo_lists': []})
+
+    def test_bulk_writes_invalidate(self):
+        self.get_workspace()
+        Note.objects.bulk_create_validated([Note(name=self.name, content=note_content, folder=self.folder)])
+        self.assertEqual(len(self.get_workspace()['notes']), 2)
+
+        self.todo_list.priority = TodoList.HIGH
+        TodoList.objects.bulk_update_validated([self.todo_list], ['priority'])
+        self.assertEqual(self.get_workspace()['todo_lists'][0]['priority'], TodoList.HIGH)
+
+    def test_other_accounts_stay_cached(self):
+        other = get_user_model().objects.create_user(email='other@test.com', username='other', password='password123')
+        other.is_active = True
+        other.save()
+        self.get_workspace()
+        Folder.objects.create(name=self.name, account=other)
+        with self.assertNumQueries(5):
+            self.get_workspace()
+
+    def test_cache_stats(self):
+        self.get_workspace()
+        self.get_workspace()
+        out = StringIO()
+        call_command('cache_stats', '--reset', stdout=out)
+        self.assertIn('notes: 1 hits, 1 misses, hit ratio 50.0%', out.getvalue())
+        out = StringIO()
+        call_command('cache_stats', stdout=out)
+        self.assertIn('notes: 0 hits, 0 misses', out.getvalue())
+
+
+@override_settings(CHANGE_FEED_COALESCE=0, CHANGE_FEED_TIMEOUT=0.5)
+class TestChangeFeedApi(TestCase):
+    def setUp(self):
+        email = 'test@TeSt.com'
+        password = 'password123'
+        username = 'testname'
+        self.account = get_user_model().objects.create_user(email=email, username=username, password=password)
+        self.account.is_active = True
+        self.account.save()
+        self.url = reverse('core:change-feed')
+
+    async def test_stream(self):
+        client = AsyncClient()
+        await sync_to_async(client.force_login)(self.account)
+        response = await client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        events = aiter(response.streaming_content)
+        self.assertEqual(await anext(events), b'retry: 1000\n\n')
+        change = {'model': 'note', 'id': 1, 'date_updated': None, 'deleted': True}
+        changes.get_broker().publish(self.account.pk + 1, [{**change, 'id': 2}])
+        changes.get_broker().publish(self.account.pk, [change])
+        self.assertEqual(await anext(events), f'event: changes\ndata: {json.dumps([change])}\n\n'.encode())
+        # the stream ends at CHANGE_FEED_TIMEOUT, its subscription with it
+        self.assertEqual([chunk async for chunk in events], [b': keep-alive\n\n'])
+        self.assertNotIn(self.account.pk, changes.get_broker().subscriptions)
+
+    def test_login_required(self):
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+
+class TestSyncApi(TestCase):
+    def setUp(self):
+        email = 'test@TeSt.com'
+        password = 'password123'
+        username = 'testname'
+        self.account = get_user_model().objects.create_user(email=email, username=username, password=password)
+        self.account.is_active = True
+        self.account.save()
+        self.client.force_login(self.account)
+
+        self.name = encrypted_name
+        self.folder = Folder.objects.create(name=self.name, account=self.account)
+        self.note = Note.objects.create(name=self.name, content=note_content, folder=self.folder)
+        self.todo_list = TodoList.objects.create(name=self.name, folder=self.folder)
+        self.task = Task.objects.create(name=self.name, todo_list=self.todo_list)
+        self.url = reverse('core:sync-changes')
+
+    def sync(self, since, **params):
+        response = self.client.get(self.url, {'since': since, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def token(self):
+        return str(SyncCounter.objects.get(account=self.account).sequence)
+
+    def test_everything_since_zero(self):
+        # session, account, records, one query per model
+        with self.assertNumQueries(7):
+            data = self.sync(0)
+        self.assertEqual([folder['id'] for folder in data['folders']], [self.folder.pk])
+        self.assertEqual([note['id'] for note in data['notes']], [self.note.pk])
+        self.assertNotIn('content', data['notes'][0])
+        self.assertEqual([todo_list['id'] for todo_list in data['todo_lists']], [self.todo_list.pk])
+        self.assertEqual(data['todo_lists'][0]['tasks_total'], 1)
+        self.assertEqual([task['id'] for task in data['tasks']], [self.task.pk])
+        self.assertEqual(data['token'], self.token())
+        self.assertFalse(data['more'])
+
+    def test_only_changes_since_the_token(self):
+        token = self.sync(0)['token']
+        self.note.pinned = True
+        self.note.save()
+
+        data = self.sync(token)
+        self.assertEqual(data['notes'][0]['pinned'], True)
+        self.assertEqual((data['folders'], data['todo_lists'], data['tasks']), ([], [], []))
+        self.assertEqual(self.sync(data['token'])['notes'], [])
+
+    def test_deletions(self):
+        token = self.sync(0)['token']
+        task_pk, folder_pk = self.task.pk, self.folder.pk
+        self.task.delete()
+        data = self.sync(token)
+        self.assertEqual(data['deleted']['tasks'], [task_pk])
+        self.assertEqual(data['tasks'], [])
+
+        # records of rows deleted along with their folder turn up as deletions too
+        self.note.save()
+        self.folder.delete()
+        data = self.sync(data['token'])
+        self.assertEqual(data['deleted']['folders'], [folder_pk])
+        self.assertEqual(data['deleted']['notes'], [self.note.pk])
+
+    def test_pages(self):
+        data = self.sync(0, limit=3)
+        self.assertTrue(data['more'])
+        self.assertEqual(len(data['folders'] + data['notes'] + data['todo_lists'] + data['tasks']), 3)
+        data = self.sync(data['token'], limit=3)
+        self.assertFalse(data['more'])
+        self.assertEqual(data['token'], self.token())
+
+    def test_other_accounts(self):
+        other = get_user_model().objects.create_user(email='other@test.com', username='other', password='password123')
+        other.is_active = True
+        other.save()
+        self.client.force_login(other)
+        data = self.sync(0)
+        self.assertEqual((data['folders'], data['notes'], data['token']), ([], [], '0'))
+
+    def test_malformed_token(self):
+        self.assertEqual(self.client.get(self.url, {'since': 'abc'}).status_code, 400)
+
+
+class TestFocusApi(TestCase):
+    def setUp(self):
+        email = 'test@TeSt.com'
+        password = 'password123'
+        username = 'testname'
+        self.account = get_user_model().objects.create_user(email=email, username=username, password=password)
+        self.account.is_active = True
+        self.account.save()
+        self.client.force_login(self.account)
+
+        self.name = encrypted_name
+        self.folder = Folder.objects.create(name=self.name, account=self.account)
+        self.todo_list = TodoList.objects.create(name=self.name, folder=self.folder)
+
+    def test_focus(self):
+        today = timezone.localdate()
+        later = Task.objects.create(name=self.name, todo_list=self.todo_list, due_date=today + timedelta(days=3))
+        overdue = Task.objects.create(name=self.name, todo_list=self.todo_list, due_date=today - timedelta(days=1))
+        Task.objects.create(name=self.name, todo_list=self.todo_list)
+
+        response = self.client.get(reverse('core:focus'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(task['id'], task['score']) for task in response.json()['tasks']], [(overdue.pk, 40), (later.pk, 10)])
+
+        response = self.client.get(reverse('core:focus'), {'limit': 1})
+        self.assertEqual([task['id'] for task in response.json()['tasks']], [overdue.pk])
+
+    def test_focus_constant_queries(self):
+        today = timezone.localdate()
+        Task.objects.bulk_create_validated([
+            Task(name=self.name, todo_list=self.todo_list, due_date=today + timedelta(days=i % 10)) for i in range(100)
+        ])
+        self.assertEqual(FocusEntry.objects.filter(account=self.account).count(), 80)
+        # session, account, ranking
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('core:focus'), {'limit': 200})
+        self.assertEqual(len(response.json()['tasks']), 80)
+
+
+class TestTimerApi(TestCase):
+    def setUp(self):
+        email = 'test@TeSt.com'
+        password = 'password123'
+        username = 'testname'
+        self.account = get_user_model().objects.create_user(email=email, username=username, password=password)
+        self.account.is_active = True
+        self.account.save()
+        self.client.force_login(self.account)
+
+        self.name = encrypted_name
+        folder = Folder.objects.create(name=self.name, account=self.account)
+        self.todo_list = TodoList.objects.create(name=self.name, folder=folder)
+        self.task = Task.objects.create(name=self.name, todo_list=self.todo_list)
+
+    def test_start_and_stop(self):
+        response = self.client.post(reverse('core:timer-start', args=[self.task.pk]))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.client.post(reverse('core:timer-start', args=[self.task.pk])).status_code, 409)
+
+        running = self.client.get(reverse('core:running-timers')).json()['timers']
+        self.assertEqual([timer['task_id'] for timer in running], [self.task.pk])
+
+        Timer.objects.filter(task=self.task).update(date_started=timezone.now() - timedelta(minutes=5))
+        response = self.client.post(reverse('core:timer-stop', args=[self.task.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(response.json()['duration'], 300)
+        self.assertEqual(self.client.post(reverse('core:timer-stop', args=[self.task.pk])).status_code, 409)
+
+        days = self.client.get(reverse('core:time-spent'), {'since': timezone.localdate().isoformat()}).json()['days']
+        self.assertEqual(sum(day['seconds'] for day in days), response.json()['duration'])
+
+    def test_stop_moves_todo_list_etag(self):
+        url = reverse('core:todo-list-detail', args=[self.todo_list.pk])
+        self.client.post(reverse('core:timer-start', args=[self.task.pk]))
+        etag = self.client.get(url).headers['ETag']
+        self.client.post(reverse('core:timer-stop', args=[self.task.pk]))
+        self.assertEqual(self.client.get(url, headers={'if_none_match': etag}).status_code, 200)
+
+    def test_other_accounts_tasks(self):
+        other = get_user_model().objects.create_user(email='other@test.com', username='other', password='password123')
+        other.is_active = True
+        other.save()
+        self.client.force_login(other)
+        self.assertEqual(self.client.post(reverse('core:timer-start', args=[self.task.pk])).status_code, 404)
+
+    def test_time_spent_bad_dates(self):
+        for since in ['yesterday', '2026-02-30']:
+            response = self.client.get(reverse('core:time-spent'), {'since': since})
+            self.assertEqual(response.status_code, 400)
+
+
+class TestPerformanceApi(TestCase):
+    def setUp(self):
+        email = 'test@TeSt.com'
+        password = 'password123'
+        username = 'testname'
+        self.account = get_user_model().objects.create_user(email=email, username=username, password=password)
+        self.account.is_active = True
+        self.account.save()
+        self.client.force_login(self.account)
+
+        folder = Folder.objects.create(name=encrypted_name, account=self.account)
+        todo_list = TodoList.objects.create(name=encrypted_name, folder=folder)
+        Task.objects.create(name=encrypted_name, todo_list=todo_list, date_closed=timezone.localdate())
+        call_command('refresh_metrics', stdout=StringIO())
+
+    def test_monthly(self):
+        response = self.client.get(reverse('core:performance'), {'bucket': 'month'})
+        self.assertEqual(response.status_code, 200)
+        [month] = response.json()['metrics']
+        self.assertEqual(month['start'], timezone.localdate().replace(day=1).isoformat())
+        self.assertEqual((month['created'], month['closed'], month['completion_rate'], month['on_time_ratio']), (1, 1, 1.0, None))
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get(reverse('core:performance'), {'bucket': 'year'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('core:performance'), {'until': 'tomorrow'}).status_code, 400)
+
+
+class TestPaginatedListingsApi(TestCase):
+    def setUp(self):
+        email = 'test@TeSt.com'
+        password = 'password123'
+        username = 'testname'
+        self.account = get_user_model().objects.create_user(email=email, username=username, password=password)
+        self.account.is_active = True
+        self.account.save()
+        self.client.force_login(self.account)
+
+        self.folder = Folder.objects.create(name=encrypted_name, account=self.account)
+        self.todo_list = TodoList.objects.create(name=encrypted_name, folder=self.folder)
+        today = timezone.localdate()
+        Task.objects.bulk_create_validated(
+            Task(
+                name=encrypted_name, todo_list=self.todo_list, priority=[Task.HIGH, Task.MEDIUM, Task.LOW, Task.NONE][n % 4],
+                due_date=None if n % 3 == 0 else today + timedelta(days=n % 5),
+            )
+            for n in range(60)
+        )
+        Note.objects.bulk_create_validated(Note(name=encrypted_name, folder=self.folder, pinned=n % 7 == 0) for n in range(60))
+
+    def walk(self, url, key, limit):
+        """Every row of a listing, following the cursors, and the number of queries of each page."""
+        rows, queries, cursor = [], [], None
+        while True:
+            params = {'limit': limit, **({'cursor': cursor} if cursor else {})}
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            queries.append(len(context))
+            rows += response.json()[key]
+            cursor = response.json()['next']
+            if cursor is None:
+                return rows, queries
+
+    def test_tasks(self):
+        tasks, queries = self.walk(reverse('core:todo-list-tasks', args=[self.todo_list.pk]), 'tasks', limit=7)
+        expected = list(
+            Task.objects.listing(self.todo_list)
+            .order_by('priority_rank', F('due_date').asc(nulls_last=True), 'pk')
+            .values_list('pk', flat=True)
+        )
+        self.assertEqual([task['id'] for task in tasks], expected)
+        self.assertEqual(tasks[0]['priority'], Task.HIGH)
+        # deep pages cost what the first one does
+        self.assertEqual(len(set(queries)), 1)
+
+    def test_notes(self):
+        notes, queries = self.walk(reverse('core:folder-notes', args=[self.folder.pk]), 'notes', limit=9)
+        expected = list(Note.objects.filter(folder=self.folder).order_by('-pinned', '-date_updated', '-pk').values_list('pk', flat=True))
+        self.assertEqual([note['id'] for note in notes], expected)
+        self.assertEqual(len(set(queries)), 1)
+
+    def test_bad_parameters(self):
+        url = reverse('core:todo-list-tasks', args=[self.todo_list.pk])
+        for params in [{'cursor': 'not a cursor'}, {'cursor': 'WzFd'}, {'limit': 'ten'}]:
+            self.assertEqual(self.client.get(url, params).status_code, 400, params)
+
+    def test_other_accounts_listings(self):
+        other = get_user_model().objects.create_user(email='other@test.com', username='other', password='password123')
+        other.is_active = True
+        other.save()
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(reverse('core:folder-notes', args=[self.folder.pk])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('core:todo-list-tasks', args=[self.todo_list.pk])).status_code, 404)
+
+
+class TestFolderDeletionApi(TestCase):
+    def setUp(self):
+        email = 'test@TeSt.com'
+        password = 'password123'
+        username = 'testname'
+        self.account = get_user_model().objects.create_user(email=email, username=username, password=password)
+        self.account.is_active = True
+        self.account.save()
+        self.client.force_login(self.account)
+
+        self.folder = Folder.objects.create(name=encrypted_name, account=self.account)
+        todo_list = TodoList.objects.create(name=encrypted_name, folder=self.folder)
+        Task.objects.create(name=encrypted_name, todo_list=todo_list)
+
+    def test_scheduled_deletion(self):
+        response = self.client.post(reverse('core:folder-delete', args=[self.folder.pk]))
+        self.assertEqual(response.status_code, 202)
+        deletion = response.json()
+        # scheduling twice doesn't queue the work twice
+        self.assertEqual(self.client.post(reverse('core:folder-delete', args=[self.folder.pk])).json()['id'], deletion['id'])
+        self.assertTrue(Folder.objects.filter(pk=self.folder.pk).exists())
+
+        call_command('delete_folders', stdout=StringIO())
+        progress = self.client.get(reverse('core:folder-deletion', args=[deletion['id']])).json()
+        self.assertIsNotNone(progress['date_finished'])
+        self.assertEqual(progress['deleted'], {'core.Folder': 1, 'core.TodoList': 1, 'core.Task': 1})
+        self.assertFalse(Folder.objects.filter(pk=self.folder.pk).exists())
+
+    def test_other_accounts_folders(self):
+        other = get_user_model().objects.create_user(email='other@test.com', username='other', password='password123')
+        other.is_active = True
+        other.save()
+        self.client.force_login(other)
+        self.assertEqual(self.client.post(reverse('core:folder-delete', args=[self.folder.pk])).status_code, 404)
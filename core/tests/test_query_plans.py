@@ -0,0 +1,184 @@
+import os
+import unittest
+from datetime import date, datetime, time
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, tag
+from django.utils import timezone
+
+from ..models import FocusEntry, Folder, Note, SyncRecord, TodoList, Task, TaskHistory, Timer
+from ..pagination import after, order_by
+from ..partitions import month_start, partition_name
+
+# dataset size can be lowered locally, e.g. QUERY_PLAN_TASKS=100000
+TASK_COUNT = int(os.environ.get('QUERY_PLAN_TASKS', 1_000_000))
+FOLDER_COUNT = 100
+TODO_LIST_COUNT = 10_000
+NOTE_COUNT = 100_000
+ENCODED_NAME = 'YQ=='
+
+
+def insert_series(model, count, expressions):
+    """
+    Inserts `count` rows server-side with generate_series. Columns missing from
+    `expressions` get their model default, so the seed survives new fields.
+    """
+    columns, values, params = [], [], []
+    for field in model._meta.concrete_fields:
+        if field.primary_key:
+            continue
+        columns.append(connection.ops.quote_name(field.column))
+        if field.name in expressions:
+            values.append(expressions[field.name])
+        else:
+            values.append('%s')
+            default = field.get_default() if field.has_default() or not field.null else None
+            params.append(field.get_db_prep_save(default, connection))
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {connection.ops.quote_name(model._meta.db_table)} ({", ".join(columns)}) '
+            f'SELECT {", ".join(values)} FROM generate_series(0, %s) AS n',
+            [*params, count - 1],
+        )
+
+
+@tag('query_plan')
+@unittest.skipUnless(connection.vendor == 'postgresql', 'query plans are asserted against Postgres only')
+class TestDashboardQueryPlans(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        account = get_user_model().objects.create_user(email='plans@test.com', username='plans', password='password123')
+        account.is_active = True
+        account.save()
+        cls.account = account
+
+        folders = Folder.objects.bulk_create_validated(
+            [Folder(name=ENCODED_NAME, account=account) for _ in range(FOLDER_COUNT)]
+        )
+        cls.folder = folders[0]
+        first_folder = folders[0].pk
+
+        insert_series(TodoList, TODO_LIST_COUNT, {
+            'name': f"'{ENCODED_NAME}'",
+            'priority': "(ARRAY['h', 'm', 'l', 'n'])[1 + n %% 4]",
+            'due_date': "CASE WHEN n %% 4 = 0 THEN NULL ELSE CURRENT_DATE + (n %% 365 - 180) END",
+            'date_created': 'now()',
+            'date_updated': 'now()',
+            'folder': f'{first_folder} + n %% {FOLDER_COUNT}',
+        })
+        first_list = TodoList.objects.order_by('pk').values_list('pk', flat=True).first()
+        cls.todo_list_id = first_list
+
+        insert_series(Note, NOTE_COUNT, {
+            'name': f"'{ENCODED_NAME}'",
+            'content': f"'{ENCODED_NAME}'",
+            'pinned': 'n %% 100 = 0',
+            'date_created': 'now()',
+            'date_updated': "now() - n * interval '1 minute'",
+            'folder': f'{first_folder} + n %% {FOLDER_COUNT}',
+        })
+
+        # ~20% of the tasks are open, a fifth of the closed ones failed
+        insert_series(Task, TASK_COUNT, {
+            'name': f"'{ENCODED_NAME}'",
+            'priority': "(ARRAY['h', 'm', 'l', 'n'])[1 + n %% 4]",
+            'failed': 'n %% 5 = 1',
+            'date_created': 'now()',
+            'due_date': "CASE WHEN n %% 3 = 0 THEN NULL ELSE CURRENT_DATE + (n %% 365 - 180) END",
+            'date_closed': "CASE WHEN n %% 5 = 0 THEN NULL ELSE CURRENT_DATE - (n %% 300) END",
+            'todo_list': f'{first_list} + n %% {TODO_LIST_COUNT}',
+        })
+
+        FocusEntry.objects.roll_over([account.pk])
+
+        # one running timer in a thousand
+        first_task = Task.objects.order_by('pk').values_list('pk', flat=True).first()
+        insert_series(Timer, TASK_COUNT // 10, {
+            'task': f'{first_task} + n',
+            'account': str(account.pk),
+            'date_started': "now() - n * interval '1 minute'",
+            'date_stopped': "CASE WHEN n %% 1000 = 0 THEN NULL ELSE now() END",
+        })
+
+        # a change record per task, numbered after the folders' own
+        insert_series(SyncRecord, TASK_COUNT, {
+            'account': str(account.pk),
+            'model': "'task'",
+            'object_id': f'{first_task} + n',
+            'sequence': f'{FOLDER_COUNT + 1} + n',
+        })
+
+        with connection.cursor() as cursor:
+            for model in [Folder, TodoList, Note, Task, FocusEntry, Timer, SyncRecord]:
+                cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, plan)
+        self.assertNotIn(f'Seq Scan on {queryset.model._meta.db_table}', plan, plan)
+
+    def test_open_tasks_by_due_date(self):
+        queryset = Task.objects.open().filter(todo_list_id=self.todo_list_id).order_by('due_date')
+        self.assertUsesIndex(queryset, 'task_open_by_due_idx')
+
+    def test_open_tasks_by_priority(self):
+        queryset = Task.objects.open().filter(todo_list_id=self.todo_list_id, priority=Task.HIGH)
+        self.assertUsesIndex(queryset, 'task_open_by_priority_idx')
+
+    def test_overdue_tasks(self):
+        queryset = Task.objects.open().filter(due_date__lt=date.today()).order_by('due_date')[:50]
+        self.assertUsesIndex(queryset, 'task_open_due_idx')
+
+    def test_todo_lists_by_priority(self):
+        queryset = TodoList.objects.filter(folder=self.folder, priority=TodoList.HIGH).order_by('due_date')
+        self.assertUsesIndex(queryset, 'todolist_folder_priority_idx')
+
+    def test_todo_lists_by_due_date(self):
+        queryset = TodoList.objects.filter(folder=self.folder).order_by('due_date')
+        self.assertUsesIndex(queryset, 'todolist_folder_due_idx')
+
+    def test_pinned_notes(self):
+        queryset = Note.objects.pinned(self.folder)
+        self.assertUsesIndex(queryset, 'note_pinned_by_folder_idx')
+
+    def test_focus_ranking(self):
+        queryset = FocusEntry.objects.for_account(self.account)[:50]
+        self.assertUsesIndex(queryset, 'focus_rank_idx')
+
+    def test_history_partition_pruning(self):
+        today = timezone.localdate()
+        since, until = (timezone.make_aware(datetime.combine(month_start(today, offset), time.min)) for offset in (0, 1))
+        plan = TaskHistory.objects.for_account(self.account, since=since, until=until).explain()
+        self.assertIn(partition_name(TaskHistory._meta.db_table, month_start(today)), plan, plan)
+        self.assertNotIn(f'{TaskHistory._meta.db_table}_default', plan, plan)
+
+    def test_running_timers(self):
+        queryset = Timer.objects.running().filter(account=self.account)
+        self.assertUsesIndex(queryset, 'timer_running_idx')
+
+    def test_tasks_by_note(self):
+        queryset = Task.objects.linked_to(Note.objects.filter(folder=self.folder).first())
+        self.assertUsesIndex(queryset, 'task_note_position_idx')
+        self.assertNotIn('Sort', queryset.explain())
+
+    def test_changes_since(self):
+        queryset = SyncRecord.objects.since(self.account, TASK_COUNT // 2)[:1000]
+        self.assertUsesIndex(queryset, 'syncrecord_sequence_idx')
+        self.assertNotIn('Sort', queryset.explain())
+
+    def assertDeepPageUsesIndex(self, queryset, ordering, index_name):
+        # the cursor of a row halfway down the listing: the page after it is still one index range scan
+        last = queryset.order_by(*order_by(ordering))[queryset.count() // 2]
+        values = [getattr(last, name.lstrip('-')) for name in ordering]
+        page = after(queryset, ordering, values).order_by(*order_by(ordering))[:50]
+        self.assertUsesIndex(page, index_name)
+        self.assertNotIn('Sort', page.explain())
+
+    def test_deep_note_page(self):
+        self.assertDeepPageUsesIndex(Note.objects.filter(folder=self.folder), Note.LISTING_ORDERING, 'note_listing_idx')
+
+    def test_deep_task_page(self):
+        todo_list = TodoList.objects.get(pk=self.todo_list_id)
+        self.assertDeepPageUsesIndex(Task.objects.listing(todo_list), Task.LISTING_ORDERING, 'task_listing_idx')
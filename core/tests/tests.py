@@ -1,11 +1,26 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
-
-from ..models import Folder, Note, TodoList, Task
+from django.utils import timezone
+
+from ..models import (
+    FocusEntry, Folder, Note, TodoList, Task, TaskHistory, TodoListHistory, Timer, TimeRollup, Habit, MetricsDirtyDay, DailyMetrics,
+    FolderDeletion, NoteBlock, SyncCounter, SyncRecord,
+)
+from .. import archive, cache, changes, metrics
+from ..deletion import SubtreeDeleter, run_pending_deletion
+from ..validators import validate_encoded_field, validate_encoded_blocks
 from .long_test_strings import note_content, encrypted_name, encrypted_name_limit_exceeded, encrypted_name_corrupted
 
 from datetime import datetime, date, timedelta
+from io import StringIO
+import asyncio
+import base64
+import os
+import tempfile
 
 
 class TestFolderModel(TestCase):
@@ -61,6 +76,48 @@ class TestFolderModel(TestCase):
             folder = Folder.objects.create(name=self.name_corrupted, account=self.account)
             folder.save()
 
+    def test_folder_path(self):
+        folder1 = Folder.objects.create(name=self.name, account=self.account)
+        folder2 = Folder.objects.create(name=self.name, account=self.account, parent=folder1)
+        self.assertEqual(folder1.path, f'/{folder1.pk}/')
+        self.assertEqual(folder2.path, f'/{folder1.pk}/{folder2.pk}/')
+        self.assertEqual(Folder.objects.get(pk=folder2.pk).path, folder2.path)
+
+    def test_folder_descendants_and_ancestors(self):
+        folder1 = Folder.objects.create(name=self.name, account=self.account)
+        folder2 = Folder.objects.create(name=self.name, account=self.account, parent=folder1)
+        folder3 = Folder.objects.create(name=self.name, account=self.account, parent=folder2)
+        sibling = Folder.objects.create(name=self.name, account=self.account)
+
+        with self.assertNumQueries(1):
+            descendants = set(Folder.objects.descendants_of(folder1))
+        self.assertEqual(descendants, {folder2, folder3})
+        with self.assertNumQueries(1):
+            ancestors = set(Folder.objects.ancestors_of(folder3))
+        self.assertEqual(ancestors, {folder1, folder2})
+        self.assertEqual(set(Folder.objects.descendants_of(folder1, include_self=True)), {folder1, folder2, folder3})
+        self.assertNotIn(sibling, Folder.objects.descendants_of(folder1, include_self=True))
+
+    def test_move_folder_updates_subtree(self):
+        folder1 = Folder.objects.create(name=self.name, account=self.account)
+        folder2 = Folder.objects.create(name=self.name, account=self.account, parent=folder1)
+        folder3 = Folder.objects.create(name=self.name, account=self.account, parent=folder2)
+        target = Folder.objects.create(name=self.name, account=self.account)
+
+        folder2.parent = target
+        folder2.save()
+        folder3.refresh_from_db()
+        self.assertEqual(folder3.path, f'/{target.pk}/{folder2.pk}/{folder3.pk}/')
+        self.assertEqual(set(Folder.objects.descendants_of(target)), {folder2, folder3})
+        self.assertEqual(set(Folder.objects.descendants_of(folder1)), set())
+
+    def test_move_folder_inside_itself(self):
+        folder1 = Folder.objects.create(name=self.name, account=self.account)
+        folder2 = Folder.objects.create(name=self.name, account=self.account, parent=folder1)
+        with self.assertRaises(ValidationError):
+            folder1.parent = folder2
+            folder1.save()
+
 class TestNoteModel(TestCase):
     def setUp(self):
         # account setup
@@ -133,6 +190,59 @@ class TestNoteModel(TestCase):
             note = Note.objects.create(name=self.name_corrupted, content=self.content, folder=self.folder)
             note.save()
 
+    @override_settings(ENCRYPTED_FIELD_ENVELOPE='binary')
+    def test_note_binary_storage(self):
+        note = Note.objects.create(name=self.name, content=self.content, folder=self.folder)
+        self.assertEqual(note.content, self.content)
+        stored_content, stored_binary = Note.objects.filter(pk=note.pk).values_list('content', 'content_binary').get()
+        self.assertEqual(stored_content, '')
+        self.assertEqual(bytes(stored_binary), base64.b64decode(self.content))
+        self.assertEqual(Note.objects.get(pk=note.pk).content, self.content)
+
+    def test_convert_encrypted_storage(self):
+        note = Note.objects.create(name=self.name, content=self.content, folder=self.folder)
+        with override_settings(ENCRYPTED_FIELD_ENVELOPE='binary'):
+            call_command('convert_encrypted_storage', batch_size=1, stdout=StringIO())
+            self.assertIsNotNone(Note.objects.values_list('content_binary', flat=True).get(pk=note.pk))
+            self.assertEqual(Note.objects.get(pk=note.pk).content, self.content)
+
+        call_command('convert_encrypted_storage', stdout=StringIO())
+        stored_content, stored_binary = Note.objects.filter(pk=note.pk).values_list('content', 'content_binary').get()
+        self.assertEqual(stored_content, self.content)
+        self.assertIsNone(stored_binary)
+
+    def test_convert_encrypted_storage_rewraps_text(self):
+        note = Note.objects.create(name=self.name, content=self.content, folder=self.folder)
+        sequence = SyncCounter.objects.get(account=self.folder.account).sequence
+        to_base85 = lambda value: base64.b85encode(base64.b64decode(value)).decode()
+        with override_settings(ENCRYPTED_FIELD_ENVELOPE='base85'):
+            call_command('convert_encrypted_storage', from_envelope='base64', batch_size=1, stdout=StringIO())
+            rewrapped = Note.objects.get(pk=note.pk)
+            self.assertEqual(rewrapped.name, to_base85(self.name))
+            self.assertEqual(rewrapped.content, '\n'.join(to_base85(block) for block in self.content.split('\n')))
+            self.assertEqual(Folder.objects.get(pk=self.folder.pk).name, to_base85(self.folder.name))
+            # clients see the rewrapped rows as changed
+            self.assertGreater(rewrapped.date_updated, note.date_updated)
+            self.assertEqual(
+                set(SyncRecord.objects.since(self.folder.account, sequence).values_list('model', 'object_id')),
+                {('folder', self.folder.pk), ('note', note.pk)},
+            )
+
+            # base85 text can't be unwrapped as base64, and nothing is converted
+            with self.assertRaises(CommandError):
+                call_command('convert_encrypted_storage', from_envelope='base64', stdout=StringIO())
+            self.assertEqual(Note.objects.get(pk=note.pk).name, to_base85(self.name))
+
+    def test_convert_encrypted_storage_checks_lengths(self):
+        # 195 bytes: 244 characters of base85, 260 of base64
+        name = base64.b85encode(os.urandom(195)).decode()
+        with override_settings(ENCRYPTED_FIELD_ENVELOPE='base85'):
+            folder = Folder.objects.create(name=name, account=self.folder.account)
+        self.folder.delete()
+        with self.assertRaisesMessage(CommandError, "folder rows can't be rewrapped"):
+            call_command('convert_encrypted_storage', from_envelope='base85', stdout=StringIO())
+        self.assertEqual(Folder.objects.get(pk=folder.pk).name, name)
+
     def test_update_note_date_updated(self):
         note = Note.objects.create(name=self.name, content=self.content, folder=self.folder)
         note.save()
@@ -410,3 +520,1078 @@ class TestTaskModel(TestCase):
         task = Task.objects.create(name=self.name, todo_list=self.todo_list, due_date=self.due_date)
         task.save()
         self.assertIsInstance(task, Task)
+
+    def test_task_tree_for_todo_list(self):
+        root1 = Task.objects.create(name=self.name, todo_list=self.todo_list)
+        root2 = Task.objects.create(name=self.name, todo_list=self.todo_list)
+        child = Task.objects.create(name=self.name, todo_list=self.todo_list, parent_task=root1)
+        grandchild = Task.objects.create(name=self.name, todo_list=self.todo_list, parent_task=child)
+
+        with self.assertNumQueries(1):
+            roots = Task.objects.tree_for(self.todo_list)
+            self.assertEqual(roots, [root1, root2])
+            self.assertEqual(roots[0].children, [child])
+            self.assertEqual(roots[0].children[0].children, [grandchild])
+            self.assertEqual(roots[1].children, [])
+            self.assertEqual(roots[0].children[0].children[0].parent_task.parent_task, root1)
+
+        leaf = roots[0].children[0].children[0]
+        self.assertEqual(leaf.depth, 2)
+        self.assertEqual(leaf.path, f'/{root1.pk}/{child.pk}/{grandchild.pk}/')
+
+
+class TestBulkValidated(TestCase):
+    def setUp(self):
+        # account setup
+        email = 'test@TeSt.com'
+        password = 'password123'
+        username = 'testname'
+        self.account = get_user_model().objects.create_user(email=email, username=username, password=password)
+        self.account.is_active = True
+        self.account.save()
+
+        self.name = encrypted_name
+        self.folder = Folder.objects.create(name=self.name, account=self.account)
+        self.todo_list = TodoList.objects.create(name=self.name, folder=self.folder)
+
+    def test_bulk_create_tasks(self):
+        tasks = [Task(name=self.name, todo_list=self.todo_list) for _ in range(50)]
+        # todo_list lookup, insert, cache invalidation lookup, sync records (3), counter update and
+        # metrics day flag, plus two savepoints and their releases
+        with self.assertNumQueries(12):
+            Task.objects.bulk_create_validated(tasks)
+        self.assertEqual(Task.objects.filter(todo_list=self.todo_list).count(), 50)
+
+    def test_bulk_create_invalid_task(self):
+        tasks = [
+            Task(name=self.name, todo_list=self.todo_list),
+            Task(name=encrypted_name_corrupted, todo_list=self.todo_list),
+            Task(name=self.name, todo_list=self.todo_list, failed=True),
+            Task(name=self.name, todo_list_id=self.todo_list.pk + 1000),
+        ]
+        with self.assertRaises(ValidationError) as context:
+            Task.objects.bulk_create_validated(tasks)
+        self.assertEqual(set(context.exception.message_dict), {1, 2, 3})
+        self.assertEqual(Task.objects.count(), 0)
+
+    def test_bulk_create_folder_inactive_account(self):
+        self.account.is_active = False
+        self.account.save()
+        with self.assertRaises(ValidationError):
+            Folder.objects.bulk_create_validated([Folder(name=self.name, account=self.account)])
+
+    def test_bulk_create_nested_folders(self):
+        child = Folder(name=self.name, account=self.account, parent=self.folder)
+        grandchild = Folder(name=self.name, account=self.account, parent=child)
+        Folder.objects.bulk_create_validated([child])
+        Folder.objects.bulk_create_validated([grandchild])
+        self.assertEqual(Folder.objects.get(pk=grandchild.pk).path, f'/{self.folder.pk}/{child.pk}/{grandchild.pk}/')
+        self.assertEqual(set(Folder.objects.descendants_of(self.folder)), {child, grandchild})
+
+    def test_bulk_create_folders_with_their_parents(self):
+        root = Folder(name=self.name, account=self.account)
+        child = Folder(name=self.name, account=self.account, parent=root)
+        grandchild = Folder(name=self.name, account=self.account, parent=child)
+        sibling = Folder(name=self.name, account=self.account, parent=self.folder)
+        # children may come before their parents
+        created = Folder.objects.bulk_create_validated([grandchild, sibling, child, root])
+        self.assertEqual(created, [grandchild, sibling, child, root])
+        self.assertEqual(Folder.objects.get(pk=grandchild.pk).path, f'/{root.pk}/{child.pk}/{grandchild.pk}/')
+        self.assertEqual(Folder.objects.get(pk=sibling.pk).path, f'/{self.folder.pk}/{sibling.pk}/')
+        self.assertEqual(set(Folder.objects.descendants_of(root)), {child, grandchild})
+
+    def test_bulk_update_tasks(self):
+        tasks = Task.objects.bulk_create_validated([Task(name=self.name, todo_list=self.todo_list) for _ in range(3)])
+        for task in tasks:
+            task.priority = Task.HIGH
+        Task.objects.bulk_update_validated(tasks, ['priority'])
+        self.assertEqual(Task.objects.filter(priority=Task.HIGH).count(), 3)
+
+        tasks[0].priority = 'a'
+        with self.assertRaises(ValidationError):
+            Task.objects.bulk_update_validated(tasks, ['priority'])
+
+
+class TestValidators(TestCase):
+    def test_validate_encoded_field(self):
+        for value in ['', 'YQ==', 'YWI=', 'YWJj', note_content, note_content.encode()]:
+            validate_encoded_field(value)
+
+    def test_validate_encoded_field_corrupted(self):
+        for value in ['YQ', 'Y===', 'YQ=j', 'YW[j', 'YWJj\n', encrypted_name_corrupted, encrypted_name_limit_exceeded]:
+            with self.assertRaises(ValidationError):
+                validate_encoded_field(value)
+
+    def test_validate_encoded_blocks(self):
+        validate_encoded_blocks('YQ==\nYWI=\nYWJj')
+        validate_encoded_blocks(note_content)
+        for value in ['YQ==\nYQ', 'YQ==\n\nYWJj[']:
+            with self.assertRaises(ValidationError):
+                validate_encoded_blocks(value)
+
+    @override_settings(ENCRYPTED_FIELD_ENVELOPE='base85')
+    def test_validate_encoded_field_base85(self):
+        validate_encoded_field(base64.b85encode(b'ciphertext').decode())
+        with self.assertRaises(ValidationError):
+            validate_encoded_field('abc"def')
+
+
+class TestTodoListTaskCounters(TestCase):
+    def setUp(self):
+        # account setup
+        email = 'test@TeSt.com'
+        password = 'password123'
+        username = 'testname'
+        account = get_user_model().objects.create_user(email=email, username=username, password=password)
+        account.is_active = True
+        account.save()
+
+        self.name = encrypted_name
+        folder = Folder.objects.create(name=self.name, account=account)
+        self.todo_list = TodoList.objects.create(name=self.name, folder=folder)
+        self.todo_list_alt = TodoList.objects.create(name=self.name, folder=folder)
+        self.note = Note.objects.create(name=self.name, content=note_content, folder=folder)
+
+    def assertCounters(self, todo_list, total, open, closed, failed):
+        todo_list.refresh_from_db()
+        self.assertEqual(
+            (todo_list.tasks_total, todo_list.tasks_open, todo_list.tasks_closed, todo_list.tasks_failed),
+            (total, open, closed, failed),
+        )
+
+    def test_counters_follow_task_lifecycle(self):
+        task = Task.objects.create(name=self.name, todo_list=self.todo_list)
+        Task.objects.create(name=self.name, todo_list=self.todo_list)
+        self.assertCounters(self.todo_list, 2, 2, 0, 0)
+
+        task.date_closed = date.today()
+        task.failed = True
+        task.save()
+        self.assertCounters(self.todo_list, 2, 1, 1, 1)
+
+        task = Task.objects.get(pk=task.pk)
+        task.todo_list = self.todo_list_alt
+        task.save()
+        self.assertCounters(self.todo_list, 1, 1, 0, 0)
+        self.assertCounters(self.todo_list_alt, 1, 0, 1, 1)
+
+        task.delete()
+        self.assertCounters(self.todo_list_alt, 0, 0, 0, 0)
+
+    def test_counters_on_cascade(self):
+        parent = Task.objects.create(name=self.name, todo_list=self.todo_list)
+        Task.objects.create(name=self.name, todo_list=self.todo_list_alt, parent_task=parent)
+        Task.objects.create(name=self.name, todo_list=self.todo_list_alt, note=self.note)
+        self.assertCounters(self.todo_list_alt, 2, 2, 0, 0)
+
+        parent.delete()
+        self.note.delete()
+        self.assertCounters(self.todo_list, 0, 0, 0, 0)
+        self.assertCounters(self.todo_list_alt, 0, 0, 0, 0)
+
+    def test_cascade_updates_each_list_once(self):
+        for todo_list in (self.todo_list, self.todo_list_alt):
+            Task.objects.bulk_create_validated([Task(name=self.name, todo_list=todo_list, note=self.note) for _ in range(5)])
+        with CaptureQueriesContext(connection) as context:
+            self.note.delete()
+        updates = [query['sql'] for query in context.captured_queries if query['sql'].startswith('UPDATE "core_todolist"')]
+        self.assertEqual(len(updates), 2)
+        self.assertCounters(self.todo_list, 0, 0, 0, 0)
+        self.assertCounters(self.todo_list_alt, 0, 0, 0, 0)
+
+    def test_counters_clamped_at_zero(self):
+        task = Task.objects.create(name=self.name, todo_list=self.todo_list)
+        TodoList.objects.filter(pk=self.todo_list.pk).update(tasks_total=0, tasks_open=0)
+        task.delete()
+        self.assertCounters(self.todo_list, 0, 0, 0, 0)
+
+    def test_counters_bulk(self):
+        tasks = Task.objects.bulk_create_validated([Task(name=self.name, todo_list=self.todo_list) for _ in range(5)])
+        self.assertCounters(self.todo_list, 5, 5, 0, 0)
+
+        for task in tasks[:2]:
+            task.date_closed = date.today()
+        Task.objects.bulk_update_validated(tasks, ['date_closed'])
+        self.assertCounters(self.todo_list, 5, 3, 2, 0)
+
+    def test_counters_follow_update_fields(self):
+        task = Task.objects.create(name=self.name, todo_list=self.todo_list)
+        task.date_closed = date.today()
+        task.save(update_fields=['name'])
+        self.assertCounters(self.todo_list, 1, 1, 0, 0)
+
+        # the change left unsaved is still counted when it's saved later
+        task.todo_list = self.todo_list_alt
+        task.save(update_fields=['todo_list'])
+        self.assertCounters(self.todo_list, 0, 0, 0, 0)
+        self.assertCounters(self.todo_list_alt, 1, 1, 0, 0)
+        task.save(update_fields=['date_closed'])
+        self.assertCounters(self.todo_list_alt, 1, 0, 1, 0)
+
+    def test_saving_a_stale_list_keeps_counters(self):
+        todo_list = TodoList.objects.get(pk=self.todo_list.pk)
+        Task.objects.create(name=self.name, todo_list=self.todo_list)
+        todo_list.priority = TodoList.HIGH
+        todo_list.save()
+        self.assertCounters(self.todo_list, 1, 1, 0, 0)
+
+    def test_rebuild_task_counters(self):
+        Task.objects.create(name=self.name, todo_list=self.todo_list)
+        TodoList.objects.filter(pk=self.todo_list.pk).update(tasks_total=10, tasks_open=0)
+        self.assertEqual(list(TodoList.objects.with_stale_task_counters()), [self.todo_list])
+
+        call_command('rebuild_task_counters', stdout=StringIO())
+        self.assertCounters(self.todo_list, 1, 1, 0, 0)
+        self.assertFalse(TodoList.objects.with_stale_task_counters().exists())
+
+
+class TestFocusEntries(TestCase):
+    def setUp(self):
+        # account setup
+        email = 'test@TeSt.com'
+        password = 'password123'
+        username = 'testname'
+        self.account = get_user_model().objects.create_user(email=email, username=username, password=password)
+        self.account.is_active = True
+        self.account.save()
+
+        self.name = encrypted_name
+        self.today = timezone.localdate()
+        folder = Folder.objects.create(name=self.name, account=self.account)
+        self.todo_list = TodoList.objects.create(name=self.name, folder=folder)
+
+    def ranking(self):
+        return list(FocusEntry.objects.for_account(self.account).values_list('task_id', 'score'))
+
+    def test_score(self):
+        self.assertIsNone(FocusEntry.score_for(Task.NONE, None, None, self.today))
+        self.assertIsNone(FocusEntry.score_for(Task.HIGH, self.today, self.today, self.today))
+        self.assertIsNone(FocusEntry.score_for(Task.MEDIUM, self.today + timedelta(days=8), None, self.today))
+        self.assertEqual(FocusEntry.score_for(Task.HIGH, None, None, self.today), 3)
+        self.assertEqual(FocusEntry.score_for(Task.NONE, self.today + timedelta(days=7), None, self.today), 10)
+        self.assertEqual(FocusEntry.score_for(Task.LOW, self.today + timedelta(days=1), None, self.today), 21)
+        self.assertEqual(FocusEntry.score_for(Task.MEDIUM, self.today, None, self.today), 32)
+        self.assertEqual(FocusEntry.score_for(Task.NONE, self.today - timedelta(days=3), None, self.today), 40)
+
+    def test_entries_follow_task_writes(self):
+        task = Task.objects.create(name=self.name, todo_list=self.todo_list)
+        self.assertEqual(self.ranking(), [])
+
+        task.due_date = self.today
+        task.save()
+        self.assertEqual(self.ranking(), [(task.pk, 30)])
+
+        urgent = Task.objects.create(name=self.name, todo_list=self.todo_list, priority=Task.HIGH, due_date=self.today)
+        self.assertEqual(self.ranking(), [(urgent.pk, 33), (task.pk, 30)])
+
+        task.date_closed = self.today
+        task.save()
+        self.assertEqual(self.ranking(), [(urgent.pk, 33)])
+
+        urgent.delete()
+        self.assertEqual(self.ranking(), [])
+
+    def test_entries_follow_update_fields(self):
+        task = Task.objects.create(name=self.name, todo_list=self.todo_list)
+        task.priority = Task.HIGH
+        task.due_date = self.today
+        task.save(update_fields=['due_date'])
+        self.assertEqual(self.ranking(), [(task.pk, 30)])
+
+        task.due_date = None
+        task.save(update_fields=['priority'])
+        self.assertEqual(self.ranking(), [(task.pk, 33)])
+
+    def test_unrelated_saves_skip_the_ranking(self):
+        task = Task.objects.create(name=self.name, todo_list=self.todo_list)
+        task.name = encrypted_name
+        # todo list validation, savepoint, update, cache invalidation lookup, sync records (3),
+        # date_updated of the list, release
+        with self.assertNumQueries(9):
+            task.save()
+
+    def test_entries_follow_bulk_writes(self):
+        tasks = Task.objects.bulk_create_validated([
+            Task(name=self.name, todo_list=self.todo_list, priority=Task.HIGH),
+            Task(name=self.name, todo_list=self.todo_list),
+        ])
+        self.assertEqual(self.ranking(), [(tasks[0].pk, 3)])
+
+        tasks[0].priority = Task.LOW
+        tasks[1].due_date = self.today + timedelta(days=1)
+        Task.objects.bulk_update_validated(tasks, ['priority', 'due_date'])
+        self.assertEqual(self.ranking(), [(tasks[1].pk, 20)])
+
+    def test_rollover(self):
+        task = Task.objects.create(name=self.name, todo_list=self.todo_list, due_date=self.today + timedelta(days=8))
+        self.assertEqual(self.ranking(), [])
+
+        FocusEntry.objects.roll_over([self.account.pk], today=self.today + timedelta(days=1))
+        self.assertEqual(self.ranking(), [(task.pk, 10)])
+        FocusEntry.objects.roll_over([self.account.pk], today=self.today + timedelta(days=9))
+        self.assertEqual(self.ranking(), [(task.pk, 40)])
+
+        out = StringIO()
+        call_command('rollover_focus', stdout=out)
+        self.assertIn('1 accounts', out.getvalue())
+        self.assertEqual(self.ranking(), [])
+
+
+class TestHistory(TestCase):
+    def setUp(self):
+        # account setup
+        email = 'test@TeSt.com'
+        password = 'password123'
+        username = 'testname'
+        self.account = get_user_model().objects.create_user(email=email, username=username, password=password)
+        self.account.is_active = True
+        self.account.save()
+
+        self.name = encrypted_name
+        self.folder = Folder.objects.create(name=self.name, account=self.account)
+        self.todo_list = TodoList.objects.create(name=self.name, folder=self.folder)
+
+    def history(self, model):
+        return list(model.objects.for_account(self.account).values_list('kind', 'priority', 'due_date'))
+
+    def test_task_history(self):
+        due_date = date.today() + timedelta(days=3)
+        task = Task.objects.create(name=self.name, todo_list=self.todo_list, priority=Task.HIGH)
+        self.assertEqual(self.history(TaskHistory), [(TaskHistory.PRIORITY, Task.HIGH, None)])
+
+        task.due_date = due_date
+        task.save()
+        task.priority = Task.HIGH
+        task.name = encrypted_name
+        task.save()
+        task.priority = Task.LOW
+        task.save()
+        self.assertEqual(self.history(TaskHistory), [
+            (TaskHistory.PRIORITY, Task.HIGH, None),
+            (TaskHistory.DUE_DATE, None, due_date),
+            (TaskHistory.PRIORITY, Task.LOW, None),
+        ])
+        self.assertEqual(task.history.count(), 3)
+
+        task.delete()
+        self.assertEqual(self.history(TaskHistory), [])
+
+    def test_todo_list_history(self):
+        self.todo_list.priority = TodoList.MEDIUM
+        self.todo_list.save()
+        self.todo_list.due_date = None
+        self.todo_list.save()
+        self.assertEqual(self.history(TodoListHistory), [(TodoListHistory.PRIORITY, TodoList.MEDIUM, None)])
+
+    def test_history_follows_update_fields(self):
+        task = Task.objects.create(name=self.name, todo_list=self.todo_list)
+        self.todo_list.priority = task.priority = Task.HIGH
+        task.due_date = self.todo_list.due_date = date.today()
+        task.save(update_fields=['due_date'])
+        self.todo_list.save(update_fields=['due_date'])
+        self.assertEqual(self.history(TaskHistory), [(TaskHistory.DUE_DATE, None, date.today())])
+        self.assertEqual(self.history(TodoListHistory), [(TodoListHistory.DUE_DATE, None, date.today())])
+
+        # the unsaved priority is recorded once it's saved
+        task.save()
+        self.assertEqual(self.history(TaskHistory)[-1], (TaskHistory.PRIORITY, Task.HIGH, None))
+
+    def test_unchanged_saves_write_no_history(self):
+        task = Task.objects.create(name=self.name, todo_list=self.todo_list)
+        task = Task.objects.get(pk=task.pk)
+        task.name = encrypted_name
+        # todo list validation, savepoint, update, cache invalidation lookup, sync records (3),
+        # date_updated of the list, release
+        with self.assertNumQueries(9):
+            task.save()
+        self.assertEqual(self.history(TaskHistory), [])
+
+    def test_bulk_history(self):
+        tasks = Task.objects.bulk_create_validated(
+            [Task(name=self.name, todo_list=self.todo_list, priority=Task.MEDIUM) for _ in range(3)]
+        )
+        for task in tasks[:2]:
+            task.priority = Task.LOW
+        tasks[2].due_date = date.today()
+        Task.objects.bulk_update_validated(tasks, ['priority'])
+        # the due date wasn't part of the update
+        self.assertEqual(
+            self.history(TaskHistory),
+            [(TaskHistory.PRIORITY, Task.MEDIUM, None)] * 3 + [(TaskHistory.PRIORITY, Task.LOW, None)] * 2,
+        )
+
+        todo_lists = TodoList.objects.bulk_create_validated(
+            [TodoList(name=self.name, folder=self.folder, due_date=date.today()) for _ in range(2)]
+        )
+        todo_lists[0].due_date = None
+        TodoList.objects.bulk_update_validated(todo_lists, ['due_date'])
+        self.assertEqual(self.history(TodoListHistory), [(TodoListHistory.DUE_DATE, None, date.today())] * 2 + [(TodoListHistory.DUE_DATE, None, None)])
+
+    def test_account_bounds(self):
+        Task.objects.create(name=self.name, todo_list=self.todo_list, priority=Task.HIGH)
+        now = timezone.now()
+        self.assertEqual(TaskHistory.objects.for_account(self.account, since=now - timedelta(minutes=1), until=now + timedelta(minutes=1)).count(), 1)
+        self.assertEqual(TaskHistory.objects.for_account(self.account, since=now + timedelta(minutes=1)).count(), 0)
+
+
+class TestTimers(TestCase):
+    def setUp(self):
+        # account setup
+        email = 'test@TeSt.com'
+        password = 'password123'
+        username = 'testname'
+        self.account = get_user_model().objects.create_user(email=email, username=username, password=password)
+        self.account.is_active = True
+        self.account.save()
+
+        self.name = encrypted_name
+        folder = Folder.objects.create(name=self.name, account=self.account)
+        self.todo_list = TodoList.objects.create(name=self.name, folder=folder)
+        self.task = Task.objects.create(name=self.name, todo_list=self.todo_list)
+        self.start = timezone.make_aware(datetime(2026, 3, 1, 23, 30))
+
+    def test_start_is_a_single_insert(self):
+        # savepoint, insert, release
+        with self.assertNumQueries(3):
+            timer = Timer.objects.start(self.task, self.account, now=self.start)
+        self.assertEqual(list(Timer.objects.running().filter(account=self.account)), [timer])
+
+    def test_one_running_timer_per_task(self):
+        Timer.objects.start(self.task, self.account, now=self.start)
+        with self.assertRaisesMessage(ValidationError, 'the task already has a running timer'):
+            Timer.objects.start(self.task, self.account, now=self.start)
+
+    def test_stop_rolls_up(self):
+        Timer.objects.start(self.task, self.account, now=self.start)
+        timer = Timer.objects.stop(self.task, now=self.start + timedelta(hours=1))
+        self.assertEqual(timer.duration(), 3600)
+        self.assertIsNone(Timer.objects.stop(self.task))
+        self.assertFalse(Timer.objects.running().exists())
+
+        # the second timer's rollup row for March 2nd already exists
+        Timer.objects.start(self.task, self.account, now=self.start + timedelta(hours=2))
+        Timer.objects.stop(self.task, now=self.start + timedelta(hours=2, minutes=10))
+
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.time_spent, 3600 + 600)
+        self.assertEqual(
+            list(TimeRollup.objects.for_account(self.account).per_day()),
+            [{'day': date(2026, 3, 1), 'seconds': 1800}, {'day': date(2026, 3, 2), 'seconds': 1800 + 600}],
+        )
+        self.assertEqual(
+            list(TimeRollup.objects.for_account(self.account, since=date(2026, 3, 2)).per_todo_list()),
+            [{'todo_list': self.todo_list.pk, 'seconds': 2400}],
+        )
+
+    def test_saving_a_stale_task_keeps_time_spent(self):
+        task = Task.objects.get(pk=self.task.pk)
+        Timer.objects.start(self.task, self.account, now=self.start)
+        Timer.objects.stop(self.task, now=self.start + timedelta(minutes=1))
+        task.priority = Task.HIGH
+        task.save()
+        task.refresh_from_db()
+        self.assertEqual(task.time_spent, 60)
+
+
+class TestHabits(TestCase):
+    def setUp(self):
+        # account setup
+        email = 'test@TeSt.com'
+        password = 'password123'
+        username = 'testname'
+        account = get_user_model().objects.create_user(email=email, username=username, password=password)
+        account.is_active = True
+        account.save()
+
+        self.name = encrypted_name
+        folder = Folder.objects.create(name=self.name, account=account)
+        self.todo_list = TodoList.objects.create(name=self.name, folder=folder)
+        self.monday = date(2026, 3, 2)
+
+    def habit(self, period, priority=Task.NONE):
+        task = Task.objects.create(name=self.name, todo_list=self.todo_list, priority=priority)
+        return Habit.start_from(task, period, today=self.monday)
+
+    def test_periods(self):
+        self.assertEqual(Habit.period_start(Habit.WEEKLY, date(2026, 3, 8)), self.monday)
+        self.assertEqual(Habit.period_start(Habit.MONTHLY, date(2026, 3, 8)), date(2026, 3, 1))
+        self.assertEqual(Habit.next_period_start(Habit.MONTHLY, date(2026, 12, 1)), date(2027, 1, 1))
+        self.assertEqual(Habit.next_period_start(Habit.DAILY, self.monday), date(2026, 3, 3))
+
+    def test_spawn(self):
+        daily = self.habit(Habit.DAILY, priority=Task.HIGH)
+        weekly = self.habit(Habit.WEEKLY)
+        self.assertEqual(Habit.objects.spawn_due(self.monday), 0)
+
+        tuesday = self.monday + timedelta(days=1)
+        self.assertEqual(Habit.objects.spawn_due(tuesday), 1)
+        daily.refresh_from_db()
+        self.assertEqual((daily.task.habit_period, daily.task.due_date, daily.task.priority), (tuesday, tuesday, Task.HIGH))
+        self.assertEqual(daily.next_due, tuesday + timedelta(days=1))
+
+        # a week and a day later: one occurrence each, missed days aren't caught up on
+        self.assertEqual(Habit.objects.spawn_due(self.monday + timedelta(days=8)), 2)
+        weekly.refresh_from_db()
+        self.assertEqual((weekly.task.habit_period, weekly.task.due_date), (self.monday + timedelta(days=7), self.monday + timedelta(days=13)))
+        self.assertEqual(daily.occurrences.count(), 3)
+
+        self.todo_list.refresh_from_db()
+        self.assertEqual(self.todo_list.tasks_total, 5)
+
+    def test_reruns_never_duplicate(self):
+        habit = self.habit(Habit.DAILY)
+        tuesday = self.monday + timedelta(days=1)
+        Habit.objects.spawn_due(tuesday)
+        # as if the scheduler's update had been lost
+        Habit.objects.filter(pk=habit.pk).update(next_due=tuesday)
+        Habit.objects.spawn_due(tuesday)
+        self.assertEqual(habit.occurrences.filter(habit_period=tuesday).count(), 1)
+        habit.refresh_from_db()
+        self.assertEqual(habit.next_due, tuesday + timedelta(days=1))
+
+    def test_constant_queries(self):
+        for _ in range(20):
+            self.habit(Habit.DAILY)
+        # due habits, spawned periods, todo list and habit validation, insert, cache invalidation,
+        # sync records (3), counters, focus entries (2), history (2), metrics day flag, habits update
+        # and three savepoints with their releases, however many habits are due
+        with self.assertNumQueries(22):
+            self.assertEqual(Habit.objects.spawn_due(self.monday + timedelta(days=1)), 20)
+
+    def test_deleted_template(self):
+        habit = self.habit(Habit.DAILY)
+        habit.task.delete()
+        Habit.objects.spawn_due(self.monday + timedelta(days=1))
+        habit.refresh_from_db()
+        self.assertFalse(habit.active)
+        self.assertFalse(Task.objects.exists())
+
+    def test_command(self):
+        self.habit(Habit.DAILY)
+        out = StringIO()
+        call_command('spawn_habits', stdout=out)
+        self.assertIn('1 due habits handled', out.getvalue())
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        # account setup
+        email = 'test@TeSt.com'
+        password = 'password123'
+        username = 'testname'
+        self.account = get_user_model().objects.create_user(email=email, username=username, password=password)
+        self.account.is_active = True
+        self.account.save()
+
+        self.name = encrypted_name
+        folder = Folder.objects.create(name=self.name, account=self.account)
+        self.todo_list = TodoList.objects.create(name=self.name, folder=folder)
+        self.today = timezone.localdate()
+
+    def task(self, created, **fields):
+        task = Task.objects.create(name=self.name, todo_list=self.todo_list, **fields)
+        Task.objects.filter(pk=task.pk).update(date_created=timezone.make_aware(datetime.combine(created, datetime.min.time())))
+        return Task.objects.get(pk=task.pk)
+
+    def dirty_days(self):
+        return set(MetricsDirtyDay.objects.values_list('day', flat=True))
+
+    def test_writes_flag_days(self):
+        created = self.today - timedelta(days=3)
+        task = self.task(created)
+        self.assertEqual(self.dirty_days(), {self.today})
+
+        MetricsDirtyDay.objects.all().delete()
+        task.name = encrypted_name
+        task.save()
+        self.assertEqual(self.dirty_days(), set())
+
+        task.date_closed = self.today - timedelta(days=1)
+        task.save()
+        self.assertEqual(self.dirty_days(), {self.today - timedelta(days=1)})
+
+        MetricsDirtyDay.objects.all().delete()
+        task.delete()
+        self.assertEqual(self.dirty_days(), {created, self.today - timedelta(days=1)})
+
+    def test_refresh(self):
+        monday = self.today - timedelta(days=self.today.weekday() + 7)
+        self.task(monday, due_date=monday + timedelta(days=1), date_closed=monday + timedelta(days=2))
+        self.task(monday, due_date=monday + timedelta(days=5), date_closed=monday + timedelta(days=2), failed=True)
+        self.task(monday + timedelta(days=1), date_closed=monday + timedelta(days=1))
+        self.task(monday + timedelta(days=1))
+        MetricsDirtyDay.objects.mark([monday, monday + timedelta(days=1), monday + timedelta(days=2)])
+
+        self.assertEqual(DailyMetrics.objects.refresh_dirty(), 4)
+        self.assertEqual(self.dirty_days(), set())
+        day = DailyMetrics.objects.get(account=self.account, day=monday + timedelta(days=2))
+        self.assertEqual((day.created, day.closed, day.failed, day.closed_on_time, day.lead_time_days), (0, 2, 1, 1, 4))
+
+        [week] = metrics.performance(self.account, 'week', since=monday, until=monday + timedelta(days=7))
+        self.assertEqual(week['start'], monday)
+        self.assertEqual((week['created'], week['closed'], week['failed']), (4, 3, 1))
+        self.assertEqual(week['completion_rate'], 0.5)
+        self.assertEqual(week['on_time_ratio'], 0.5)
+        self.assertEqual(week['lead_time_days'], round(4 / 3, 4))
+
+        # refreshing again replaces the rows rather than adding to them
+        DailyMetrics.objects.refresh([monday + timedelta(days=2)])
+        self.assertEqual(DailyMetrics.objects.filter(day=monday + timedelta(days=2)).count(), 1)
+
+    def test_closed_before_created(self):
+        day = self.today - timedelta(days=3)
+        self.task(day + timedelta(days=2), date_closed=day)
+        self.task(day - timedelta(days=1), date_closed=day)
+
+        DailyMetrics.objects.refresh([day])
+        metrics = DailyMetrics.objects.get(account=self.account, day=day)
+        self.assertEqual((metrics.closed, metrics.lead_time_days), (2, 1))
+
+    def test_update_fields_flag_saved_days(self):
+        task = self.task(self.today)
+        MetricsDirtyDay.objects.all().delete()
+        task.date_closed = self.today - timedelta(days=1)
+        task.save(update_fields=['name'])
+        self.assertEqual(self.dirty_days(), set())
+
+    def test_command(self):
+        self.task(self.today)
+        out = StringIO()
+        call_command('refresh_metrics', stdout=out)
+        self.assertIn('refreshed 1 days', out.getvalue())
+        self.assertEqual(metrics.performance(self.account)[0]['created'], 1)
+
+
+class TestArchive(TestCase):
+    def setUp(self):
+        accounts = []
+        for email in ['test@TeSt.com', 'other@test.com']:
+            account = get_user_model().objects.create_user(email=email, username='testname', password='password123')
+            account.is_active = True
+            account.save()
+            accounts.append(account)
+        self.account, self.other = accounts
+
+        self.name = encrypted_name
+        root = Folder.objects.create(name=self.name, account=self.account)
+        child = Folder.objects.create(name=self.name, account=self.account, parent=root)
+        Folder.objects.create(name=self.name, account=self.account, parent=child)
+        self.note = Note.objects.create(name=self.name, content='YQ==', folder=child, pinned=True)
+        Note.objects.create(name=self.name, content='YQ==', folder=root).apply_block_patch(2, {0: 'Yg==', 1: 'Yw=='})
+        todo_list = TodoList.objects.create(name=self.name, folder=child, priority=TodoList.HIGH)
+        parent = Task.objects.create(name=self.name, todo_list=todo_list, due_date=date(2026, 3, 1))
+        # created before its parent task: the parent can't be linked on insert
+        self.subtask = Task.objects.create(name=self.name, todo_list=todo_list, note=self.note)
+        Task.objects.filter(pk=self.subtask.pk).update(parent_task=parent)
+        Task.objects.filter(pk=parent.pk).update(date_created=timezone.make_aware(datetime(2026, 1, 5)))
+
+    def export(self, account):
+        stream = StringIO()
+        archive.export_account(account, stream, chunk_size=2)
+        return stream.getvalue()
+
+    def snapshot(self, account):
+        """The account's workspace without primary keys."""
+        folders = {folder.pk: folder for folder in Folder.objects.filter(account=account)}
+        notes = {note.pk: note for note in Note.objects.filter(folder__account=account)}
+        tasks = {task.pk: task for task in Task.objects.for_account(account)}
+
+        def depth(folder_id):
+            return len(folders[folder_id].ancestor_ids())
+
+        return {
+            'folders': sorted(len(folder.ancestor_ids()) for folder in folders.values()),
+            'notes': sorted(
+                (note.load_content(), note.pinned, note.date_created, depth(note.folder_id)) for note in notes.values()
+            ),
+            'todo_lists': [
+                (todo_list.priority, todo_list.tasks_total, depth(todo_list.folder_id))
+                for todo_list in TodoList.objects.for_account(account)
+            ],
+            'tasks': sorted(
+                (
+                    task.date_created, task.due_date, task.parent_task_id is not None,
+                    tasks[task.parent_task_id].due_date if task.parent_task_id else None,
+                    notes[task.note_id].pinned if task.note_id else None,
+                )
+                for task in tasks.values()
+            ),
+        }
+
+    def test_round_trip(self):
+        counts = archive.import_account(self.other, StringIO(self.export(self.account)), batch_size=2)
+        self.assertEqual(counts, {'folder': 3, 'note': 2, 'note_block': 2, 'todo_list': 1, 'task': 2})
+        self.assertEqual(self.snapshot(self.other), self.snapshot(self.account))
+        # imported tasks are in the metrics of the day they were created on
+        self.assertTrue(MetricsDirtyDay.objects.filter(day=date(2026, 1, 5)).exists())
+
+    def test_broken_archives_import_nothing(self):
+        lines = self.export(self.account).splitlines()
+        for broken in [lines[1:], [lines[0], *lines[2:]], [lines[0], '{"model": "folder"}']]:
+            with self.assertRaises(archive.ArchiveError):
+                archive.import_account(self.other, broken)
+        self.assertFalse(Folder.objects.filter(account=self.other).exists())
+
+    def test_commands(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'account.ndjson.gz')
+            call_command('export_account', self.account.email, output=path, stdout=StringIO())
+            out = StringIO()
+            call_command('import_account', self.other.email, path, stdout=out)
+        self.assertIn('imported 3 folders', out.getvalue())
+        self.assertEqual(Task.objects.for_account(self.other).count(), 2)
+
+
+class TestSubtreeDeletion(TestCase):
+    def setUp(self):
+        # account setup
+        email = 'test@TeSt.com'
+        password = 'password123'
+        username = 'testname'
+        self.account = get_user_model().objects.create_user(email=email, username=username, password=password)
+        self.account.is_active = True
+        self.account.save()
+
+        self.name = encrypted_name
+        self.kept = Folder.objects.create(name=self.name, account=self.account)
+        self.kept_list = TodoList.objects.create(name=self.name, folder=self.kept)
+
+    def project(self, tasks):
+        """A three level subtree with `tasks` tasks (plus a subtask each) and everything hanging off them."""
+        root = Folder.objects.create(name=self.name, account=self.account)
+        child = Folder.objects.create(name=self.name, account=self.account, parent=root)
+        grandchild = Folder.objects.create(name=self.name, account=self.account, parent=child)
+        note = Note.objects.create(name=self.name, content='YQ==', folder=grandchild)
+        note.apply_block_patch(2, {0: 'Yg==', 1: 'Yw=='})
+        todo_list = TodoList.objects.create(name=self.name, folder=child)
+        parents = Task.objects.bulk_create_validated(
+            Task(name=self.name, todo_list=todo_list, priority=Task.HIGH) for _ in range(tasks)
+        )
+        Task.objects.bulk_create_validated(Task(name=self.name, todo_list=todo_list, parent_task=task) for task in parents)
+        Timer.objects.start(parents[0], self.account)
+        Habit.start_from(parents[0], Habit.DAILY)
+        # lives outside the subtree, but goes with the note it's attached to
+        Task.objects.create(name=self.name, todo_list=self.kept_list, note=note)
+        return root
+
+    def test_deletes_the_subtree(self):
+        root = self.project(tasks=5)
+        deleted = SubtreeDeleter(batch_size=3).delete_folder(root)
+
+        self.assertEqual(list(Folder.objects.all()), [self.kept])
+        for model in [Note, NoteBlock, TaskHistory, FocusEntry, Timer]:
+            self.assertFalse(model.objects.exists(), model)
+        self.assertEqual(list(TodoList.objects.all()), [self.kept_list])
+        self.assertFalse(Task.objects.exists())
+        self.assertEqual(deleted['core.Task'], 11)
+        self.assertEqual(deleted['core.Folder'], 3)
+        self.assertIsNone(Habit.objects.get().task)
+        self.assertFalse(TodoList.objects.with_stale_task_counters().exists())
+
+    def test_constant_queries(self):
+        def queries(tasks):
+            root = self.project(tasks)
+            with CaptureQueriesContext(connection) as context:
+                SubtreeDeleter(batch_size=100).delete_folder(root)
+            return len(context)
+
+        self.assertEqual(queries(2), queries(40))
+
+    def test_failed_run_invalidates_the_cache(self):
+        class FailingDeleter(SubtreeDeleter):
+            def forget_tasks(self, ids, via):
+                raise RuntimeError('interrupted')
+
+        root = self.project(tasks=4)
+        versions = cache.section_versions(self.account.pk, cache.SECTIONS)
+        with self.assertRaises(RuntimeError):
+            FailingDeleter(batch_size=2).delete_folder(root)
+        self.assertNotEqual(cache.section_versions(self.account.pk, cache.SECTIONS), versions)
+        self.assertTrue(Folder.objects.filter(pk=root.pk).exists())
+
+    def test_background_deletion(self):
+        root = self.project(tasks=2)
+        deletion = FolderDeletion.objects.create(account=self.account, folder=root)
+        self.assertEqual(run_pending_deletion(batch_size=2).pk, deletion.pk)
+        self.assertIsNone(run_pending_deletion())
+
+        deletion.refresh_from_db()
+        self.assertIsNone(deletion.folder)
+        self.assertIsNotNone(deletion.date_finished)
+        self.assertEqual(deletion.deleted['core.Task'], 5)
+        self.assertFalse(Folder.objects.filter(pk=root.pk).exists())
+
+    def test_command(self):
+        FolderDeletion.objects.create(account=self.account, folder=self.project(tasks=1))
+        out = StringIO()
+        call_command('delete_folders', stdout=out)
+        self.assertIn('3 core.Task', out.getvalue())
+
+
+class RecordingBroker:
+    """Broker stand-in: records what gets published."""
+
+    def __init__(self):
+        self.published = []
+
+    def publish(self, account_id, changes):
+        self.published.append((account_id, changes))
+
+
+@override_settings(CHANGE_BROKER='core.tests.tests.RecordingBroker')
+class TestChangeFeed(TestCase):
+    def setUp(self):
+        # account setup
+        email = 'test@TeSt.com'
+        password = 'password123'
+        username = 'testname'
+        self.account = get_user_model().objects.create_user(email=email, username=username, password=password)
+        self.account.is_active = True
+        self.account.save()
+
+        self.name = encrypted_name
+        self.folder = Folder.objects.create(name=self.name, account=self.account)
+        self.note = Note.objects.create(name=self.name, content=note_content, folder=self.folder)
+        self.todo_list = TodoList.objects.create(name=self.name, folder=self.folder)
+        # a fresh stand-in per test
+        changes.get_broker.cache_clear()
+
+    def published(self):
+        return changes.get_broker().published
+
+    def test_save_publishes_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.note.pinned = True
+            self.note.save()
+            self.assertEqual(self.published(), [])
+        self.assertEqual(self.published(), [(self.account.pk, [
+            {'model': 'note', 'id': self.note.pk, 'date_updated': self.note.date_updated, 'deleted': False},
+        ])])
+
+    def test_rolled_back_writes_are_not_published(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    Task.objects.create(name=self.name, todo_list=self.todo_list)
+                    raise ValidationError('rolled back')
+            except ValidationError:
+                pass
+        self.assertEqual(self.published(), [])
+
+    def test_bulk_writes_publish_once_per_account(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            tasks = Task.objects.bulk_create_validated(Task(name=self.name, todo_list=self.todo_list) for _ in range(3))
+        [(account_id, published)] = self.published()
+        self.assertEqual(account_id, self.account.pk)
+        self.assertEqual([(change['model'], change['id']) for change in published], [('task', task.pk) for task in tasks])
+
+    def test_delete_publishes_the_deleted_object_only(self):
+        Task.objects.create(name=self.name, todo_list=self.todo_list)
+        folder_pk = self.folder.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            self.folder.delete()
+        self.assertEqual(self.published(), [(self.account.pk, [
+            {'model': 'folder', 'id': folder_pk, 'date_updated': None, 'deleted': True},
+        ])])
+
+    def test_delete_publishes_cascaded_tasks(self):
+        parent = Task.objects.create(name=self.name, todo_list=self.todo_list)
+        subtask = Task.objects.create(name=self.name, todo_list=self.todo_list, parent_task=parent)
+        parent_pk = parent.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            parent.delete()
+        published = [(change['model'], change['id'], change['deleted']) for _, changes in self.published() for change in changes]
+        self.assertEqual(sorted(published), [('task', parent_pk, True), ('task', subtask.pk, True)])
+
+    def test_subtree_deletion_publishes_the_folder(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            SubtreeDeleter().delete_folder(self.folder)
+        self.assertEqual(self.published()[-1], (self.account.pk, [
+            {'model': 'folder', 'id': self.folder.pk, 'date_updated': None, 'deleted': True},
+        ]))
+
+
+class TestInProcessBroker(TestCase):
+    async def test_bursts_coalesce(self):
+        broker = changes.InProcessBroker()
+        subscription = broker.subscribe(1)
+        other = broker.subscribe(2)
+        for second in range(3):
+            broker.publish(1, [{'model': 'note', 'id': 5, 'date_updated': second, 'deleted': False}])
+        broker.publish(1, [{'model': 'task', 'id': 5, 'date_updated': None, 'deleted': True}])
+
+        self.assertEqual(await subscription.get(), [
+            {'model': 'note', 'id': 5, 'date_updated': 2, 'deleted': False},
+            {'model': 'task', 'id': 5, 'date_updated': None, 'deleted': True},
+        ])
+        self.assertFalse(other.ready.is_set())
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(subscription.get(), timeout=0.01)
+
+        subscription.close()
+        other.close()
+        self.assertEqual(broker.subscriptions, {})
+
+    async def test_publish_from_another_thread(self):
+        broker = changes.InProcessBroker()
+        subscription = broker.subscribe(1)
+        change = {'model': 'folder', 'id': 1, 'date_updated': None, 'deleted': False}
+        await asyncio.get_running_loop().run_in_executor(None, broker.publish, 1, [change])
+        self.assertEqual(await asyncio.wait_for(subscription.get(), timeout=1), [change])
+        subscription.close()
+
+
+class TestSyncRecords(TestCase):
+    def setUp(self):
+        # account setup
+        email = 'test@TeSt.com'
+        password = 'password123'
+        username = 'testname'
+        self.account = get_user_model().objects.create_user(email=email, username=username, password=password)
+        self.account.is_active = True
+        self.account.save()
+
+        self.name = encrypted_name
+        self.folder = Folder.objects.create(name=self.name, account=self.account)
+        self.todo_list = TodoList.objects.create(name=self.name, folder=self.folder)
+
+    def records(self, since=0):
+        return list(SyncRecord.objects.since(self.account, since).values_list('model', 'object_id', 'deleted', 'sequence'))
+
+    def test_every_write_is_numbered(self):
+        note = Note.objects.create(name=self.name, content=note_content, folder=self.folder)
+        self.assertEqual(self.records(), [
+            ('folder', self.folder.pk, False, 1),
+            ('todo_list', self.todo_list.pk, False, 2),
+            ('note', note.pk, False, 3),
+        ])
+        note.pinned = True
+        note.save()
+        # one record per object, moved to the end of the sequence
+        self.assertEqual(self.records(since=2), [('note', note.pk, False, 4)])
+        self.assertEqual(SyncCounter.objects.get(account=self.account).sequence, 4)
+
+    def test_task_writes_record_their_list(self):
+        task = Task.objects.create(name=self.name, todo_list=self.todo_list)
+        self.assertEqual(self.records(since=2), [('task', task.pk, False, 3), ('todo_list', self.todo_list.pk, False, 4)])
+
+        Timer.objects.start(task, self.account)
+        Timer.objects.stop(task)
+        self.assertEqual(self.records(since=4), [('task', task.pk, False, 5), ('todo_list', self.todo_list.pk, False, 6)])
+
+    def test_deletes_leave_tombstones(self):
+        task = Task.objects.create(name=self.name, todo_list=self.todo_list)
+        task_pk = task.pk
+        task.delete()
+        self.assertEqual(self.records(since=4), [('task', task_pk, True, 5), ('todo_list', self.todo_list.pk, False, 6)])
+
+        folder_pk = self.folder.pk
+        self.folder.delete()
+        self.assertEqual(self.records(since=6), [('folder', folder_pk, True, 7)])
+
+    def test_cascaded_tasks_leave_tombstones(self):
+        note = Note.objects.create(name=self.name, content=note_content, folder=self.folder)
+        other_list = TodoList.objects.create(name=self.name, folder=Folder.objects.create(name=self.name, account=self.account))
+        linked = Task.objects.create(name=self.name, todo_list=other_list, note=note)
+        subtask = Task.objects.create(name=self.name, todo_list=self.todo_list, parent_task=linked)
+        since = SyncCounter.objects.get(account=self.account).sequence
+
+        note_pk = note.pk
+        note.delete()
+        self.assertEqual({record[:3] for record in self.records(since)}, {
+            ('note', note_pk, True), ('task', linked.pk, True), ('task', subtask.pk, True),
+            ('todo_list', other_list.pk, False), ('todo_list', self.todo_list.pk, False),
+        })
+
+    def test_bulk_writes_are_numbered_in_one_go(self):
+        tasks = Task.objects.bulk_create_validated(Task(name=self.name, todo_list=self.todo_list) for _ in range(3))
+        self.assertEqual(self.records(since=2), [
+            *[('task', task.pk, False, sequence) for task, sequence in zip(tasks, [3, 4, 5])],
+            ('todo_list', self.todo_list.pk, False, 6),
+        ])
+
+    def test_counter_is_locked_last(self):
+        writes = [Task.objects.create, lambda **fields: Task.objects.bulk_create_validated([Task(**fields)])]
+        for write in writes:
+            with CaptureQueriesContext(connection) as context:
+                write(name=self.name, todo_list=self.todo_list)
+            updates = [query['sql'] for query in context.captured_queries if query['sql'].startswith('UPDATE')]
+            self.assertIn('core_todolist', updates[0])
+            self.assertIn('core_synccounter', updates[-1])
+
+    def test_accounts_have_their_own_sequences(self):
+        other = get_user_model().objects.create_user(email='other@test.com', username='other', password='password123')
+        other.is_active = True
+        other.save()
+        folder = Folder.objects.create(name=self.name, account=other)
+        self.assertEqual(list(SyncRecord.objects.since(other, 0).values_list('object_id', 'sequence')), [(folder.pk, 1)])
+        self.assertEqual(len(self.records()), 2)
+
+
+class TestNoteTaskLinks(TestCase):
+    def setUp(self):
+        # account setup
+        email = 'test@TeSt.com'
+        password = 'password123'
+        username = 'testname'
+        self.account = get_user_model().objects.create_user(email=email, username=username, password=password)
+        self.account.is_active = True
+        self.account.save()
+
+        self.name = encrypted_name
+        self.folder = Folder.objects.create(name=self.name, account=self.account)
+        self.note = Note.objects.create(name=self.name, content=note_content, folder=self.folder)
+        self.todo_list = TodoList.objects.create(name=self.name, folder=self.folder)
+        self.tasks = Task.objects.bulk_create_validated(Task(name=self.name, todo_list=self.todo_list) for _ in range(4))
+
+    def links(self, note=None):
+        return list(Task.objects.linked_to(note or self.note).values_list('pk', 'note_position'))
+
+    def test_links_follow_the_manifest(self):
+        a, b, c, d = (task.pk for task in self.tasks)
+        Task.objects.link_note(self.note, [c, a, b])
+        self.assertEqual(self.links(), [(c, 0), (a, 1), (b, 2)])
+
+        # reordered, one detached, one attached: only the changed tasks are written
+        changed = Task.objects.link_note(self.note, [a, c, d])
+        self.assertEqual(self.links(), [(a, 0), (c, 1), (d, 2)])
+        self.assertEqual({task.pk for task in changed}, {a, b, c, d})
+        self.assertIsNone(Task.objects.get(pk=b).note_position)
+        self.assertEqual(Task.objects.link_note(self.note, [a, c, d]), [])
+
+    def test_links_move_the_todo_list(self):
+        before = TodoList.objects.get(pk=self.todo_list.pk).date_updated
+        Task.objects.link_note(self.note, [self.tasks[0].pk])
+        self.assertGreater(TodoList.objects.get(pk=self.todo_list.pk).date_updated, before)
+
+    def test_repeated_markers_keep_the_first_position(self):
+        a, b = self.tasks[0].pk, self.tasks[1].pk
+        Task.objects.link_note(self.note, [a, b, a])
+        self.assertEqual(self.links(), [(a, 0), (b, 1)])
+
+    def test_moves_tasks_from_another_note(self):
+        other = Note.objects.create(name=self.name, content=note_content, folder=self.folder)
+        a = self.tasks[0].pk
+        Task.objects.link_note(other, [a])
+        Task.objects.link_note(self.note, [a])
+        self.assertEqual(self.links(other), [])
+        self.assertEqual(self.links(), [(a, 0)])
+
+    def test_other_accounts_tasks(self):
+        other = get_user_model().objects.create_user(email='other@test.com', username='other', password='password123')
+        other.is_active = True
+        other.save()
+        folder = Folder.objects.create(name=self.name, account=other)
+        task = Task.objects.create(name=self.name, todo_list=TodoList.objects.create(name=self.name, folder=folder))
+        with self.assertRaises(ValidationError):
+            Task.objects.link_note(self.note, [self.tasks[0].pk, task.pk])
+        self.assertEqual(self.links(), [])
+
+    def test_constant_queries(self):
+        def queries(count):
+            tasks = Task.objects.bulk_create_validated(Task(name=self.name, todo_list=self.todo_list) for _ in range(count))
+            with CaptureQueriesContext(connection) as context:
+                Task.objects.link_note(self.note, [task.pk for task in tasks])
+            return len(context)
+
+        self.assertEqual(queries(2), queries(40))
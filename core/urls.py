@@ -0,0 +1,26 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'core'
+
+urlpatterns = [
+    path('workspace/', views.workspace, name='workspace'),
+    path('folders/<int:pk>/', views.folder_detail, name='folder-detail'),
+    path('folders/<int:pk>/notes/', views.folder_notes, name='folder-notes'),
+    path('folders/<int:pk>/delete/', views.folder_delete, name='folder-delete'),
+    path('folder-deletions/<int:pk>/', views.folder_deletion, name='folder-deletion'),
+    path('notes/<int:pk>/', views.note_detail, name='note-detail'),
+    path('notes/<int:pk>/blocks/', views.note_blocks, name='note-blocks'),
+    path('notes/<int:pk>/tasks/', views.note_tasks, name='note-tasks'),
+    path('todo-lists/<int:pk>/', views.todo_list_detail, name='todo-list-detail'),
+    path('todo-lists/<int:pk>/tasks/', views.todo_list_tasks, name='todo-list-tasks'),
+    path('changes/', views.sync_changes, name='sync-changes'),
+    path('changes/stream/', views.change_feed, name='change-feed'),
+    path('focus/', views.focus, name='focus'),
+    path('tasks/<int:pk>/timer/start/', views.timer_start, name='timer-start'),
+    path('tasks/<int:pk>/timer/stop/', views.timer_stop, name='timer-stop'),
+    path('timers/running/', views.running_timers, name='running-timers'),
+    path('time-spent/', views.time_spent, name='time-spent'),
+    path('performance/', views.performance, name='performance'),
+]
@@ -1,13 +1,32 @@
 from django.core.exceptions import ValidationError
-import base64
-from binascii import Error as DecodingError
 from datetime import date
 
-# todo: put the encryption algorithm in a config so that it can be changed later without rewriting a lot of code
+from .envelopes import get_envelope
+
+
+BLOCK_SEPARATOR = '\n'
+
+
 def validate_encoded_field(value):
-    try:
-        base64.b64decode(value)
-    except DecodingError:
+    if not get_envelope().validate(value):
+        raise ValidationError('data is corrupted')
+
+
+def block_spans(value, separator=BLOCK_SEPARATOR):
+    start = 0
+    while True:
+        end = value.find(separator, start)
+        if end == -1:
+            yield start, len(value)
+            return
+        yield start, end
+        start = end + len(separator)
+
+
+def validate_encoded_blocks(value):
+    """validate_encoded_field for every separator-delimited, independently encrypted block, without splitting"""
+    envelope = get_envelope()
+    if not all(envelope.validate(value, start, end) for start, end in block_spans(value)):
         raise ValidationError('data is corrupted')
     
 def validate_non_empty(value):
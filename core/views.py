@@ -1,3 +1,602 @@
-from django.shortcuts import render
+from functools import wraps
+import json
 
-# Create your views here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, Max
+from django.http import Http404, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.utils.dateparse import parse_date
+from django.views.decorators.http import condition, require_GET, require_POST
+
+from . import cache, changes, metrics, pagination
+from .models import FocusEntry, Folder, FolderDeletion, Note, SyncRecord, TodoList, Task, Timer, TimeRollup
+from .serializers import (
+    FOLDER_FIELDS, NOTE_HEADER_FIELDS, TODO_LIST_FIELDS, TASK_FIELDS,
+    serialize_folder, serialize_folder_deletion, serialize_note, serialize_note_header, serialize_todo_list, serialize_task,
+    serialize_task_tree, serialize_timer,
+)
+
+
+# Django's own view decorators only wrap sync views in this version: the ones below work
+# for both, the async views serve notes, todo lists and tasks without holding a thread while
+# waiting on the database or on a slow client
+
+def api_login_required(view):
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            # request.user is loaded lazily, with a sync query
+            if not await sync_to_async(lambda: request.user.is_authenticated)():
+                return JsonResponse({'detail': 'authentication required'}, status=401)
+            return await view(request, *args, **kwargs)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'detail': 'authentication required'}, status=401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def allow_methods(*methods):
+    """require_http_methods() for async views."""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return HttpResponseNotAllowed(methods)
+            return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def aget_object_or_404(queryset, **filters):
+    try:
+        return await queryset.aget(**filters)
+    except queryset.model.DoesNotExist:
+        raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+
+
+def only_fields(fields):
+    """`only()` takes field names, the serializers use attribute names"""
+    return [field[:-len('_id')] if field.endswith('_id') else field for field in fields]
+
+
+def per_request(func):
+    """condition() asks for the etag and the last modified date separately, look them up once"""
+    attribute = f'_{func.__name__}'
+
+    @wraps(func)
+    def wrapper(request, *args, **kwargs):
+        if not hasattr(request, attribute):
+            setattr(request, attribute, func(request, *args, **kwargs))
+        return getattr(request, attribute)
+    return wrapper
+
+
+def listing_version(folders, notes, todo_lists):
+    """
+    (etag, last modified) of a listing from per-table row counts and latest date_updated:
+    counts catch deletions, dates catch everything else. Three index-friendly aggregates
+    instead of serializing the listing itself.
+    """
+    parts, last_modified = [], None
+    for queryset in [folders, notes, todo_lists]:
+        stats = queryset.order_by().aggregate(count=Count('pk'), last=Max('date_updated'))
+        parts.append(f'{stats["count"]}.{stats["last"].timestamp() if stats["last"] else 0}')
+        if stats['last'] and (last_modified is None or stats['last'] > last_modified):
+            last_modified = stats['last']
+    return '-'.join(parts), last_modified
+
+
+def serialize_folders(folders):
+    return [serialize_folder(folder) for folder in folders.only(*only_fields(FOLDER_FIELDS)).order_by('path')]
+
+
+def serialize_notes(notes):
+    notes = notes.only(*only_fields(NOTE_HEADER_FIELDS)).order_by('-pinned', '-date_updated')
+    return [serialize_note_header(note) for note in notes]
+
+
+def serialize_todo_lists(todo_lists):
+    todo_lists = todo_lists.only(*only_fields(TODO_LIST_FIELDS)).order_by('due_date', 'pk')
+    return [serialize_todo_list(todo_list) for todo_list in todo_lists]
+
+
+def serialize_listing(folders, notes, todo_lists):
+    return {
+        'folders': serialize_folders(folders),
+        'notes': serialize_notes(notes),
+        'todo_lists': serialize_todo_lists(todo_lists),
+    }
+
+
+def workspace_querysets(request):
+    return (
+        Folder.objects.filter(account=request.user),
+        Note.objects.filter(folder__account=request.user),
+        TodoList.objects.for_account(request.user),
+    )
+
+
+def folder_querysets(request, pk):
+    folder = get_object_or_404(Folder.objects.only('path'), pk=pk, account=request.user)
+    folders = Folder.objects.descendants_of(folder, include_self=True)
+    return folders, Note.objects.filter(folder__in=folders), TodoList.objects.filter(folder__in=folders)
+
+
+@per_request
+def workspace_version(request):
+    return listing_version(*workspace_querysets(request))
+
+
+@per_request
+def folder_version(request, pk):
+    return listing_version(*folder_querysets(request, pk))
+
+
+def object_version(pk, date_updated):
+    return (f'{pk}.{date_updated.timestamp()}', date_updated) if date_updated else (None, None)
+
+
+async def note_version(request, pk):
+    # date_updated only: answering a conditional request never reads the encrypted content
+    date_updated = await Note.objects.filter(pk=pk, folder__account=request.user).values_list('date_updated', flat=True).afirst()
+    return object_version(pk, date_updated)
+
+
+async def todo_list_version(request, pk):
+    # date_updated is bumped by every write to the list's tasks as well
+    date_updated = await TodoList.objects.filter(pk=pk, folder__account=request.user).values_list('date_updated', flat=True).afirst()
+    return object_version(pk, date_updated)
+
+
+def conditional(version_func):
+    """condition() from a single (etag, last modified) lookup; async views take an async `version_func`."""
+    def decorator(view):
+        if not iscoroutinefunction(view):
+            return condition(
+                etag_func=lambda request, *args, **kwargs: version_func(request, *args, **kwargs)[0],
+                last_modified_func=lambda request, *args, **kwargs: version_func(request, *args, **kwargs)[1],
+            )(view)
+
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            etag, last_modified = await version_func(request, *args, **kwargs)
+            etag = quote_etag(etag) if etag is not None else None
+            last_modified = int(last_modified.timestamp()) if last_modified else None
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            # same headers as condition() sets
+            if request.method in ('GET', 'HEAD'):
+                if last_modified and not response.has_header('Last-Modified'):
+                    response.headers['Last-Modified'] = http_date(last_modified)
+                if etag:
+                    response.headers.setdefault('ETag', etag)
+            return response
+        return wrapper
+    return decorator
+
+
+@require_GET
+@api_login_required
+@conditional(workspace_version)
+def workspace(request):
+    """
+    The account's whole workspace in three queries: folder tree, note headers
+    (without the encrypted content) and todo lists with their task counters.
+    Conditional requests are answered from three aggregates instead, and each
+    section is served from the workspace cache until a write invalidates it.
+    """
+    folders, notes, todo_lists = workspace_querysets(request)
+    return JsonResponse(cache.get_sections(request.user.pk, {
+        'folders': lambda: serialize_folders(folders),
+        'notes': lambda: serialize_notes(notes),
+        'todo_lists': lambda: serialize_todo_lists(todo_lists),
+    }))
+
+
+@require_GET
+@api_login_required
+@conditional(folder_version)
+def folder_detail(request, pk):
+    """Same shape as the workspace, limited to a folder's subtree."""
+    return JsonResponse(serialize_listing(*folder_querysets(request, pk)))
+
+
+@require_POST
+@api_login_required
+def folder_delete(request, pk):
+    """
+    Schedules the deletion of a folder and everything in it, carried out in batches by the
+    delete_folders worker; poll the returned deletion for progress.
+    """
+    folder = get_object_or_404(Folder.objects.only('pk'), pk=pk, account=request.user)
+    deletion = FolderDeletion.objects.pending().filter(folder=folder).first()
+    if deletion is None:
+        deletion = FolderDeletion.objects.create(account=request.user, folder=folder)
+    return JsonResponse(serialize_folder_deletion(deletion), status=202)
+
+
+@require_GET
+@api_login_required
+def folder_deletion(request, pk):
+    deletion = get_object_or_404(FolderDeletion, pk=pk, account=request.user)
+    return JsonResponse(serialize_folder_deletion(deletion))
+
+
+def parse_note_upload(request):
+    """
+    {"name": <ciphertext>, "content": <ciphertext>, "pinned": bool, "tasks": [<task id>, ...]}:
+    "pinned" and "tasks" are optional. Raises ValueError on anything else.
+    """
+    try:
+        upload = json.loads(request.body)
+        fields = {'name': upload['name'], 'content': upload['content']}
+        if 'pinned' in upload:
+            fields['pinned'] = upload['pinned']
+        task_ids = None if upload.get('tasks') is None else [int(task_id) for task_id in upload['tasks']]
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise ValueError
+    if not all(isinstance(fields[name], str) for name in ('name', 'content')) or not isinstance(fields.get('pinned', False), bool):
+        raise ValueError
+    return fields, task_ids
+
+
+NOTE_UPLOAD_ERROR = 'expected {"name": ciphertext, "content": ciphertext, "pinned": bool, "tasks": [task id]}'
+
+
+def note_written(note, status=200):
+    response = JsonResponse(serialize_note_header(note), status=status)
+    response['ETag'] = quote_etag(object_version(note.pk, note.date_updated)[0])
+    return response
+
+
+@allow_methods('GET', 'PUT')
+@api_login_required
+@conditional(note_version)
+async def note_detail(request, pk):
+    """
+    PUT uploads the note's whole content (see parse_note_upload()), replacing the blocks of a
+    chunked note; send If-Match with the note's ETag to refuse lost updates.
+    """
+    if request.method == 'GET':
+        note = await aget_object_or_404(Note.objects.all(), pk=pk, folder__account=request.user)
+        await note.aload_content()
+        return JsonResponse(serialize_note(note))
+
+    try:
+        fields, task_ids = parse_note_upload(request)
+    except ValueError:
+        return JsonResponse({'detail': NOTE_UPLOAD_ERROR}, status=400)
+
+    # transactions are sync-only, the whole write runs in a thread
+    @sync_to_async
+    def upload():
+        with transaction.atomic(), SyncRecord.objects.deferred():
+            note = get_object_or_404(Note.objects.select_for_update(), pk=pk, folder__account=request.user)
+            for name, value in fields.items():
+                setattr(note, name, value)
+            chunked, note.chunked = note.chunked, False
+            note.save()
+            if chunked:
+                note.blocks.all().delete()
+            if task_ids is not None:
+                Task.objects.link_note(note, task_ids)
+            return note
+
+    try:
+        note = await upload()
+    except ValidationError as e:
+        return JsonResponse(e.message_dict, status=400)
+    return note_written(note)
+
+
+@allow_methods('PATCH')
+@api_login_required
+@conditional(note_version)
+async def note_blocks(request, pk):
+    """
+    Autosave of a chunked note: {"length": <block count>, "blocks": {"<index>": "<ciphertext>", ...}}
+    carries only the blocks that changed. Send If-Match with the note's ETag to refuse lost updates.
+    An optional "tasks": [<task id>, ...] lists the ==task_id== markers of the content in order,
+    and the note's task links follow it in the same transaction.
+    """
+    try:
+        patch = json.loads(request.body)
+        length = int(patch['length'])
+        blocks = {int(index): content for index, content in patch.get('blocks', {}).items()}
+        task_ids = None if patch.get('tasks') is None else [int(task_id) for task_id in patch['tasks']]
+        if length < 0 or not all(isinstance(content, str) for content in blocks.values()):
+            raise ValueError
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return JsonResponse(
+            {'detail': 'expected {"length": int, "blocks": {index: ciphertext}, "tasks": [task id]}'}, status=400,
+        )
+
+    # transactions are sync-only, the whole write runs in a thread
+    @sync_to_async
+    def apply_patch():
+        # the note's sync record waits for the task rows, see SyncRecordQuerySet.deferred()
+        with transaction.atomic(), SyncRecord.objects.deferred():
+            note = get_object_or_404(Note.objects.select_for_update(), pk=pk, folder__account=request.user)
+            # every new block has to be in the patch: a longer note can't be valid, and
+            # checking it here keeps the per-block errors to the size of the request
+            if length > note.block_count() + len(blocks):
+                raise ValidationError({'length': ["more blocks than the note and the patch hold"]})
+            note.apply_block_patch(length, blocks)
+            if task_ids is not None:
+                Task.objects.link_note(note, task_ids)
+            return note
+
+    try:
+        note = await apply_patch()
+    except ValidationError as e:
+        errors = e.message_dict
+        return JsonResponse(errors if errors.keys() & {'length', 'tasks'} else {'blocks': errors}, status=400)
+
+    response = JsonResponse({'id': note.pk, 'length': length, 'date_updated': note.date_updated})
+    response['ETag'] = quote_etag(object_version(note.pk, note.date_updated)[0])
+    return response
+
+
+@allow_methods('GET')
+@api_login_required
+@conditional(todo_list_version)
+async def todo_list_detail(request, pk):
+    todo_list = await aget_object_or_404(TodoList.objects.only(*only_fields(TODO_LIST_FIELDS)), pk=pk, folder__account=request.user)
+    # raw querysets can't be iterated asynchronously
+    tasks = await sync_to_async(Task.objects.tree_for)(todo_list)
+    return JsonResponse({
+        **serialize_todo_list(todo_list),
+        'tasks': [serialize_task_tree(task) for task in tasks],
+    })
+
+
+@allow_methods('GET')
+@api_login_required
+async def note_tasks(request, pk):
+    """A note's tasks in the order of their markers: one range scan of task_note_position_idx."""
+    note = await aget_object_or_404(Note.objects.only('pk'), pk=pk, folder__account=request.user)
+    tasks = Task.objects.linked_to(note).only(*only_fields(TASK_FIELDS))
+    return JsonResponse({'tasks': [serialize_task(task) async for task in tasks]})
+
+
+async def page(request, queryset, ordering):
+    """(rows, next cursor) of a listing for ?cursor=<next cursor>&limit=<rows>; ValueError says what's malformed"""
+    try:
+        limit = min(int(request.GET.get('limit', pagination.PAGE_LIMIT)), pagination.PAGE_MAX_LIMIT)
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    return await pagination.apaginate(queryset, ordering, request.GET.get('cursor'), max(limit, 1))
+
+
+@allow_methods('GET', 'POST')
+@api_login_required
+async def folder_notes(request, pk):
+    """
+    A folder's note headers, pinned first then most recently edited, a page at a time:
+    every page is one range scan of note_listing_idx, however deep it is.
+    POST creates a note in the folder from the same body as a note upload, see note_detail.
+    """
+    folder = await aget_object_or_404(Folder.objects.only('pk'), pk=pk, account=request.user)
+    if request.method == 'POST':
+        return await create_note(request, folder)
+    notes = Note.objects.filter(folder=folder).only(*only_fields(NOTE_HEADER_FIELDS))
+    try:
+        notes, cursor = await page(request, notes, Note.LISTING_ORDERING)
+    except ValueError as error:
+        return JsonResponse({'detail': str(error)}, status=400)
+    return JsonResponse({'notes': [serialize_note_header(note) for note in notes], 'next': cursor})
+
+
+async def create_note(request, folder):
+    try:
+        fields, task_ids = parse_note_upload(request)
+    except ValueError:
+        return JsonResponse({'detail': NOTE_UPLOAD_ERROR}, status=400)
+
+    @sync_to_async
+    def create():
+        with transaction.atomic(), SyncRecord.objects.deferred():
+            note = Note(folder=folder, **fields)
+            note.save()
+            if task_ids is not None:
+                Task.objects.link_note(note, task_ids)
+            return note
+
+    try:
+        note = await create()
+    except ValidationError as e:
+        return JsonResponse(e.message_dict, status=400)
+    return note_written(note, status=201)
+
+
+@allow_methods('GET')
+@api_login_required
+async def todo_list_tasks(request, pk):
+    """A todo list's tasks, by priority then due date, a page at a time (see folder_notes)."""
+    todo_list = await aget_object_or_404(TodoList.objects.only('pk'), pk=pk, folder__account=request.user)
+    tasks = Task.objects.listing(todo_list).only(*only_fields(TASK_FIELDS))
+    try:
+        tasks, cursor = await page(request, tasks, Task.LISTING_ORDERING)
+    except ValueError as error:
+        return JsonResponse({'detail': str(error)}, status=400)
+    return JsonResponse({'tasks': [serialize_task(task) for task in tasks], 'next': cursor})
+
+
+@allow_methods('GET')
+@api_login_required
+async def change_feed(request):
+    """
+    Server-sent events of the account's changes (see core.changes): each `changes` event is a
+    list of {"model", "id", "date_updated", "deleted"} to refetch or drop. Streams for
+    CHANGE_FEED_TIMEOUT seconds, then EventSource reconnects. Serve it over ASGI: under WSGI
+    every open tab would hold a worker thread.
+    """
+    response = StreamingHttpResponse(changes.events(request.user.pk), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx would buffer the stream otherwise
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+SYNC_LIMIT = 1000
+SYNC_MAX_LIMIT = 5000
+
+# model label: response section, the account's rows, serialized fields, serializer
+SYNCED = {
+    'folder': ('folders', lambda account: Folder.objects.filter(account=account), FOLDER_FIELDS, serialize_folder),
+    'note': ('notes', lambda account: Note.objects.filter(folder__account=account), NOTE_HEADER_FIELDS, serialize_note_header),
+    'todo_list': ('todo_lists', TodoList.objects.for_account, TODO_LIST_FIELDS, serialize_todo_list),
+    'task': ('tasks', Task.objects.for_account, TASK_FIELDS, serialize_task),
+}
+
+
+@require_GET
+@api_login_required
+def sync_changes(request):
+    """
+    What changed since ?since=<token> (0 for everything): the changed folders, note headers,
+    todo lists and tasks, and the ids of the deleted ones in `deleted`, ?limit= changes at
+    a time. Pass `token` back as `since`, right away while `more` is true. Deleting a folder
+    or todo list deletes its contents too; they're only reported when their records are
+    reached. The tasks deleted with a note or a parent task get records of their own.
+    """
+    try:
+        since = int(request.GET.get('since', 0))
+        limit = max(min(int(request.GET.get('limit', SYNC_LIMIT)), SYNC_MAX_LIMIT), 1)
+    except ValueError:
+        return JsonResponse({'detail': 'since and limit must be integers'}, status=400)
+
+    # one extra record tells whether there's more
+    records = list(SyncRecord.objects.since(request.user, since).values_list('model', 'object_id', 'deleted', 'sequence')[:limit + 1])
+    more = len(records) > limit
+    records = records[:limit]
+
+    changed, deleted = {}, {section: [] for section, _, _, _ in SYNCED.values()}
+    for label, object_id, is_deleted, _ in records:
+        if is_deleted:
+            deleted[SYNCED[label][0]].append(object_id)
+        else:
+            changed.setdefault(label, []).append(object_id)
+
+    response = {section: [] for section, _, _, _ in SYNCED.values()}
+    for label, ids in changed.items():
+        section, rows, fields, serializer = SYNCED[label]
+        found = [serializer(obj) for obj in rows(request.user).filter(pk__in=ids).only(*only_fields(fields)).order_by('pk')]
+        response[section] = found
+        # rows gone without a record of their own went with a deleted folder, note or list
+        deleted[section] += sorted(set(ids) - {row['id'] for row in found})
+
+    return JsonResponse({
+        **response,
+        'deleted': deleted,
+        'token': str(records[-1][3] if records else since),
+        'more': more,
+    })
+
+
+FOCUS_LIMIT = 50
+FOCUS_MAX_LIMIT = 200
+
+
+@require_GET
+@api_login_required
+def focus(request):
+    """
+    Today's most urgent open tasks, read from the materialized ranking: one indexed
+    range scan (joined to the tasks) however many tasks the account has.
+    """
+    try:
+        limit = min(int(request.GET.get('limit', FOCUS_LIMIT)), FOCUS_MAX_LIMIT)
+    except ValueError:
+        return JsonResponse({'detail': 'limit must be an integer'}, status=400)
+
+    entries = (
+        FocusEntry.objects.for_account(request.user)
+        .select_related('task')
+        .only('score', *[f'task__{field}' for field in only_fields(TASK_FIELDS)])[:max(limit, 0)]
+    )
+    return JsonResponse({'tasks': [{**serialize_task(entry.task), 'score': entry.score} for entry in entries]})
+
+
+@require_POST
+@api_login_required
+def timer_start(request, pk):
+    task = get_object_or_404(Task.objects.only('pk'), pk=pk, todo_list__folder__account=request.user)
+    try:
+        timer = Timer.objects.start(task, request.user)
+    except ValidationError as e:
+        return JsonResponse({'detail': e.messages}, status=409)
+    return JsonResponse(serialize_timer(timer), status=201)
+
+
+@require_POST
+@api_login_required
+def timer_stop(request, pk):
+    task = get_object_or_404(Task.objects.only('pk'), pk=pk, todo_list__folder__account=request.user)
+    timer = Timer.objects.stop(task)
+    if timer is None:
+        return JsonResponse({'detail': 'the task has no running timer'}, status=409)
+    return JsonResponse({**serialize_timer(timer), 'duration': timer.duration()})
+
+
+@require_GET
+@api_login_required
+def running_timers(request):
+    timers = Timer.objects.running().filter(account=request.user).order_by('date_started')
+    return JsonResponse({'timers': [serialize_timer(timer) for timer in timers]})
+
+
+def date_bounds(request):
+    """?since=YYYY-MM-DD&until=YYYY-MM-DD (exclusive), both optional; ValueError names a malformed one"""
+    bounds = {}
+    for bound in ['since', 'until']:
+        if bound in request.GET:
+            try:
+                bounds[bound] = parse_date(request.GET[bound])
+            except ValueError:
+                bounds[bound] = None
+            if bounds[bound] is None:
+                raise ValueError(f'{bound} must be a date formatted as YYYY-MM-DD')
+    return bounds
+
+
+@require_GET
+@api_login_required
+def time_spent(request):
+    """Performance tab totals, summed from the daily rollups: ?since=YYYY-MM-DD&until=YYYY-MM-DD (exclusive)."""
+    try:
+        bounds = date_bounds(request)
+    except ValueError as error:
+        return JsonResponse({'detail': str(error)}, status=400)
+
+    rollups = TimeRollup.objects.for_account(request.user, **bounds)
+    return JsonResponse({
+        'days': list(rollups.per_day()),
+        'todo_lists': [
+            {'todo_list_id': row['todo_list'], 'seconds': row['seconds']} for row in rollups.per_todo_list()
+        ],
+    })
+
+
+@require_GET
+@api_login_required
+def performance(request):
+    """Performance tab metrics: ?bucket=day|week|month&since=YYYY-MM-DD&until=YYYY-MM-DD (exclusive)."""
+    bucket = request.GET.get('bucket', 'day')
+    if bucket not in metrics.BUCKETS:
+        return JsonResponse({'detail': f'bucket must be one of {", ".join(metrics.BUCKETS)}'}, status=400)
+    try:
+        bounds = date_bounds(request)
+    except ValueError as error:
+        return JsonResponse({'detail': str(error)}, status=400)
+
+    return JsonResponse({'bucket': bucket, 'metrics': metrics.performance(request.user, bucket, **bounds)})
@@ -0,0 +1,22 @@
+# production server: gunicorn -c gunicorn.conf.py (settings in brainstorm/settings/prod.py)
+# WEB_INTERFACE=asgi serves brainstorm.asgi through uvicorn workers instead, where the async
+# views wait on slow clients and on the database without holding a thread
+import os
+
+interface = os.environ.get('WEB_INTERFACE', 'wsgi')
+if interface == 'asgi':
+    wsgi_app = 'brainstorm.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'brainstorm.wsgi:application'
+    worker_class = 'gthread'
+    # each thread holds one persistent database connection: prod.py checks the total
+    # against DB_MAX_CONNECTIONS, keep the defaults in sync with it
+    threads = int(os.environ.get('WEB_THREADS', 4))
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+# recycles a worker now and then, its connections get reopened by the replacement
+max_requests = 10000
+max_requests_jitter = 1000
+raw_env = [f"DJANGO_SETTINGS_MODULE={os.environ.get('DJANGO_SETTINGS_MODULE', 'brainstorm.settings.prod')}"]